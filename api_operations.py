@@ -0,0 +1,571 @@
+# %%
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# %%
+# Cache used to make conditional requests to the API
+
+
+class PageCache:
+
+    """
+    On-disk cache of API pages, holding each page's body alongside its ETag and
+    Last-Modified headers so that later requests for the page can be made
+    conditional
+
+    Also counts how many pages came back changed and unchanged during the run,
+    so that callers can tell whether anything has changed since the last run.
+    Changed pages are held as pending until commit() is called once the output
+    has been saved, so that a failed run doesn't hide its changes from the next
+
+
+    Parameters
+        - directory: The directory to hold the cached pages
+
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.changed = 0
+        self.unchanged = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+    def get(self, url: str) -> Optional[dict]:
+
+        """
+        Return the cached entry for a URL - a dict of 'etag', 'last_modified' and
+        'body' - or None if the URL hasn't been cached
+
+        Parameters
+            - url: The URL of the page
+
+        """
+
+        try:
+            with open(self._path(url)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(
+            self,
+            url: str,
+            etag: Optional[str],
+            last_modified: Optional[str],
+            body: str,
+            pending: bool = False
+            ) -> None:
+
+        """
+        Cache a page
+
+        Parameters
+            - url: The URL of the page
+            - etag: The page's ETag header, if any
+            - last_modified: The page's Last-Modified header, if any
+            - body: The raw response body
+            - pending: Whether to hold the page back until commit() is called
+
+        """
+
+        path = self._path(url) + (".pending" if pending else "")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"etag": etag, "last_modified": last_modified, "body": body}, f)
+        os.replace(tmp_path, path)
+
+    def commit(self) -> None:
+
+        """
+        Promote any pending pages, including those left by earlier failed runs,
+        to the cache proper
+        """
+
+        for name in os.listdir(self.directory):
+            if name.endswith(".pending"):
+                path = os.path.join(self.directory, name)
+                os.replace(path, path[:-len(".pending")])
+
+    def has_pending(self) -> bool:
+
+        """
+        Whether there are changed pages that haven't yet been committed
+        """
+
+        return any(name.endswith(".pending") for name in os.listdir(self.directory))
+
+    def conditional_headers(self, url: str) -> dict:
+
+        """
+        Return the If-None-Match/If-Modified-Since headers to send for a URL
+
+        Parameters
+            - url: The URL of the page
+
+        """
+
+        entry = self.get(url)
+        if entry is None:
+            return {}
+
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        return headers
+
+    def record(self, changed: bool) -> None:
+
+        """
+        Count a page as changed or unchanged
+
+        Parameters
+            - changed: Whether the page differed from the cached copy
+
+        """
+
+        with self._lock:
+            if changed:
+                self.changed += 1
+            else:
+                self.unchanged += 1
+
+    def all_unchanged(self) -> bool:
+
+        """
+        Whether every page requested so far matched the cached copy, with no
+        changes pending from an earlier failed run
+        """
+
+        return self.unchanged > 0 and self.changed == 0 and not self.has_pending()
+
+
+# %%
+# Functions to be used for calling the GOV.UK organisations API
+
+
+def create_session(max_workers: int = 8) -> requests.Session:
+
+    """
+    Create a requests Session whose connection pool is large enough to keep one
+    keep-alive connection open per worker
+
+    Parameters
+        - max_workers: The number of threads that will share the session
+
+    """
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def fetch_page(
+        session: requests.Session,
+        url_stub: str,
+        page_number: int,
+        headers: dict,
+        max_retries: int = 5,
+        cache: Optional[PageCache] = None
+        ) -> Optional[dict]:
+
+    """
+    Fetch a single page of the API, retrying on 503s and connection errors
+
+    If a cache is supplied, the request is made conditional on the cached copy
+    having changed, and the cached copy is used if the API returns a 304
+
+    Returns the decoded JSON response, or None if the page could not be retrieved
+
+    Parameters
+        - session: The requests Session to send the request through
+        - url_stub: The API URL, up to and including 'page='
+        - page_number: The page to fetch
+        - headers: Headers to send with the request
+        - max_retries: The number of attempts to make before giving up
+        - cache: The PageCache to read from and write to, if any
+
+    """
+
+    url = url_stub + str(page_number)
+
+    if cache is not None:
+        headers = {**headers, **cache.conditional_headers(url)}
+
+    with metrics.track("fetch_page", page=page_number) as metric:
+        data = _fetch_page(session, url, page_number, headers, max_retries, cache, metric)
+
+        if data is None:
+            metric["status"] = "failed"
+        else:
+            metric["rows_out"] = len(data.get("results", []))
+
+    return data
+
+
+def _fetch_page(
+        session: requests.Session,
+        url: str,
+        page_number: int,
+        headers: dict,
+        max_retries: int,
+        cache: Optional[PageCache],
+        metric: dict
+        ) -> Optional[dict]:
+
+    """
+    Make the requests for fetch_page(), counting retries in metric
+    """
+
+    for attempt in range(max_retries):
+        metric["retries"] = attempt
+
+        try:
+            r = session.get(url, headers=headers, timeout=30)
+
+            if r.status_code == 304 and cache is not None:
+                entry = cache.get(url)
+                if entry is not None:
+                    cache.record(changed=False)
+                    metric["labels"]["not_modified"] = True
+                    with metrics.track("parse_page", page=page_number):
+                        return json.loads(entry["body"])
+
+            if not r.ok:
+                if r.status_code == 503:
+                    print(f"Warning: API temporarily unavailable (503) for page {page_number}. Attempt {attempt + 1}/{max_retries}")
+                    if attempt < max_retries - 1:
+                        time.sleep(5 * (attempt + 1))
+                        continue
+                    else:
+                        print(f"Error: Failed after {max_retries} attempts. Stopping at page {page_number}")
+                        return None
+                else:
+                    print(f"Error: API returned status code {r.status_code} for page {page_number}")
+                    print(f"Response content: {r.text[:500]}")
+                    return None
+
+            try:
+                with metrics.track("parse_page", page=page_number):
+                    data = r.json()
+            except requests.JSONDecodeError as e:
+                print(f"Error: Unable to parse JSON from page {page_number}")
+                print(f"Status code: {r.status_code}")
+                print(f"Response content: {r.text[:500]}")
+                print(f"JSON decode error: {e}")
+                return None
+
+            if cache is not None:
+                # Compare bodies too, in case the API doesn't honour conditional requests
+                entry = cache.get(url)
+                changed = entry is None or entry["body"] != r.text
+                cache.record(changed)
+                cache.put(url, r.headers.get("ETag"), r.headers.get("Last-Modified"), r.text, pending=changed)
+
+            return data
+
+        except requests.exceptions.RequestException as e:
+            print(f"Error: Request failed for page {page_number}. Attempt {attempt + 1}/{max_retries}")
+            print(f"Error details: {e}")
+            if attempt < max_retries - 1:
+                time.sleep(5 * (attempt + 1))
+            else:
+                print(f"Failed after {max_retries} attempts. Stopping at page {page_number}")
+                return None
+
+    return None
+
+
+class IncompleteRetrievalError(Exception):
+    """Raised when a page of the API could not be retrieved"""
+
+
+def _page_results(data: dict, page_number: int) -> list:
+
+    """
+    Return the records held in a page of the API, warning if there are none
+
+    Parameters
+        - data: The decoded JSON response for the page
+        - page_number: The page in question
+
+    """
+
+    if "results" not in data:
+        print(f"Warning: No 'results' key found in response for page {page_number}")
+
+    return data.get("results", [])
+
+
+def write_records(
+        pages: Iterable[tuple],
+        path: str,
+        ndjson: bool = False,
+        cache: Optional[PageCache] = None
+        ) -> int:
+
+    """
+    Stream records into a file, one page at a time
+
+    By default the output is a JSON array, identical to json.dump() of the full
+    list of records. With ndjson=True, one record is written per line instead.
+    Output goes to a temporary file which only replaces path once every page
+    has been written, so a failed or empty run leaves any existing file untouched.
+    If a cache is supplied and every page matched its cached copy, the existing
+    file is left untouched too
+
+    Returns the number of records written
+
+    Parameters
+        - pages: Iterable of (page_number, records) in page order, as yielded by
+          CheckpointStore.iter_pages()
+        - path: The file to write to
+        - ndjson: Whether to write newline-delimited JSON rather than a JSON array
+        - cache: The PageCache that pages were fetched through, if any
+
+    """
+
+    record_count = 0
+    tmp_path = path + ".tmp"
+
+    try:
+        with open(tmp_path, "w") as f:
+            if not ndjson:
+                f.write("[")
+
+            for page_number, records in pages:
+                for record in records:
+                    if ndjson:
+                        f.write(json.dumps(record) + "\n")
+                    else:
+                        f.write((", " if record_count else "") + json.dumps(record))
+                    record_count += 1
+
+                print(f"Wrote page {page_number}: {len(records)} organisations (total: {record_count})")
+
+            if not ndjson:
+                f.write("]")
+
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    if record_count and not (cache is not None and cache.all_unchanged() and os.path.exists(path)):
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+
+    if record_count and cache is not None:
+        cache.commit()
+
+    return record_count
+
+
+# %%
+# Checkpoints used to resume an interrupted extraction
+
+
+class CheckpointStore:
+
+    """
+    Scratch directory holding one file per retrieved page of the API, plus a
+    manifest recording the page count, so that a failed extraction can be
+    resumed from the pages that are still missing
+
+    Checkpoints older than max_age seconds are discarded, so that pages from a
+    stale run aren't mixed with fresh ones. max_age should be well under the
+    interval between scheduled runs, so that a run starting a little early
+    doesn't resume from the previous run's pages
+
+    Parameters
+        - directory: The directory to hold the checkpoints
+        - max_age: The age in seconds after which existing checkpoints are discarded
+
+    """
+
+    def __init__(self, directory: str, max_age: Optional[float] = 12 * 60 * 60):
+        self.directory = directory
+
+        os.makedirs(directory, exist_ok=True)
+
+        manifest = self.manifest()
+        if manifest and max_age is not None and time.time() - manifest["started_at"] > max_age:
+            self.clear()
+
+    def _page_path(self, page_number: int) -> str:
+        return os.path.join(self.directory, f"page_{page_number:05d}.json")
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    def manifest(self) -> Optional[dict]:
+
+        """
+        Return the manifest - a dict of 'pages' and 'started_at' - or None if
+        no extraction is in progress
+        """
+
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def start(self, page_count: int) -> None:
+
+        """
+        Record the page count of a new extraction
+
+        Parameters
+            - page_count: The number of pages reported by the API
+
+        """
+
+        with open(self._manifest_path(), "w") as f:
+            json.dump({"pages": page_count, "started_at": time.time()}, f)
+
+    def save(self, page_number: int, records: list) -> None:
+
+        """
+        Checkpoint a page's records
+
+        Parameters
+            - page_number: The page in question
+            - records: The records held in the page
+
+        """
+
+        tmp_path = self._page_path(page_number) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(records, f)
+        os.replace(tmp_path, self._page_path(page_number))
+
+    def missing_pages(self) -> list:
+
+        """
+        Return the pages that haven't yet been checkpointed
+        """
+
+        manifest = self.manifest()
+        if manifest is None:
+            return []
+
+        return [
+            page_number for page_number in range(1, manifest["pages"] + 1)
+            if not os.path.exists(self._page_path(page_number))
+        ]
+
+    def iter_pages(self) -> Iterator[tuple]:
+
+        """
+        Yield (page_number, records) for every checkpointed page, in page order
+        """
+
+        manifest = self.manifest()
+        if manifest is None:
+            return
+
+        for page_number in range(1, manifest["pages"] + 1):
+            with open(self._page_path(page_number)) as f:
+                yield page_number, json.load(f)
+
+    def clear(self) -> None:
+
+        """
+        Remove every checkpoint and the manifest
+        """
+
+        for name in os.listdir(self.directory):
+            if name.startswith("page_") or name == "manifest.json":
+                os.remove(os.path.join(self.directory, name))
+
+
+def fetch_to_checkpoints(
+        url_stub: str,
+        headers: dict,
+        checkpoints: CheckpointStore,
+        max_workers: int = 8,
+        max_retries: int = 5,
+        cache: Optional[PageCache] = None
+        ) -> None:
+
+    """
+    Fetch every page of the API that hasn't already been checkpointed, saving
+    each page as soon as it arrives
+
+    Pages that fail don't stop the others from being fetched, so a rerun only
+    has to retrieve the pages that failed this time
+
+    Raises IncompleteRetrievalError if any page could not be retrieved
+
+    Parameters
+        - url_stub: The API URL, up to and including 'page='
+        - headers: Headers to send with the request
+        - checkpoints: The CheckpointStore to save pages to
+        - max_workers: The maximum number of pages to fetch at once
+        - max_retries: The number of attempts to make per page before giving up
+        - cache: The PageCache to make conditional requests against, if any
+
+    """
+
+    with create_session(max_workers) as session:
+        resuming = checkpoints.manifest() is not None
+
+        if not resuming:
+            first_page = fetch_page(session, url_stub, 1, headers, max_retries, cache)
+
+            if first_page is None:
+                raise IncompleteRetrievalError("Failed to retrieve page 1")
+
+            checkpoints.start(first_page.get("pages", 1))
+            checkpoints.save(1, _page_results(first_page, 1))
+
+        missing_pages = checkpoints.missing_pages()
+        page_count = checkpoints.manifest()["pages"]
+        failed_pages = []
+
+        if resuming:
+            print(f"Resuming: {page_count - len(missing_pages)} of {page_count} pages already checkpointed")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(fetch_page, session, url_stub, page_number, headers, max_retries, cache): page_number
+                for page_number in missing_pages
+            }
+
+            for future in as_completed(futures):
+                page_number = futures[future]
+                data = future.result()
+
+                if data is None:
+                    failed_pages.append(page_number)
+                    continue
+
+                records = _page_results(data, page_number)
+                checkpoints.save(page_number, records)
+                print(f"Checkpointed page {page_number} of {page_count}: {len(records)} organisations")
+
+    if failed_pages:
+        raise IncompleteRetrievalError(
+            f"Failed to retrieve {len(failed_pages)} of {page_count} pages: {sorted(failed_pages)}"
+        )
@@ -0,0 +1,65 @@
+# %%
+"""
+    Purpose
+        Benchmark normalise.load_organisations() against the read_json +
+        apply(pd.Series) approach it replaced
+    Inputs
+        - JSON: organisations.json
+    Outputs
+        - None
+    Parameters
+        - repeats: Number of times to time each approach
+    Notes
+        - Run from the repo root: python -m benchmarks.bench_normalise
+"""
+
+import os
+import tempfile
+import timeit
+
+import pandas as pd
+
+import normalise
+
+# %%
+# SET VARIABLES
+path = "organisations.json"
+repeats = 5
+
+
+# %%
+# Define approaches
+def read_json_apply_series():
+    df = pd.read_json(path)
+    return pd.concat([df.drop(columns=["details"]), df["details"].apply(pd.Series)], axis=1)
+
+
+def json_normalize():
+    return normalise.load_organisations(path)
+
+
+cache_path = os.path.join(tempfile.mkdtemp(), "organisations.parquet")
+
+
+def parquet_cache():
+    return normalise.load_organisations(path, cache_path=cache_path)
+
+
+# %%
+# Time approaches
+approaches = {
+    "read_json + apply(pd.Series)": read_json_apply_series,
+    "json_normalize": json_normalize,
+}
+if normalise.pyarrow is not None:
+    parquet_cache()
+    approaches["json_normalize, cached as Parquet"] = parquet_cache
+
+results = {
+    name: min(timeit.repeat(func, number=1, repeat=repeats))
+    for name, func in approaches.items()
+}
+
+baseline = results["read_json + apply(pd.Series)"]
+for name, seconds in results.items():
+    print(f"{name:<40} {seconds * 1000:8.1f} ms  ({baseline / seconds:5.1f}x)")
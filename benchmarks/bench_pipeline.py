@@ -0,0 +1,396 @@
+# %%
+"""
+    Purpose
+        Benchmark each stage of the pipeline on synthetic organisations data at a
+        range of scales, and save or compare against baselines
+    Inputs
+        - JSON: A baseline in benchmarks/baselines, with --compare
+    Outputs
+        - JSON: A baseline in benchmarks/baselines, with --save
+    Parameters
+        - scales: Numbers of records relative to the real data, see synthetic.py
+        - repeats: Number of times to time each stage. The fastest time is kept
+        - snapshots: Number of daily snapshots for the stages working on history
+        - threshold: Slowdown relative to the baseline reported as a regression
+    Notes
+        - Run from the repo root:
+            python -m benchmarks.bench_pipeline --save main
+            python -m benchmarks.bench_pipeline --compare main
+            python -m benchmarks.bench_pipeline --scales 1 10 100 1000 --repeats 1
+        - With --compare, exits with status 1 if any stage is slower than its baseline
+          by more than the threshold. Stages taking under MIN_SECONDS in the baseline
+          aren't compared, as their timings are mostly noise
+        - Baselines are only comparable when taken on the same machine, with the same
+          number of snapshots
+        - The database stages (bulk_to_sql, upsert_table, replace_rows) write to SQLite
+          files in a temporary directory, so time the SQL and pandas side of the loaders
+          rather than a round trip to SQL Server
+        - The history stages hold every snapshot's rows in memory, so at scale 1000 use
+          fewer snapshots, e.g. --snapshots 2
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Date, create_engine
+
+import binary_snapshot
+import matching
+import normalise
+import org_graph
+import rules
+import scd
+import snapshot_diff
+from snapshot_store import SnapshotStore
+import sql_operations
+import synthetic
+import utils
+
+# %%
+# SET VARIABLES
+scales = [1, 10, 100]
+repeats = 3
+snapshots = 10
+threshold = 1.25
+seed = 0
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+MIN_SECONDS = 0.005
+
+prefix = "https://www.gov.uk/api/organisations/"
+
+ORGS_DTYPE = {"start_date": Date, "end_date": Date}
+
+
+# %%
+# Define stages, each as (setup, run): setup() returns the argument passed to run(),
+# and isn't timed
+
+
+def explode_links(df):
+    df = df[["analytics_identifier", "slug", "child_organisations"]].copy()
+    df.insert(0, "id", df["analytics_identifier"].map(utils.org_uuid))
+
+    df_sponsor = utils.explode_list_of_dicts(df, "child_organisations", "id")
+    df_sponsor = utils.remove_prefix_exploded(df_sponsor, "child_organisations", prefix)
+
+    return utils.match_and_replace_exploded(df, df_sponsor, "child_organisations", "slug", "id")
+
+
+def history_first_last(df_history):
+    df = rules.apply_rules(df_history, record=False)
+    df = df.loc[~(df["exclude"] & (df["exclude_reason"] == "govuk_status"))]
+
+    return df.groupby(
+        ["title", "analytics_identifier", "exclude", "exclude_reason"], dropna=False
+    )["date"].agg(["first", "last"])
+
+
+def orgs_frame(df: pd.DataFrame) -> pd.DataFrame:
+
+    """
+    Return organisations in the form orgs_database.py writes them to govuk_orgs
+
+    Parameters
+        - df: Organisations, as from normalise.normalise_records()
+
+    """
+
+    df = df.drop_duplicates("analytics_identifier")
+
+    return pd.DataFrame({
+        "id": df["analytics_identifier"].map(lambda identifier: str(utils.org_uuid(identifier))),
+        "govuk_identifier": df["analytics_identifier"],
+        "name": df["title"],
+        "url_name": df["web_url"].str.replace("https://www.gov.uk/government/organisations/", "", regex=False),
+        "type": df["format"],
+        "govuk_status": df["govuk_status"],
+        "start_date": datetime.date(2024, 1, 1),
+        "end_date": None,
+    })
+
+
+def make_stages(data: dict, workdir: str) -> dict:
+
+    """
+    Return the stages to time, as dict of name: (setup, run)
+
+    Parameters
+        - data: The prepared data for a scale, see prepare()
+        - workdir: Directory for files written by the stages
+
+    """
+
+    records = data["records"]
+    store_path = data["store_path"]
+
+    def fresh_store():
+        path = os.path.join(workdir, "fresh.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        return SnapshotStore(path)
+
+    def copied_store():
+        path = os.path.join(workdir, "copy.db")
+        shutil.copy(store_path, path)
+        return SnapshotStore(path)
+
+    def ingest(store):
+        for date, path in data["snapshot_paths"]:
+            store.ingest_file(path, date)
+        store.close()
+
+    def scd_update(store):
+        scd.SCD2History(store).update()
+        store.close()
+
+    def written_snapshot():
+        path = os.path.join(workdir, "organisations.bin")
+        binary_snapshot.write_snapshot(records, path)
+        return path
+
+    def binary_get(path):
+        with binary_snapshot.BinarySnapshot(path) as snapshot:
+            for identifier in data["lookups"]:
+                snapshot.get(identifier)
+
+    def sql_database(name: str, source: Optional[str] = None):
+        path = os.path.join(workdir, name)
+        if os.path.exists(path):
+            os.remove(path)
+        if source is not None:
+            shutil.copy(source, path)
+        return create_engine(f"sqlite:///{path}")
+
+    def sql_write(write):
+        def run(engine):
+            write(engine)
+            engine.dispose()
+        return run
+
+    titles = [record["title"] for record in records]
+
+    return {
+        "read_records": (lambda: data["path"], normalise.read_records),
+        "normalise_records": (lambda: records, normalise.normalise_records),
+        "apply_rules": (lambda: data["df"], rules.apply_rules),
+        "explode_links": (lambda: data["df"], explode_links),
+        "org_graph_closure": (lambda: records, lambda records: org_graph.closure_table(org_graph.OrgGraph.from_records(records))),
+        "write_binary_snapshot": (lambda: os.path.join(workdir, "organisations.bin"), lambda path: binary_snapshot.write_snapshot(records, path)),
+        "binary_snapshot_get": (written_snapshot, binary_get),
+        "snapshot_diff": (lambda: data["first_records"], lambda first: snapshot_diff.diff_snapshots(first, records)),
+        "match_names": (lambda: titles[::max(len(titles) // 200, 1)], lambda left: matching.match_names(left, titles)),
+        "snapshot_ingest": (fresh_store, ingest),
+        "scd2_update": (copied_store, scd_update),
+        "load_history": (copied_store, lambda store: store.load_history()),
+        "history_first_last": (lambda: data["df_history"], history_first_last),
+        "bulk_to_sql": (
+            lambda: sql_database("fresh_sql.db"),
+            sql_write(lambda engine: sql_operations.bulk_to_sql(data["df_orgs"], engine, "govuk_orgs", dtype=ORGS_DTYPE)),
+        ),
+        "upsert_table": (
+            lambda: sql_database("copy_sql.db", data["sql_path"]),
+            sql_write(lambda engine: sql_operations.upsert_table(
+                data["df_orgs"], engine, "govuk_orgs", key="govuk_identifier", dtype=ORGS_DTYPE,
+                preserve=("id", "start_date"), close_col="end_date"
+            )),
+        ),
+        "replace_rows": (
+            lambda: sql_database("copy_sql.db", data["sql_path"]),
+            sql_write(lambda engine: sql_operations.replace_rows(
+                data["df_closure"], engine, "orgs_sponsorship_closure", key="ancestor_id", keys=data["affected"]
+            )),
+        ),
+    }
+
+
+def prepare(scale: float, workdir: str, snapshot_count: int = snapshots) -> dict:
+
+    """
+    Generate the data for a scale: a series of snapshots, each written to an
+    organisations file in workdir and ingested into a snapshot store, and the
+    last snapshot's records
+
+    Parameters
+        - scale: The number of records relative to the real data
+        - workdir: Directory to write the files to
+        - snapshot_count: The number of daily snapshots
+
+    """
+
+    data = {"snapshot_paths": []}
+    os.makedirs(os.path.join(workdir, "snapshots"))
+
+    # Snapshots are kept on disk, as at large scales they wouldn't all fit in memory
+    for date, records in synthetic.generate_snapshots(scale, snapshot_count, seed=seed):
+        path = os.path.join(workdir, "snapshots", f"{date}.json")
+        with open(path, "w") as f:
+            json.dump(records, f)
+        data["snapshot_paths"].append((date, path))
+        data.setdefault("first_records", records)
+
+    data["records"] = records
+    data["path"] = data["snapshot_paths"][-1][1]
+
+    data["df"] = normalise.normalise_records(data["records"])
+
+    data["store_path"] = os.path.join(workdir, "snapshots.db")
+    store = SnapshotStore(data["store_path"])
+    with contextlib.redirect_stdout(io.StringIO()):
+        for date, path in data["snapshot_paths"]:
+            store.ingest_file(path, date)
+    data["df_history"] = store.load_history()
+    store.close()
+
+    # For the database stages: govuk_orgs and the closure table as written from the first
+    # snapshot, and the rows to apply to them from the last
+    first_graph = org_graph.OrgGraph.from_records(data["first_records"])
+    graph = org_graph.OrgGraph.from_records(data["records"])
+    data["affected"] = org_graph.affected_ancestors(first_graph, graph)
+    data["df_closure"] = org_graph.closure_table(graph, [slug for slug in graph.slugs if slug in data["affected"]])
+    data["df_orgs"] = orgs_frame(data["df"])
+
+    data["sql_path"] = os.path.join(workdir, "orgs.db")
+    engine = create_engine(f"sqlite:///{data['sql_path']}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        sql_operations.bulk_to_sql(
+            orgs_frame(normalise.normalise_records(data["first_records"])), engine, "govuk_orgs", dtype=ORGS_DTYPE
+        )
+        sql_operations.bulk_to_sql(org_graph.closure_table(first_graph), engine, "orgs_sponsorship_closure")
+    engine.dispose()
+
+    rng = np.random.default_rng(seed)
+    identifiers = [record["analytics_identifier"] for record in data["records"]]
+    data["lookups"] = [identifiers[i] for i in rng.integers(len(identifiers), size=1000)]
+
+    return data
+
+
+def time_stage(setup, run, repeats: int) -> float:
+
+    """
+    Return the fastest of repeats runs of a stage, in seconds, with its output hidden
+    """
+
+    times = []
+    for _ in range(repeats):
+        argument = setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run(argument)
+            times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+# %%
+# Save and compare baselines
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+
+    """
+    Print each stage's time relative to a baseline, returning the regressions as
+    (scale, stage, ratio)
+
+    Parameters
+        - results: The results of this run
+        - baseline: The results of an earlier run
+        - threshold: Slowdown reported as a regression
+
+    """
+
+    regressions = []
+    for scale, result in results["scales"].items():
+        if scale not in baseline["scales"]:
+            continue
+
+        print(f"Scale {scale}, against baseline from {baseline['created_at']}")
+        for stage, seconds in result["stages"].items():
+            old = baseline["scales"][scale]["stages"].get(stage)
+            if old is None:
+                continue
+
+            ratio = seconds / old
+            flag = ""
+            if old >= MIN_SECONDS and ratio > threshold:
+                flag = "  REGRESSION"
+                regressions.append((scale, stage, ratio))
+            print(f"  {stage:<24} {old * 1000:10.1f} ms -> {seconds * 1000:10.1f} ms  ({ratio:5.2f}x){flag}")
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline's stages on synthetic data")
+    parser.add_argument("--scales", type=float, nargs="+", default=scales, help=f"Scales to benchmark (default: {scales})")
+    parser.add_argument("--repeats", type=int, default=repeats, help=f"Times to time each stage (default: {repeats})")
+    parser.add_argument("--snapshots", type=int, default=snapshots, help=f"Daily snapshots for the history stages (default: {snapshots})")
+    parser.add_argument("--stages", nargs="+", help="Stages to benchmark (default: all)")
+    parser.add_argument("--save", metavar="NAME", help="Save the results as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="Compare the results with a baseline")
+    parser.add_argument("--threshold", type=float, default=threshold, help=f"Slowdown reported as a regression (default: {threshold})")
+
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+
+    results = {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "seed": seed,
+        "repeats": args.repeats,
+        "snapshots": args.snapshots,
+        "scales": {},
+    }
+
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory() as workdir:
+            start = time.perf_counter()
+            data = prepare(scale, workdir, args.snapshots)
+            print(f"Scale {scale:g}: {len(data['records']):,} records, {args.snapshots} snapshots (generated in {time.perf_counter() - start:.1f}s)")
+
+            stages = make_stages(data, workdir)
+            timings = {}
+            for name in args.stages or stages:
+                setup, run = stages[name]
+                timings[name] = time_stage(setup, run, args.repeats)
+                print(f"  {name:<24} {timings[name] * 1000:10.1f} ms")
+
+        results["scales"][f"{scale:g}"] = {"records": len(data["records"]), "stages": timings}
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save}.json")
+        with open(path, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Saved baseline to {path}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stages slower than the baseline by more than {args.threshold}x")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
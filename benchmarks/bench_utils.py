@@ -0,0 +1,94 @@
+# %%
+"""
+    Purpose
+        Benchmark the vectorised, exploded helpers in utils.py against the
+        row-by-row list helpers followed by DataFrame.explode(), and check
+        they give the same results
+    Inputs
+        - JSON: organisations.json
+    Outputs
+        - None
+    Parameters
+        - scales: Number of copies of the organisations data to benchmark on
+        - repeats: Number of times to time each approach
+    Notes
+        - Run from the repo root: python -m benchmarks.bench_utils
+"""
+
+import timeit
+
+import pandas as pd
+
+import normalise
+import utils
+
+# %%
+# SET VARIABLES
+scales = [1, 10, 100]
+repeats = 3
+col = "child_organisations"
+prefix = "https://www.gov.uk/api/organisations/"
+
+# %%
+# Prepare data
+df_orgs = normalise.load_organisations("organisations.json")
+df_orgs.insert(0, "org_id", df_orgs["analytics_identifier"].map(utils.org_uuid))
+
+
+# %%
+# Define approaches, each taking a frame of org_id, child_organisations
+def flatten_lists(df):
+    df = df.copy()
+    utils.flatten_list_of_dicts(df, col, "id")
+    return df.explode(col).dropna(subset=[col])
+
+
+def flatten_exploded(df):
+    return utils.explode_list_of_dicts(df, col, "id")
+
+
+def prefix_lists(df):
+    df = df.copy()
+    utils.flatten_list_of_dicts(df, col, "id")
+    utils.remove_prefixes(df, col, prefix)
+    return df.explode(col).dropna(subset=[col])
+
+
+def prefix_exploded(df):
+    return utils.remove_prefix_exploded(utils.explode_list_of_dicts(df, col, "id"), col, prefix)
+
+
+def match_lists(df):
+    df = df.copy()
+    utils.flatten_list_of_dicts(df, col, "id")
+    utils.remove_prefixes(df, col, prefix)
+    utils.match_and_replace(df_orgs, df, col, "slug", "org_id")
+    return df.explode(col).dropna(subset=[col])
+
+
+def match_exploded(df):
+    df = utils.remove_prefix_exploded(utils.explode_list_of_dicts(df, col, "id"), col, prefix)
+    return utils.match_and_replace_exploded(df_orgs, df, col, "slug", "org_id").dropna(subset=[col])
+
+
+cases = {
+    "flatten_list_of_dicts": (flatten_lists, flatten_exploded),
+    "+ remove_prefixes": (prefix_lists, prefix_exploded),
+    "+ match_and_replace": (match_lists, match_exploded),
+}
+
+# %%
+# Check results match, then time each approach
+for scale in scales:
+    df = pd.concat([df_orgs[["org_id", col]]] * scale, ignore_index=True)
+    print(f"{len(df):,} rows")
+
+    for name, (lists, exploded) in cases.items():
+        expected = lists(df)
+        actual = exploded(df)
+        assert expected[col].tolist() == actual[col].tolist(), f"{name} results differ"
+        assert expected.index.equals(actual.index), f"{name} results differ"
+
+        lists_time = min(timeit.repeat(lambda: lists(df), number=1, repeat=repeats))
+        exploded_time = min(timeit.repeat(lambda: exploded(df), number=1, repeat=repeats))
+        print(f"  {name:<25} lists + explode {lists_time * 1000:8.1f} ms  exploded {exploded_time * 1000:8.1f} ms  ({lists_time / exploded_time:5.1f}x)")
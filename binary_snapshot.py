@@ -0,0 +1,357 @@
+# %%
+"""
+    Purpose
+        Write organisations data to a compact binary snapshot that can be memory-mapped
+        and read one record at a time, and read it back
+    Inputs
+        - JSON: organisations.json
+    Outputs
+        - Binary: organisations.bin
+    Parameters
+        None
+    Notes
+        - Command-line usage:
+            python binary_snapshot.py organisations.json organisations.bin
+            python binary_snapshot.py --get D18 organisations.bin
+        - Layout, all little-endian and each section aligned to 8 bytes:
+            - Header: magic b'ORGSNAP\\0', version, record count, string count, then the
+              offset of each section in SECTIONS
+            - String table: offsets (uint32, string count + 1) into a UTF-8 heap. Each
+              distinct string is stored once
+            - Scalar fields: a uint32 string ID per record per field in SCALAR_FIELDS,
+              record by record. NULL_ID marks nulls
+            - Link fields: for each field in LINK_FIELDS, offsets (uint32, record count + 1)
+              into arrays of string IDs of each link's 'id' and 'web_url'
+            - Index: record positions (uint32) sorted by analytics_identifier
+        - Keys missing from a record are stored as nulls, so are read back as None (or
+          as empty lists for the link fields). Keys not in SCALAR_FIELDS or LINK_FIELDS
+          aren't stored, and a warning lists them - the format needs a new version to
+          hold them
+        - Run as the pipeline's binary_snapshot stage, after extract_data.py. The file
+          is rebuilt from organisations.json whenever needed, so isn't committed
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+import json_operations
+
+# %%
+# Binary snapshot format
+
+MAGIC = b"ORGSNAP\0"
+VERSION = 1
+
+# Record fields holding strings, as (key in record, key in record['details'] or None)
+SCALAR_FIELDS = [
+    ("id", None),
+    ("title", None),
+    ("format", None),
+    ("updated_at", None),
+    ("web_url", None),
+    ("details", "slug"),
+    ("details", "abbreviation"),
+    ("details", "logo_formatted_name"),
+    ("details", "organisation_brand_colour_class_name"),
+    ("details", "organisation_logo_type_class_name"),
+    ("details", "closed_at"),
+    ("details", "govuk_status"),
+    ("details", "govuk_closed_status"),
+    ("details", "content_id"),
+    ("analytics_identifier", None),
+]
+
+LINK_FIELDS = json_operations.LIST_COLUMNS
+
+SECTIONS = (
+    ["string_offsets", "string_heap", "scalars"]
+    + [f"{field}_{part}" for field in LINK_FIELDS for part in ("offsets", "ids", "web_urls")]
+    + ["index"]
+)
+
+HEADER = struct.Struct(f"<8sIII4x{len(SECTIONS)}Q")
+
+NULL_ID = 0xFFFFFFFF
+
+IDENTIFIER_FIELD = SCALAR_FIELDS.index(("analytics_identifier", None))
+
+KNOWN_KEYS = {key for key, sub_key in SCALAR_FIELDS if sub_key is None} | set(LINK_FIELDS) | {"details"}
+KNOWN_DETAILS_KEYS = {sub_key for key, sub_key in SCALAR_FIELDS if sub_key is not None}
+
+
+def _fields(record: dict) -> list:
+
+    """
+    Return a record's values for SCALAR_FIELDS, with None for missing keys
+
+    Parameters
+        - record: An organisation record, as returned by the API
+
+    """
+
+    details = record.get("details") or {}
+
+    return [record.get(key) if sub_key is None else details.get(sub_key) for key, sub_key in SCALAR_FIELDS]
+
+
+def write_snapshot(records: Iterable[dict], path: str) -> int:
+
+    """
+    Write organisation records to a binary snapshot, via a temporary file so that
+    readers never see a partly-written one
+
+    Returns the number of records written
+
+    Parameters
+        - records: Organisation records, as returned by the API
+        - path: The file to write
+
+    """
+
+    records = list(records)
+    strings = {}
+
+    def string_id(value: Optional[str]) -> int:
+        if value is None:
+            return NULL_ID
+        return strings.setdefault(value, len(strings))
+
+    unknown = set()
+    for record in records:
+        unknown.update(record.keys() - KNOWN_KEYS)
+        unknown.update(f"details.{key}" for key in (record.get("details") or {}).keys() - KNOWN_DETAILS_KEYS)
+    if unknown:
+        print(f"Warning: Keys not held in binary snapshots, so left out of {path}: {', '.join(sorted(unknown))}")
+
+    scalars = np.array(
+        [[string_id(value) for value in _fields(record)] for record in records],
+        dtype="<u4"
+    ).reshape(len(records), len(SCALAR_FIELDS))
+
+    sections = {"scalars": scalars}
+    for field in LINK_FIELDS:
+        links = [record.get(field) or [] for record in records]
+        offsets = np.zeros(len(records) + 1, dtype="<u4")
+        np.cumsum([len(record_links) for record_links in links], out=offsets[1:])
+
+        sections[f"{field}_offsets"] = offsets
+        sections[f"{field}_ids"] = np.array(
+            [string_id(link.get("id")) for record_links in links for link in record_links], dtype="<u4"
+        )
+        sections[f"{field}_web_urls"] = np.array(
+            [string_id(link.get("web_url")) for record_links in links for link in record_links], dtype="<u4"
+        )
+
+    encoded = [value.encode() for value in strings]
+    string_offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    np.cumsum([len(value) for value in encoded], out=string_offsets[1:])
+
+    sections["string_offsets"] = string_offsets
+    sections["string_heap"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    # Sort on the UTF-8 bytes, which sort in the same order as the strings
+    # Records without an analytics_identifier sort first, as if it were empty
+    identifiers = [b"" if i == NULL_ID else encoded[i] for i in scalars[:, IDENTIFIER_FIELD]]
+    sections["index"] = np.array(sorted(range(len(records)), key=identifiers.__getitem__), dtype="<u4")
+
+    section_offsets = []
+    position = HEADER.size
+    for name in SECTIONS:
+        position += -position % 8
+        section_offsets.append(position)
+        position += sections[name].nbytes
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), len(encoded), *section_offsets))
+        for name, offset in zip(SECTIONS, section_offsets):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(sections[name].tobytes())
+
+    os.replace(tmp_path, path)
+
+    return len(records)
+
+
+class BinarySnapshot:
+
+    """
+    Read-only view of a binary snapshot, memory-mapped so that opening it costs
+    only reading the header, and records are decoded only when they're accessed
+
+    Parameters
+        - path: The snapshot file
+
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.record_count, string_count, *section_offsets = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} isn't a version {VERSION} binary snapshot")
+
+        offsets = dict(zip(SECTIONS, section_offsets))
+        n = self.record_count
+
+        def array(name: str, count: int) -> np.ndarray:
+            return np.frombuffer(self._mmap, dtype="<u4", count=count, offset=offsets[name])
+
+        self._string_offsets = array("string_offsets", string_count + 1)
+        self._heap_start = offsets["string_heap"]
+        self._scalars = array("scalars", n * len(SCALAR_FIELDS)).reshape(n, len(SCALAR_FIELDS))
+        self._links = {}
+        for field in LINK_FIELDS:
+            link_offsets = array(f"{field}_offsets", n + 1)
+            link_count = int(link_offsets[-1])
+            self._links[field] = (
+                link_offsets,
+                array(f"{field}_ids", link_count),
+                array(f"{field}_web_urls", link_count),
+            )
+        self._index = array("index", n)
+
+    def __enter__(self) -> "BinarySnapshot":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+
+        """
+        Unmap the file. Arrays handed out by this object mustn't be used afterwards
+        """
+
+        # numpy views hold the buffer open, so drop them before closing the map
+        self._string_offsets = self._scalars = self._index = self._links = None
+        self._mmap.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def _bytes(self, string_id: int) -> bytes:
+        start = self._heap_start + int(self._string_offsets[string_id])
+        end = self._heap_start + int(self._string_offsets[string_id + 1])
+        return self._mmap[start:end]
+
+    def _string(self, string_id: int) -> Optional[str]:
+        if string_id == NULL_ID:
+            return None
+        return self._bytes(string_id).decode()
+
+    def record(self, position: int) -> dict:
+
+        """
+        Return the record at a position in the file, in the same form as in
+        organisations.json
+
+        Parameters
+            - position: The record's position
+
+        """
+
+        record = {}
+        for (key, sub_key), string_id in zip(SCALAR_FIELDS, self._scalars[position]):
+            if sub_key is None:
+                record[key] = self._string(string_id)
+            else:
+                record.setdefault(key, {})[sub_key] = self._string(string_id)
+
+        # Keep the key order of the API
+        record["analytics_identifier"] = record.pop("analytics_identifier")
+
+        for field, (offsets, ids, web_urls) in self._links.items():
+            start, end = offsets[position], offsets[position + 1]
+            record[field] = [
+                {"id": self._string(id_), "web_url": self._string(web_url)}
+                for id_, web_url in zip(ids[start:end], web_urls[start:end])
+            ]
+
+        return record
+
+    def find(self, analytics_identifier: str) -> Optional[int]:
+
+        """
+        Return the position of an organisation's record, found by binary search
+        on the index, or None if it isn't in the snapshot
+
+        Parameters
+            - analytics_identifier: The organisation's analytics_identifier
+
+        """
+
+        target = analytics_identifier.encode()
+        lo, hi = 0, self.record_count
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            position = int(self._index[mid])
+            string_id = int(self._scalars[position, IDENTIFIER_FIELD])
+            value = b"" if string_id == NULL_ID else self._bytes(string_id)
+
+            if value < target:
+                lo = mid + 1
+            elif value > target:
+                hi = mid
+            else:
+                return position
+
+        return None
+
+    def get(self, analytics_identifier: str) -> Optional[dict]:
+
+        """
+        Return an organisation's record, or None if it isn't in the snapshot
+
+        Parameters
+            - analytics_identifier: The organisation's analytics_identifier
+
+        """
+
+        position = self.find(analytics_identifier)
+
+        return None if position is None else self.record(position)
+
+    def __contains__(self, analytics_identifier: str) -> bool:
+        return self.find(analytics_identifier) is not None
+
+    def __iter__(self) -> Iterator[dict]:
+        for position in range(self.record_count):
+            yield self.record(position)
+
+
+# %%
+# Command-line interface
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Write or read a binary organisations snapshot")
+    parser.add_argument("paths", nargs="+", help="Either the JSON file and the snapshot to write, or the snapshot to read")
+    parser.add_argument("--get", metavar="ANALYTICS_IDENTIFIER", help="Print an organisation's record from a snapshot")
+
+    args = parser.parse_args(argv)
+
+    if args.get:
+        with BinarySnapshot(args.paths[0]) as snapshot:
+            record = snapshot.get(args.get)
+            if record is None:
+                parser.exit(1, f"{args.get} isn't in {args.paths[0]}\n")
+            print(json.dumps(record, indent=4))
+    else:
+        if len(args.paths) != 2:
+            parser.error("give the JSON file and the snapshot to write")
+        record_count = write_snapshot(json_operations.read_records(args.paths[0]), args.paths[1])
+        print(f"Wrote {record_count} organisations to {args.paths[1]} ({os.path.getsize(args.paths[1]):,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# %%
+"""
+    Purpose
+        Compare the memory used by the organisations DataFrame as loaded by
+        normalise.py with the compact form from compact.compact_frame()
+    Inputs
+        - JSON: organisations.json, or
+        - SQLite: A snapshot store, for the full history
+    Outputs
+        - None
+    Parameters
+        None
+    Notes
+        - Command-line usage:
+            python compact.py organisations.json
+            python compact.py --store snapshots.db
+"""
+
+import argparse
+import sys
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+import normalise
+from org_graph import link_slug
+
+# %%
+# Compact, typed form of the organisations DataFrame
+
+# Columns with few distinct values, held as categoricals
+CATEGORY_COLUMNS = [
+    "date",
+    "format",
+    "govuk_status",
+    "govuk_closed_status",
+    "organisation_brand_colour_class_name",
+    "organisation_logo_type_class_name",
+]
+
+# Identifier columns, held as categoricals so that each identifier's string is stored
+# once however many snapshots it appears in
+ID_COLUMNS = [
+    "id",
+    "analytics_identifier",
+    "content_id",
+    "slug",
+    "web_url",
+    "title",
+    "abbreviation",
+    "logo_formatted_name",
+]
+
+
+class LinkLists:
+
+    """
+    A column of lists of links to other organisations, held as the slugs linked
+    to, in compressed sparse row form: the slugs of row i are
+    values[offsets[i]:offsets[i + 1]], with values a categorical
+
+    Parameters
+        - offsets: Array of len(rows) + 1 offsets into values
+        - values: Categorical of slugs
+
+    """
+
+    def __init__(self, offsets: np.ndarray, values: pd.Categorical):
+        self.offsets = offsets
+        self.values = values
+
+    @classmethod
+    def from_lists(cls, lists: Iterable[list]) -> "LinkLists":
+
+        """
+        Build from a column of lists of links, as held in e.g. 'child_organisations'
+
+        Parameters
+            - lists: The lists of links
+
+        """
+
+        lengths = []
+        slugs = []
+        for links in lists:
+            lengths.append(len(links))
+            slugs += [link_slug(link) for link in links]
+
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int32)
+        np.cumsum(lengths, out=offsets[1:])
+
+        return cls(offsets, pd.Categorical(slugs))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> list:
+        return list(self.values[self.offsets[i]:self.offsets[i + 1]])
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.values.codes.nbytes + self.values.categories.memory_usage(deep=True)
+
+    def take(self, rows: np.ndarray) -> "LinkLists":
+
+        """
+        Return the lists of the given rows, e.g. to repeat rows across snapshots
+
+        Parameters
+            - rows: Array of row positions
+
+        """
+
+        starts = self.offsets[:-1][rows]
+        lengths = np.diff(self.offsets)[rows]
+
+        offsets = np.zeros(len(rows) + 1, dtype=np.int32)
+        np.cumsum(lengths, out=offsets[1:])
+
+        # Positions in values of each slug of each row taken
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        codes = self.values.codes[positions]
+
+        return LinkLists(offsets, pd.Categorical.from_codes(codes, dtype=self.values.dtype))
+
+    def to_frame(self) -> pd.DataFrame:
+
+        """
+        Return the links as a DataFrame with a row per link, with columns 'row'
+        (the position of the row linking) and 'slug'
+        """
+
+        return pd.DataFrame({
+            "row": np.repeat(np.arange(len(self)), np.diff(self.offsets)),
+            "slug": self.values,
+        })
+
+
+def compact_frame(df: pd.DataFrame) -> tuple:
+
+    """
+    Return a compact copy of a DataFrame from normalise.normalise_records() or
+    snapshot_store.SnapshotStore.load_history(), with low-cardinality and
+    identifier columns as categoricals, and the list columns taken out and
+    returned separately as LinkLists
+
+    Returns (df, dict of column name: LinkLists)
+
+    Parameters
+        - df: The DataFrame in question
+
+    """
+
+    df = df.copy()
+
+    for col in CATEGORY_COLUMNS + ID_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+    links = {
+        col: LinkLists.from_lists(df.pop(col))
+        for col in normalise.LIST_COLUMNS
+        if col in df.columns
+    }
+
+    return df, links
+
+
+def take(df: pd.DataFrame, links: dict, rows: np.ndarray) -> tuple:
+
+    """
+    Return the given rows of a compact DataFrame and its LinkLists
+
+    Parameters
+        - df: The compact DataFrame
+        - links: Its LinkLists
+        - rows: Array of row positions
+
+    """
+
+    return (
+        df.iloc[rows].reset_index(drop=True),
+        {col: link_lists.take(rows) for col, link_lists in links.items()}
+    )
+
+
+def memory_report(frames: dict) -> pd.DataFrame:
+
+    """
+    Return the memory used by each column of one or more DataFrames, in MB,
+    counting the contents of object columns (including lists of dicts) as if
+    no two rows shared them, with a total row
+
+    Parameters
+        - frames: Dict of name: DataFrame, or name: (DataFrame, LinkLists dict)
+          as returned by compact_frame()
+
+    """
+
+    report = {}
+    for name, frame in frames.items():
+        df, links = frame if isinstance(frame, tuple) else (frame, {})
+
+        usage = df.memory_usage(deep=True, index=False).astype(float)
+        for col, link_lists in links.items():
+            usage[col] = link_lists.nbytes
+
+        # memory_usage() doesn't count the dicts inside lists
+        for col in normalise.LIST_COLUMNS:
+            if col in df.columns:
+                usage[col] += sum(
+                    _deep_size(links_list) for links_list in df[col]
+                )
+
+        report[name] = usage / 1e6
+
+    df_report = pd.DataFrame(report)
+    df_report.loc["total"] = df_report.sum()
+
+    return df_report.round(3)
+
+
+def _deep_size(value) -> int:
+
+    """
+    Return the approximate size of a list of dicts of strings, in bytes, not
+    counting the list itself, which memory_usage() already counts
+    """
+
+    return sum(
+        sys.getsizeof(item) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in item.items())
+        for item in value
+    )
+
+
+# %%
+# Command-line interface
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Report the memory used by the organisations DataFrame")
+    parser.add_argument("path", nargs="?", default="organisations.json", help="Organisations file (default: organisations.json)")
+    parser.add_argument("--store", help="Snapshot store to report on the full history of, in place of path")
+
+    args = parser.parse_args(argv)
+
+    if args.store:
+        from snapshot_store import SnapshotStore
+
+        store = SnapshotStore(args.store)
+        df = store.load_history()
+        frames = {"current": df, "compact": store.load_history(compact=True)}
+        store.close()
+    else:
+        df = normalise.load_organisations(args.path)
+        frames = {"current": df, "compact": compact_frame(df)}
+
+    print(f"{len(df)} rows")
+    print(memory_report(frames).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -15,8 +15,13 @@
 
 import pandas as pd
 from pandas.io.formats import excel
+import requests
 
-from ds_utils import matching_operations as mo
+from match_store import MatchStore
+import matching
+import normalise
+import rules
+from snapshot_store import SnapshotStore
 
 # %%
 # SET VARIABLES
@@ -52,11 +57,22 @@ data_urls = {
 # %%
 # READ IN DATA
 # Read in GOV.UK data
-df = pd.DataFrame()
-for date, url in data_urls.items():
-    data = pd.read_json(url)
-    data["date"] = date
-    df = pd.concat([df, data])
+# NB: Snapshots are only downloaded the first time they're needed, and are then read from
+# the local snapshot store
+store = SnapshotStore("./temp/snapshots.db")
+stored_dates = store.dates()
+for date, url in sorted(data_urls.items()):
+    if date not in stored_dates:
+        r = requests.get(url, timeout=30)
+        r.raise_for_status()
+        store.ingest(r.json(), date, source=url)
+
+df = store.load_history()
+store.close()
+
+# Excel doesn't support timezone-aware datetimes
+for col in normalise.DATE_COLUMNS:
+    df[col] = df[col].dt.tz_localize(None)
 
 # %%
 # Read in CO data
@@ -66,109 +82,23 @@ df_co = pd.read_excel(
 
 # %%
 # EDIT DATA
-# Flatten 'details' column
-df_edited = pd.concat([df.drop(["details"], axis=1), df["details"].apply(pd.Series)], axis=1)
-
-# %%
 # Strip all titles
+df_edited = df.copy()
 df_edited["title"] = df_edited["title"].str.strip()
 
 # %%
-# Fix format values
-# Organisations with analytics_identifier starting with 'D'
-# NB: Ordnanace Survey - D38 - is a public corporation, therefore probably is correctly categorised
-# as 'other'
-df_edited.loc[
-    df_edited["title"].isin([
-        "Department for Business, Energy & Industrial Strategy",
-        "Department for Digital, Culture, Media & Sport",
-        "Department for International Trade",
-        "Department for Levelling Up, Housing and Communities",
-        "Office of the Secretary of State for Scotland",
-        "Office of the Secretary of State for Wales",
-    ]),
-    "format"
-] = "Ministerial department"
-
-df_edited.loc[
-    df_edited["title"].isin([
-        "Office for National Statistics",
-    ]),
-    "format"
-] = "Executive office"
-
-# %%
-# Add exclude flag
-df_edited["exclude"] = False
-df_edited.loc[
-    df_edited["format"].isin([
-        "Civil service",
-        "Court",
-        "Devolved administration",
-        "Executive office",
-        "Ministerial department",
-        "Sub organisation",
-        "Tribunal",
-    ]),
-    ["exclude", "exclude_reason"]
-] = [True, "format"]
-
-# %%
-# Produce cross-tab of govuk_status, govuk_closed_status
+# Produce cross-tab of govuk_status, govuk_closed_status, before cleaning
 pd.crosstab(df_edited["govuk_status"], df_edited["govuk_closed_status"], dropna=False)
 
 # %%
-# Clean up govuk_status values
-
-# Set 'transitioning' to 'closed' or 'devolved' based on govuk_closed_status
-df_edited.loc[
-    (~df_edited["govuk_status"].isin(["closed", "live"])) &
-    (df_edited["govuk_closed_status"].isin([
-        "changed_name",
-        "left_gov",
-        "merged",
-        "no_longer_exists",
-        "replaced",
-        "split",
-    ])),
-    "govuk_status"
-] = "closed"
-df_edited.loc[
-    (~df_edited["govuk_status"].isin(["closed", "live"])) &
-    (df_edited["govuk_closed_status"] == "devolved"),
-    "govuk_status"
-] = "devolved"
-
-# Set remaining 'exempt' to 'live'
-# NB: Done on the thesis that this is just a descriptor of whether something has a separate website
-df_edited.loc[
-    df_edited["govuk_status"] == "exempt",
-    "govuk_status"
-] = "live"
+# Fix format values, clean up govuk_status and govuk_closed_status values and add exclude flag
+# NB: See rules.CLEANING_RULES. The rule that applied to each row, if any, is recorded in
+# the format_rule, govuk_status_rule, govuk_closed_status_rule and exclude_rule columns
+df_edited = rules.apply_rules(df_edited)
 
 # Assert there are no 'exempt' govuk_status values
 assert df_edited["govuk_status"].ne("exempt").all()
 
-# %%
-# Clean up govuk_closed_status values
-
-# Set to blank where govuk_status is 'live'
-df_edited.loc[
-    df_edited["govuk_status"] == "live",
-    "govuk_closed_status"
-] = pd.NA
-
-# %%
-# Flag govuk_status values for exclusion
-df_edited.loc[
-    df_edited["govuk_status"].isin([
-        "closed",
-        "devolved",
-        "joining",
-    ]),
-    ["exclude", "exclude_reason"]
-] = [True, "govuk_status"]
-
 # %%
 # Produce cross-tab of govuk_status, govuk_closed_status
 pd.crosstab(df_edited["govuk_status"], df_edited["govuk_closed_status"], dropna=False)
@@ -340,14 +270,19 @@ df_live = df_firstlast[["title", "analytics_identifier", "last"]].merge(
 ).drop(columns=["date"]).sort_values(by="title")
 
 # %%
-df_merge = mo.fuzzy_merge(
+# NB: Scores are cached between runs, and pairs confirmed or rejected by hand with
+# match_store.py are applied
+match_store = MatchStore("./temp/matches.db")
+df_merge = matching.fuzzy_merge(
     df_live,
     df_co,
     column_left="title",
     column_right="overall_organisation",
     drop_na=False,
     score_cutoff=90,
+    store=match_store,
 )
+match_store.close()
 
 # %%
 # Look for organisations in the CO list not matched to the GOV.UK list
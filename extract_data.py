@@ -8,99 +8,110 @@
     Outputs
         - JSON: organisations.json
             - Latest version of organisations data
+        - JSON: organisations_changes.json
+            - analytics_identifiers of organisations added, changed and removed since the previous run,
+              plus the updated_at high-water mark. Written on every run, with empty lists if
+              nothing has changed
+        - Markdown: A report of organisations added, removed, renamed, reformatted, status-changed
+          and re-parented since the previous run, printed and added to the GitHub Actions job
+          summary
     Parameters
-        None
+        - max_workers: Maximum number of API pages to fetch concurrently
+        - cache_dir: Directory holding cached API pages, used to make conditional requests
+        - checkpoint_dir: Directory holding pages retrieved so far, used to resume a failed run
+        - checkpoint_max_age: Age in seconds after which checkpoints are discarded rather than
+          resumed from. Well under the daily schedule, so that a run never picks up the previous
+          day's pages
     Notes
-        None
+        - organisations.json is left untouched if every page is unchanged since the last run
+        - If any page can't be retrieved, the pages that were retrieved are kept in checkpoint_dir
+          and rerunning the script fetches only the missing pages
+        - The GOV.UK API can't be filtered on updated_at, so every page is still requested
+          (conditionally). Downstream loaders can use organisations_changes.json to process
+          only the organisations that have changed
+        - Only requests and the standard library are needed, as the GitHub action installs
+          nothing else. Work needing pandas or numpy belongs in the downstream stages, see
+          pipeline.py
 """
 
-import json
-import time
+import os
 
-import requests
+import api_operations
+from incremental import ChangeTracker
+import json_operations
+import snapshot_diff
 
 # %%
 # Prepare to call API
 url_stub = "https://www.gov.uk/api/organisations?page="
 headers = {"accept": "application/json"}
-
-
-def call_api(url_stub, page_number, headers, max_retries=5):
-    url = url_stub + str(page_number)
-
-    for attempt in range(max_retries):
-        try:
-            r = requests.get(url, headers=headers, timeout=30)
-
-            if not r.ok:
-                if r.status_code == 503:
-                    print(f"Warning: API temporarily unavailable (503) for page {page_number}. Attempt {attempt + 1}/{max_retries}")
-                    if attempt < max_retries - 1:
-                        time.sleep(5 * (attempt + 1))
-                        continue
-                    else:
-                        print(f"Error: Failed after {max_retries} attempts. Stopping at page {page_number}")
-                        print(f"Retrieved {len(record_list)} organisations before failure.")
-                        return False
-                else:
-                    print(f"Error: API returned status code {r.status_code} for page {page_number}")
-                    print(f"Response content: {r.text[:500]}")
-                    return False
-
-            try:
-                data = r.json()
-            except requests.JSONDecodeError as e:
-                print(f"Error: Unable to parse JSON from page {page_number}")
-                print(f"Status code: {r.status_code}")
-                print(f"Response content: {r.text[:500]}")
-                print(f"JSON decode error: {e}")
-                return False
-
-            # Extract results if present
-            if "results" in data:
-                record_list.extend(data["results"])
-                print(f"Retrieved page {page_number}: {len(data['results'])} organisations (total: {len(record_list)})")
-            else:
-                print(f"Warning: No 'results' key found in response for page {page_number}")
-
-            # Check for next page
-            if data.get("next_page_url"):
-                page_number += 1
-                success = call_api(url_stub, page_number, headers, max_retries)
-                return success
-            else:
-                print(f"Completed: Retrieved all {len(record_list)} organisations")
-                return True
-
-        except requests.exceptions.RequestException as e:
-            print(f"Error: Request failed for page {page_number}. Attempt {attempt + 1}/{max_retries}")
-            print(f"Error details: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(5 * (attempt + 1))
-            else:
-                print(f"Failed after {max_retries} attempts. Stopping at page {page_number}")
-                return False
-
-    return False
-
+max_workers = 8
+cache_dir = ".cache/api_pages"
+checkpoint_dir = ".cache/checkpoints"
+checkpoint_max_age = 12 * 60 * 60
 
 # %%
-# Call API
-page_number = 1
-record_list = []
-
-success = call_api(url_stub, page_number, headers)
+# Call API, checkpointing each page as it arrives
+cache = api_operations.PageCache(cache_dir)
+checkpoints = api_operations.CheckpointStore(checkpoint_dir, max_age=checkpoint_max_age)
+
+try:
+    api_operations.fetch_to_checkpoints(
+        url_stub, headers, checkpoints, max_workers=max_workers, cache=cache
+    )
+    success = True
+except api_operations.IncompleteRetrievalError as e:
+    print(f"Error: {e}")
+    print("Error: Incomplete data retrieval. File not saved. Rerun to fetch the missing pages.")
+    success = False
 
 # %%
-# Save output
-if success and record_list:
-    with open("organisations.json", "w") as f:
-        json.dump(record_list, f)
-    print(f"Saved {len(record_list)} organisations to organisations.json")
-else:
-    if not success:
-        print("Error: Incomplete data retrieval. File not saved.")
+# Save output, assembled from the checkpoints in one pass
+if success:
+    unchanged = cache.all_unchanged()
+
+    tracker = ChangeTracker([], "organisations_changes.json")
+    diff = None if unchanged else snapshot_diff.SnapshotDiff([])
+
+    # The previous records are read a page at a time, keeping only what the new ones are
+    # compared against, and the new ones are compared as they stream through to
+    # organisations.json, so neither file is held in memory in full or read twice
+    if os.path.exists("organisations.json"):
+        for _, records in json_operations.iter_pages("organisations.json"):
+            tracker.add_previous(records)
+            if diff is not None:
+                diff.add_old(records)
+
+    pages = tracker.track(checkpoints.iter_pages())
+
+    if not tracker.previous:
+        diff = None
+    elif diff is not None:
+        pages = diff.track(pages)
+
+    record_count = api_operations.write_records(pages, "organisations.json", cache=cache)
+    checkpoints.clear()
+
+    # The changeset is written on every run, so that it never describes an earlier run's changes
+    if record_count:
+        tracker.write("organisations_changes.json")
+        changeset = tracker.changeset()
+
+    if record_count and unchanged:
+        print(f"No changes since last run ({record_count} organisations). File not rewritten.")
+    elif record_count:
+        print(f"Saved {record_count} organisations to organisations.json")
+        print(
+            f"Changes since {changeset['previous_watermark']}: {len(changeset['added'])} added, "
+            f"{len(changeset['changed'])} changed, {len(changeset['removed'])} removed"
+        )
+
+        if diff is not None:
+            report = snapshot_diff.to_markdown(diff.changes())
+            print(report)
+
+            if "GITHUB_STEP_SUMMARY" in os.environ:
+                with open(os.environ["GITHUB_STEP_SUMMARY"], "a") as f:
+                    f.write(report)
     else:
         print("Warning: No organisations retrieved. File not saved.")
-
-# %%
@@ -0,0 +1,142 @@
+# %%
+import json
+from typing import Iterable, Iterator, Optional
+
+# %%
+# Tracking of changes between runs of extract_data.py, using updated_at watermarks
+
+
+class ChangeTracker:
+
+    """
+    Work out which organisations have been added, changed or removed since the
+    last run, as records stream through from the API
+
+    An organisation counts as changed if its updated_at has moved on past the
+    previous run's high-water mark. The high-water mark is read from the
+    previous changeset file, falling back to the latest updated_at in the
+    previous run's records
+
+    Only the analytics_identifier and updated_at of each previous record are
+    kept, so the previous records can be streamed in with add_previous()
+
+    Parameters
+        - previous_records: The records written by the previous run, e.g. from
+          json_operations.iter_records(). Empty if there was no previous run, or
+          if they're to be added with add_previous()
+        - changes_path: The changeset file written by the previous run
+
+    """
+
+    def __init__(self, previous_records: Iterable[dict], changes_path: str):
+        self.previous = {}
+        self.previous_watermark = _read_watermark(changes_path)
+        self.watermark = self.previous_watermark
+        self.added = []
+        self.changed = []
+        self._seen = set()
+        self._watermark_from_file = self.previous_watermark is not None
+
+        self.add_previous(previous_records)
+
+    def add_previous(self, records: Iterable[dict]) -> None:
+
+        """
+        Record organisations written by the previous run. Must be called before
+        track()
+
+        Parameters
+            - records: Records written by the previous run
+
+        """
+
+        for record in records:
+            updated_at = record.get("updated_at")
+            self.previous[record["analytics_identifier"]] = updated_at
+
+            if (
+                updated_at and not self._watermark_from_file
+                and (self.previous_watermark is None or updated_at > self.previous_watermark)
+            ):
+                self.previous_watermark = self.watermark = updated_at
+
+    def track(self, pages: Iterable[tuple]) -> Iterator[tuple]:
+
+        """
+        Pass (page_number, records) pages through unchanged, recording any
+        added or changed organisations along the way
+
+        Parameters
+            - pages: Iterable of (page_number, records), as yielded by
+              api_operations.CheckpointStore.iter_pages()
+
+        """
+
+        for page_number, records in pages:
+            for record in records:
+                identifier = record["analytics_identifier"]
+                updated_at = record.get("updated_at")
+                self._seen.add(identifier)
+
+                if identifier not in self.previous:
+                    self.added.append(identifier)
+                elif updated_at and (self.previous_watermark is None or updated_at > self.previous_watermark):
+                    self.changed.append(identifier)
+
+                if updated_at and (self.watermark is None or updated_at > self.watermark):
+                    self.watermark = updated_at
+
+            yield page_number, records
+
+    def removed(self) -> list:
+
+        """
+        Return the organisations in the previous file that haven't been seen
+        since. Only meaningful once every page has been tracked
+        """
+
+        return sorted(set(self.previous) - self._seen)
+
+    def changeset(self) -> dict:
+
+        """
+        Return the changeset, with the previous and new high-water marks
+        """
+
+        return {
+            "previous_watermark": self.previous_watermark,
+            "watermark": self.watermark,
+            "added": self.added,
+            "changed": self.changed,
+            "removed": self.removed(),
+        }
+
+    def write(self, path: str) -> None:
+
+        """
+        Write the changeset to a JSON file
+
+        Parameters
+            - path: The file to write to
+
+        """
+
+        with open(path, "w") as f:
+            json.dump(self.changeset(), f, indent=4)
+
+
+def _read_watermark(path: str) -> Optional[str]:
+
+    """
+    Return the high-water mark recorded in a changeset file, if there is one
+
+    Parameters
+        - path: The changeset file
+
+    """
+
+    try:
+        with open(path) as f:
+            return json.load(f).get("watermark")
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
@@ -0,0 +1,147 @@
+# %%
+import json
+from typing import Iterator
+
+import metrics
+
+# %%
+# Functions to be used for reading organisations files as plain records
+# NB: These only need the standard library, so extract_data.py can use them without
+# pandas or numpy installed
+
+# Columns holding lists of {'id': ..., 'web_url': ...} links to other organisations
+LIST_COLUMNS = [
+    "parent_organisations",
+    "child_organisations",
+    "superseded_organisations",
+    "superseding_organisations",
+]
+
+API_PREFIX = "https://www.gov.uk/api/organisations/"
+
+
+@metrics.tracked()
+def read_records(path: str) -> list:
+
+    """
+    Read the records in an organisations file written by extract_data.py
+
+    Parameters
+        - path: The organisations file, either a JSON array or NDJSON
+
+    """
+
+    with open(path) as f:
+        if f.read(1) == "[":
+            f.seek(0)
+            return json.load(f)
+
+        f.seek(0)
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def iter_records(path: str, chunk_size: int = 1 << 16) -> Iterator[dict]:
+
+    """
+    Yield the records in an organisations file written by extract_data.py one at
+    a time, reading the file chunk_size characters at a time, so that it's never
+    held in memory in full
+
+    Parameters
+        - path: The organisations file, either a JSON array or NDJSON
+        - chunk_size: The number of characters to read at a time
+
+    """
+
+    decoder = json.JSONDecoder()
+
+    with open(path) as f:
+        buffer = f.read(chunk_size)
+        while buffer and not buffer.strip():
+            more = f.read(chunk_size)
+            if not more:
+                break
+            buffer += more
+
+        start = len(buffer) - len(buffer.lstrip())
+
+        if not buffer[start:start + 1] == "[":
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        start += 1
+        eof = False
+
+        while True:
+            # Skip the whitespace and comma before the next record
+            while start < len(buffer) and buffer[start] in " \t\r\n,":
+                start += 1
+
+            if start == len(buffer) and not eof:
+                buffer, start = f.read(chunk_size), 0
+                eof = not buffer
+                continue
+
+            if buffer[start:start + 1] == "]":
+                return
+
+            try:
+                record, end = decoder.raw_decode(buffer, start)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = len(buffer)
+
+            # A record running up to the end of the buffer may be cut short, so read more
+            if end == len(buffer) and not eof:
+                more = f.read(chunk_size)
+                eof = not more
+                buffer, start = buffer[start:] + more, 0
+                continue
+
+            yield record
+            start = end
+
+
+def iter_pages(path: str, page_size: int = 20) -> Iterator[tuple]:
+
+    """
+    Yield (page_number, records) for an organisations file written by
+    extract_data.py, page_size records at a time, in the same form as
+    api_operations.CheckpointStore.iter_pages()
+
+    Parameters
+        - path: The organisations file, either a JSON array or NDJSON
+        - page_size: The number of records per page
+
+    """
+
+    page_number, records = 1, []
+
+    for record in iter_records(path):
+        records.append(record)
+
+        if len(records) == page_size:
+            yield page_number, records
+            page_number, records = page_number + 1, []
+
+    if records:
+        yield page_number, records
+
+
+def link_slug(link: dict) -> str:
+
+    """
+    Return the slug of the organisation a parent/child/superseded/superseding
+    link points to
+    E.g., {'id': 'https://www.gov.uk/api/organisations/ministry-of-justice', ...} -> 'ministry-of-justice'
+
+    Parameters
+        - link: A link, as held in e.g. the 'child_organisations' list of a record
+
+    """
+
+    return link["id"].replace(API_PREFIX, "")
@@ -0,0 +1,184 @@
+# %%
+from typing import Iterable, Optional
+
+import pandas as pd
+
+from org_graph import link_slug
+
+# %%
+# Resolution of organisations to their current successors, following supersession links
+
+
+class Lineage:
+
+    """
+    Directed graph of supersession between organisations, with an edge from each
+    organisation to each organisation that superseded it, built from both the
+    'superseding_organisations' and 'superseded_organisations' links
+
+    resolve() follows the edges to the organisations that haven't themselves been
+    superseded. This covers renames (one successor), splits (several successors)
+    and merges (several organisations resolving to the same successor). Answers
+    are memoised, so resolving every organisation visits each edge once
+
+    Parameters
+        - records: Organisation records, as returned by the API
+
+    """
+
+    def __init__(self, records: Iterable[dict]):
+        self.successors = {}
+        self.attributes = {}
+
+        for record in records:
+            slug = record["details"]["slug"]
+            self.attributes[slug] = {
+                "analytics_identifier": record["analytics_identifier"],
+                "title": record["title"],
+                "govuk_status": record["details"]["govuk_status"],
+                "govuk_closed_status": record["details"]["govuk_closed_status"],
+            }
+            self.successors.setdefault(slug, set()).update(
+                link_slug(link) for link in record["superseding_organisations"]
+            )
+            for link in record["superseded_organisations"]:
+                self.successors.setdefault(link_slug(link), set()).add(slug)
+
+        # Organisations linked to but not themselves in the data
+        for successors in list(self.successors.values()):
+            for successor in successors:
+                self.successors.setdefault(successor, set())
+
+        self._resolved = {}
+
+    def __contains__(self, slug: str) -> bool:
+        return slug in self.successors
+
+    def resolve(self, slug: str) -> frozenset:
+
+        """
+        Return the slugs of the organisations that an organisation has ultimately
+        become: itself if it hasn't been superseded, otherwise the resolved
+        successors of each organisation that superseded it
+        E.g., a department renamed twice resolves to its latest name; one split in
+        two resolves to both parts
+
+        Where supersession links form a cycle, organisations in the cycle that have
+        no way out of it resolve to themselves
+
+        Parameters
+            - slug: The organisation's slug
+
+        """
+
+        resolved, _ = self._resolve(slug, set())
+
+        return frozenset(resolved or {slug})
+
+    def _resolve(self, slug: str, in_progress: set) -> tuple:
+
+        """
+        Return the resolved successors of an organisation, ignoring paths that
+        lead back to organisations in in_progress, and whether the answer is
+        complete - i.e. no such path was ignored - and so safe to memoise
+
+        Parameters
+            - slug: The organisation's slug
+            - in_progress: The organisations currently being resolved
+
+        """
+
+        if slug in self._resolved:
+            return self._resolved[slug], True
+
+        successors = self.successors.get(slug, set())
+        if not successors:
+            resolved = frozenset({slug})
+            self._resolved[slug] = resolved
+            return resolved, True
+
+        in_progress.add(slug)
+        resolved = set()
+        complete = True
+
+        for successor in successors:
+            if successor in in_progress:
+                complete = False
+                continue
+
+            successor_resolved, successor_complete = self._resolve(successor, in_progress)
+            resolved |= successor_resolved
+            complete &= successor_complete
+
+        in_progress.discard(slug)
+
+        resolved = frozenset(resolved)
+        if complete:
+            self._resolved[slug] = resolved
+
+        return resolved, complete
+
+    def successor_table(self, slugs: Optional[Iterable[str]] = None) -> pd.DataFrame:
+
+        """
+        Return a lookup table with a row for each organisation and each of its
+        current successors (the organisation itself if it hasn't been
+        superseded), with the identifiers and status of both, and the number of
+        successors the organisation has (more than one for splits)
+
+        Parameters
+            - slugs: The organisations to include. Defaults to all of them
+
+        """
+
+        rows = [
+            (slug, successor)
+            for slug in (self.successors if slugs is None else slugs)
+            for successor in sorted(self.resolve(slug))
+        ]
+        df = pd.DataFrame(rows, columns=["slug", "successor_slug"])
+
+        df_attributes = pd.DataFrame.from_dict(self.attributes, orient="index")
+        df = df.merge(
+            df_attributes[["analytics_identifier"]],
+            how="left", left_on="slug", right_index=True
+        ).merge(
+            df_attributes[["analytics_identifier", "title", "govuk_status"]].add_prefix("successor_"),
+            how="left", left_on="successor_slug", right_index=True
+        )
+
+        df["successor_count"] = df.groupby("slug")["successor_slug"].transform("size")
+
+        return df.reset_index(drop=True)
+
+
+def remap(df: pd.DataFrame, col: str, lookup: pd.DataFrame, key: str = "slug") -> pd.DataFrame:
+
+    """
+    Add the current successors of the organisations in a column of a DataFrame,
+    in a single join against a lookup table from Lineage.successor_table()
+    Rows for organisations that split are repeated, once per successor. Rows for
+    organisations not in the lookup table, or with no value in col, are kept,
+    with no successor
+
+    Parameters
+        - df: The DataFrame in question, e.g. a historical dataset keyed on old slugs
+        - col: The column of df holding organisations
+        - lookup: The lookup table, from Lineage.successor_table()
+        - key: The lookup column that col holds, e.g. 'slug' or 'analytics_identifier'
+
+    """
+
+    successor_cols = [c for c in lookup.columns if c.startswith("successor_")]
+    lookup = lookup[[key] + successor_cols].drop_duplicates()
+
+    # NB: pandas matches nulls to each other when merging, and the lookup has null keys for
+    # organisations linked to but not in the data, e.g. with key='analytics_identifier'
+    lookup = lookup[lookup[key].notna()]
+
+    df_remapped = df.merge(lookup, how="left", left_on=col, right_on=key, validate="m:m")
+
+    if key != col:
+        df_remapped = df_remapped.drop(columns=[key])
+
+    return df_remapped
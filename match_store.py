@@ -0,0 +1,192 @@
+# %%
+"""
+    Purpose
+        Store fuzzy match scores and manual match decisions between runs
+    Inputs
+        - SQLite: The match store (matches.db by default)
+    Outputs
+        - SQLite: The match store
+    Parameters
+        None
+    Notes
+        - Command-line usage:
+            python match_store.py confirm "HM Treasury" "Her Majesty's Treasury"
+            python match_store.py reject "Office for Students" "Office for Standards in Education"
+            python match_store.py clear "Office for Students" "Office for Standards in Education"
+            python match_store.py list
+        - Names are normalised with matching.normalise_name() before being stored, so
+          overrides apply to every spelling that normalises to the same thing
+"""
+
+import argparse
+import datetime
+import os
+import sqlite3
+from typing import Iterable, Optional
+
+import pandas as pd
+
+from matching import normalise_name
+
+# %%
+# Match store
+
+
+class MatchStore:
+
+    """
+    SQLite store of the scores of pairs of normalised names, keyed on the scorer
+    that produced them, and of manual decisions that a pair does or doesn't
+    match. Passed to matching.match_names(), so that pairs are only scored the
+    first time they're seen and manual decisions are applied
+
+    Parameters
+        - path: The SQLite database file
+
+    """
+
+    def __init__(self, path: str = "matches.db"):
+        self.path = path
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.con = sqlite3.connect(path)
+
+        self.con.executescript("""
+            CREATE TABLE IF NOT EXISTS scores (
+                left_norm TEXT NOT NULL,
+                right_norm TEXT NOT NULL,
+                scorer_version TEXT NOT NULL,
+                score REAL NOT NULL,
+                PRIMARY KEY (left_norm, right_norm, scorer_version)
+            );
+            CREATE TABLE IF NOT EXISTS overrides (
+                left_norm TEXT NOT NULL,
+                right_norm TEXT NOT NULL,
+                decision TEXT NOT NULL CHECK (decision IN ('match', 'reject')),
+                decided_at TEXT NOT NULL,
+                PRIMARY KEY (left_norm, right_norm)
+            );
+        """)
+
+    def close(self) -> None:
+        self.con.close()
+
+    def scores(self, scorer_version: str) -> dict:
+
+        """
+        Return the stored scores from a scorer, keyed on (left, right) normalised names
+
+        Parameters
+            - scorer_version: The scorer, e.g. matching.SCORER_VERSION
+
+        """
+
+        return {
+            (left_norm, right_norm): score
+            for left_norm, right_norm, score in self.con.execute(
+                "SELECT left_norm, right_norm, score FROM scores WHERE scorer_version = ?",
+                (scorer_version,)
+            )
+        }
+
+    def save_scores(self, scores: Iterable[tuple], scorer_version: str) -> None:
+
+        """
+        Store scores
+
+        Parameters
+            - scores: ((left, right), score) for pairs of normalised names
+            - scorer_version: The scorer that produced them
+
+        """
+
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)",
+                ((left_norm, right_norm, scorer_version, score) for (left_norm, right_norm), score in scores)
+            )
+
+    def overrides(self) -> dict:
+
+        """
+        Return the manual decisions, 'match' or 'reject', keyed on (left, right)
+        normalised names
+        """
+
+        return {
+            (left_norm, right_norm): decision
+            for left_norm, right_norm, decision in self.con.execute(
+                "SELECT left_norm, right_norm, decision FROM overrides"
+            )
+        }
+
+    def set_override(self, left: str, right: str, decision: Optional[str]) -> None:
+
+        """
+        Record that two names do ('match') or don't ('reject') refer to the same
+        organisation, or remove a previous decision (None)
+
+        Parameters
+            - left: The name from the left-hand list
+            - right: The name from the right-hand list
+            - decision: 'match', 'reject' or None
+
+        """
+
+        pair = (normalise_name(left), normalise_name(right))
+
+        with self.con:
+            if decision is None:
+                self.con.execute("DELETE FROM overrides WHERE left_norm = ? AND right_norm = ?", pair)
+            else:
+                self.con.execute(
+                    "INSERT OR REPLACE INTO overrides VALUES (?, ?, ?, ?)",
+                    (*pair, decision, datetime.datetime.now().isoformat(timespec="seconds"))
+                )
+
+    def load_overrides(self) -> pd.DataFrame:
+
+        """
+        Return the manual decisions as a DataFrame
+        """
+
+        return pd.read_sql_query(
+            "SELECT left_norm, right_norm, decision, decided_at FROM overrides ORDER BY left_norm, right_norm",
+            self.con
+        )
+
+
+# %%
+# Command-line interface
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Record manual fuzzy match decisions")
+    parser.add_argument("--store", default="matches.db", help="SQLite match store (default: matches.db)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command, help_text in [
+        ("confirm", "Record that two names match"),
+        ("reject", "Record that two names don't match"),
+        ("clear", "Remove a previous decision"),
+    ]:
+        command_parser = subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument("left", help="Name from the left-hand list, e.g. a GOV.UK title")
+        command_parser.add_argument("right", help="Name from the right-hand list")
+
+    subparsers.add_parser("list", help="List manual decisions")
+
+    args = parser.parse_args(argv)
+    store = MatchStore(args.store)
+
+    if args.command == "list":
+        print(store.load_overrides().to_string(index=False))
+    else:
+        decision = {"confirm": "match", "reject": "reject", "clear": None}[args.command]
+        store.set_override(args.left, args.right, decision)
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+# %%
+import difflib
+import os
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from rapidfuzz import fuzz
+except ImportError:
+    fuzz = None
+
+# %%
+# Fuzzy matching of organisation names, e.g. GOV.UK titles against external lists
+
+# Words replaced before matching, so that e.g. 'Dept. for Transport' matches
+# 'Department for Transport'
+ABBREVIATIONS = {
+    "dept": "department",
+    "depts": "departments",
+    "govt": "government",
+    "natl": "national",
+    "intl": "international",
+    "assoc": "association",
+    "comm": "commission",
+    "cttee": "committee",
+    "ctte": "committee",
+    "st": "saint",
+    "uk": "united kingdom",
+    "gb": "great britain",
+}
+
+# Phrases replaced before matching, so that names from before and after 2022 match
+PHRASES = {
+    "her majestys": "hm",
+    "his majestys": "hm",
+    "her majesty": "hm",
+    "his majesty": "hm",
+}
+
+STOP_WORDS = {"the", "of"}
+
+# Identifies the scorer in use, as scores from different scorers aren't comparable
+SCORER_VERSION = f"{'rapidfuzz' if fuzz is not None else 'difflib'}-token-sort-1"
+
+
+def normalise_name(name: str) -> str:
+
+    """
+    Normalise an organisation name for matching: lower case, accents removed,
+    '&' read as 'and', punctuation stripped, abbreviations expanded and
+    'the'/'of' dropped
+    E.g., 'The Dept. for Culture, Media & Sport' -> 'department for culture media and sport'
+
+    Parameters
+        - name: The name in question
+
+    """
+
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    name = name.lower().replace("&", " and ").replace("'", "")
+    name = re.sub(r"[^a-z0-9]+", " ", name)
+
+    for phrase, replacement in PHRASES.items():
+        name = re.sub(rf"\b{phrase}\b", replacement, name)
+
+    words = [ABBREVIATIONS.get(word, word) for word in name.split()]
+
+    return " ".join(word for word in words if word not in STOP_WORDS)
+
+
+def score(left: str, right: str) -> float:
+
+    """
+    Return the similarity of two normalised names, from 0 to 100, ignoring word
+    order. Uses rapidfuzz if it's installed, otherwise difflib
+
+    Parameters
+        - left: The first name
+        - right: The second name
+
+    """
+
+    if fuzz is not None:
+        return fuzz.token_sort_ratio(left, right)
+
+    return 100 * difflib.SequenceMatcher(
+        None, " ".join(sorted(left.split())), " ".join(sorted(right.split()))
+    ).ratio()
+
+
+def _ngrams(name: str, n: int) -> set:
+    padded = f" {name} "
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+
+class NGramIndex:
+
+    """
+    Inverted index from character n-grams to the names containing them, used to
+    pick out the few names worth scoring against a query rather than scoring
+    every pair
+
+    Parameters
+        - names: The normalised names to index
+        - n: The length of n-gram to index on
+
+    """
+
+    def __init__(self, names: Iterable[str], n: int = 3):
+        self.names = list(names)
+        self.n = n
+
+        postings = {}
+        self.gram_counts = np.zeros(len(self.names), dtype=np.int32)
+        for i, name in enumerate(self.names):
+            grams = _ngrams(name, n)
+            self.gram_counts[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def candidates(self, name: str, min_overlap: float = 0.4, max_candidates: int = 50) -> np.ndarray:
+
+        """
+        Return the positions of the indexed names sharing enough n-grams with a
+        name to be worth scoring, most shared first
+
+        Parameters
+            - name: The normalised name in question
+            - min_overlap: The minimum Dice coefficient of the two sets of n-grams
+            - max_candidates: The maximum number of candidates to return
+
+        """
+
+        grams = _ngrams(name, self.n)
+        hits = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not hits:
+            return np.array([], dtype=np.int32)
+
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.names))
+        overlap = 2 * shared / (len(grams) + self.gram_counts)
+
+        candidates = np.flatnonzero(overlap >= min_overlap)
+        candidates = candidates[np.argsort(-overlap[candidates], kind="stable")]
+
+        return candidates[:max_candidates]
+
+
+# Set in each worker process by _init_worker(), so these are sent to each worker once
+_worker_state = {}
+
+
+def _init_worker(index: NGramIndex, known: dict, rejected: set) -> None:
+    _worker_state.update(index=index, known=known, rejected=rejected)
+
+
+def _match_chunk(
+        names: list,
+        score_cutoff: float,
+        limit: int,
+        min_overlap: float,
+        index: Optional[NGramIndex] = None,
+        known: Optional[dict] = None,
+        rejected: Optional[set] = None
+        ) -> tuple:
+
+    """
+    Return (left position, right position, score) for the best-scoring matches of
+    each of a chunk of normalised names, and ((left, right), score) for each pair
+    that had to be scored, i.e. wasn't in known
+
+    Parameters
+        - names: (position, normalised name) pairs
+        - score_cutoff: The minimum score for a match
+        - limit: The maximum number of matches per name
+        - min_overlap: Passed to NGramIndex.candidates()
+        - index: The index to match against. Defaults to the worker's index
+        - known: Scores already worked out, keyed on (left, right) normalised names.
+          Defaults to the worker's
+        - rejected: (left, right) normalised name pairs never to match. Defaults to
+          the worker's
+
+    """
+
+    index = index or _worker_state["index"]
+    known = _worker_state.get("known", {}) if known is None else known
+    rejected = _worker_state.get("rejected", set()) if rejected is None else rejected
+
+    matches = []
+    scores = []
+
+    for position, name in names:
+        scored = []
+        for candidate in index.candidates(name, min_overlap=min_overlap):
+            pair = (name, index.names[candidate])
+            if pair in rejected:
+                continue
+
+            value = known.get(pair)
+            if value is None:
+                value = score(*pair)
+                scores.append((pair, value))
+
+            if value >= score_cutoff:
+                scored.append((value, candidate))
+
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        matches += [(position, candidate, value) for value, candidate in scored[:limit]]
+
+    return matches, scores
+
+
+def match_names(
+        left: Iterable[str],
+        right: Iterable[str],
+        score_cutoff: float = 90,
+        limit: int = 3,
+        min_overlap: float = 0.4,
+        processes: Optional[int] = None,
+        chunksize: int = 500,
+        store=None
+        ) -> pd.DataFrame:
+
+    """
+    Return ranked candidate matches in right for each name in left, with scores
+
+    Names are normalised with normalise_name(), right is indexed on character
+    trigrams, and only the names in right sharing enough trigrams with each name
+    in left are scored. Names that normalise to the same thing score 100
+
+    Given a match_store.MatchStore, scores are read from it where it has them and
+    saved to it where it doesn't, pairs manually rejected in it are left out, and
+    pairs manually confirmed in it are ranked first
+
+    Returns a DataFrame with columns left, right, left_norm, right_norm, score,
+    rank (1 for each name's best match) and decision ('manual' for confirmed
+    pairs, otherwise 'auto'), with no rows for names with no match. Where several
+    names in right normalise to the same thing, only the first of them is returned
+
+    Parameters
+        - left: The names to find matches for
+        - right: The names to match against
+        - score_cutoff: The minimum score for a match, from 0 to 100
+        - limit: The maximum number of matches per name
+        - min_overlap: The minimum share of trigrams two names must have in common
+          to be scored. Lower values find more distant matches, more slowly
+        - processes: The number of worker processes to score in. Defaults to
+          scoring in this process. NB: Scripts passing this should guard their
+          top-level code with if __name__ == "__main__"
+        - chunksize: The number of names in left sent to a worker at a time
+        - store: A match_store.MatchStore to cache scores in and read overrides
+          from, if any
+
+    """
+
+    left, right = list(left), list(right)
+    left_norm = [normalise_name(name) for name in left]
+    right_norm = [normalise_name(name) for name in right]
+
+    # Each distinct normalised name is only matched once
+    distinct = list(dict.fromkeys(left_norm))
+    index = NGramIndex(dict.fromkeys(right_norm))
+
+    if store is not None:
+        known = store.scores(SCORER_VERSION)
+        overrides = store.overrides()
+    else:
+        known, overrides = {}, {}
+    rejected = {pair for pair, decision in overrides.items() if decision == "reject"}
+
+    items = list(enumerate(distinct))
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+
+    if processes and len(chunks) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(processes, len(chunks), os.cpu_count() or 1),
+            initializer=_init_worker,
+            initargs=(index, known, rejected)
+        ) as executor:
+            results = list(executor.map(
+                _match_chunk, chunks,
+                [score_cutoff] * len(chunks), [limit] * len(chunks), [min_overlap] * len(chunks)
+            ))
+    else:
+        results = [
+            _match_chunk(chunk, score_cutoff, limit, min_overlap, index=index, known=known, rejected=rejected)
+            for chunk in chunks
+        ]
+
+    matches = [match for chunk_matches, _ in results for match in chunk_matches]
+    scores = [item for _, chunk_scores in results for item in chunk_scores]
+
+    if store is not None and scores:
+        store.save_scores(scores, SCORER_VERSION)
+
+    df_matches = pd.DataFrame(matches, columns=["distinct_position", "index_position", "score"])
+    df_matches["left_norm"] = np.array(distinct, dtype=object)[df_matches["distinct_position"].to_numpy(dtype=int)]
+    df_matches["right_norm"] = np.array(index.names, dtype=object)[df_matches["index_position"].to_numpy(dtype=int)]
+    df_matches["decision"] = "auto"
+
+    # Manually confirmed pairs come first, whatever they score
+    positions = {name: position for position, name in items}
+    index_names = set(index.names)
+    confirmed = [
+        (positions[left_name], left_name, right_name)
+        for (left_name, right_name), decision in overrides.items()
+        if decision == "match" and left_name in positions and right_name in index_names
+    ]
+    if confirmed:
+        df_confirmed = pd.DataFrame(confirmed, columns=["distinct_position", "left_norm", "right_norm"])
+        df_confirmed["score"] = [known[pair] if pair in known else score(*pair) for pair in zip(df_confirmed["left_norm"], df_confirmed["right_norm"])]
+        df_confirmed["decision"] = "manual"
+
+        df_matches = pd.concat([df_confirmed, df_matches], ignore_index=True)
+        df_matches = df_matches.drop_duplicates(["left_norm", "right_norm"])
+        df_matches = df_matches.sort_values(
+            ["distinct_position", "decision", "score"], ascending=[True, False, False], kind="stable"
+        )
+        df_matches = df_matches.groupby("distinct_position").head(limit)
+
+    df_matches["rank"] = df_matches.groupby("distinct_position").cumcount() + 1
+
+    # Expand back out to the original names
+    df_left = pd.DataFrame({"left": left, "left_norm": left_norm}).drop_duplicates()
+    # NB: Only one name in right is kept per normalised name, so that limit holds
+    # per name in left
+    df_right = pd.DataFrame({"right": right, "right_norm": right_norm}).drop_duplicates("right_norm")
+
+    df_matches = df_left.merge(df_matches, on="left_norm").merge(df_right, on="right_norm")
+
+    columns = ["left", "right", "left_norm", "right_norm", "score", "rank", "decision"]
+
+    return df_matches[columns].sort_values(["left", "rank", "right"], ignore_index=True)
+
+
+def fuzzy_merge(
+        df_left: pd.DataFrame,
+        df_right: pd.DataFrame,
+        column_left: str,
+        column_right: str,
+        score_cutoff: float = 90,
+        drop_na: bool = True,
+        **kwargs
+        ) -> pd.DataFrame:
+
+    """
+    Merge two DataFrames on the best fuzzy match between two name columns, with the
+    match score in a 'match_score' column
+
+    Parameters
+        - df_left: The left DataFrame
+        - df_right: The right DataFrame
+        - column_left: The column of df_left holding names
+        - column_right: The column of df_right holding names
+        - score_cutoff: The minimum score for a match, from 0 to 100
+        - drop_na: Whether to drop rows of df_left with no match
+        - kwargs: Passed to match_names()
+
+    """
+
+    df_matches = match_names(
+        df_left[column_left].dropna().unique(), df_right[column_right].dropna().unique(),
+        score_cutoff=score_cutoff, limit=1, **kwargs
+    )
+    df_matches = df_matches[["left", "right", "score"]].rename(columns={"score": "match_score"})
+
+    df_merge = df_left.merge(
+        df_matches, how="inner" if drop_na else "left", left_on=column_left, right_on="left"
+    ).drop(columns=["left"])
+
+    return df_merge.merge(
+        df_right, how="left", left_on="right", right_on=column_right, suffixes=("", "_right")
+    ).drop(columns=["right"])
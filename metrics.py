@@ -0,0 +1,314 @@
+# %%
+"""
+    Purpose
+        Record how long each step of the scripts takes, how many rows go in and out of
+        it, the peak memory use and any retries, and summarise the records
+    Inputs
+        - JSON lines: The file named by the METRICS_PATH environment variable
+    Outputs
+        - JSON lines: One record per step run, appended to METRICS_PATH if it is set
+        - Prometheus text format: Totals per script and step, with --prometheus
+    Parameters
+        None
+    Notes
+        - Command-line usage:
+            python metrics.py .cache/metrics.jsonl                (summary per script and step)
+            python metrics.py .cache/metrics.jsonl --last-run --prometheus metrics.prom
+        - Steps are recorded with track() or the tracked() decorator, e.g.:
+            with metrics.track("bulk_to_sql", rows_in=len(df), table=name) as metric:
+                ...
+                metric["rows_out"] = written
+        - Records are only written to a file if METRICS_PATH is set. Totals for the
+          current process are always kept, see totals()
+        - Records written by one run share a 'run' ID, taken from METRICS_RUN if it is
+          set (pipeline.py sets it for every stage) or else made up per process
+        - Peak RSS is for the whole process, as reported by resource.getrusage(), so
+          isn't available on Windows. 'rss_growth_bytes' is how far a step raised it
+"""
+
+import argparse
+import datetime
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# %%
+# Recording steps
+
+PATH_VARIABLE = "METRICS_PATH"
+RUN_VARIABLE = "METRICS_RUN"
+
+_lock = threading.Lock()
+_totals = {}
+
+_run = os.environ.get(RUN_VARIABLE) or (
+    f"{datetime.datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+)
+
+
+def peak_rss() -> Optional[int]:
+
+    """
+    Return the peak resident set size of this process so far, in bytes, or None
+    where resource isn't available
+    """
+
+    if resource is None:
+        return None
+
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def track(stage: str, rows_in: Optional[int] = None, **labels) -> Iterator[dict]:
+
+    """
+    Record a step, yielding its record so that the caller can fill in 'rows_out'
+    and 'retries', and set 'status' if the step failed without raising. The
+    record is emitted when the block exits, with 'status' 'error' if it raised
+
+    Parameters
+        - stage: The step's name, e.g. 'fetch_page'
+        - rows_in: The number of rows going into the step, if known
+        - labels: Details of this run of the step, e.g. page=3
+
+    """
+
+    metric = {
+        "run": _run,
+        "script": os.path.basename(sys.argv[0]) or "python",
+        "stage": stage,
+        "started_at": datetime.datetime.now().isoformat(timespec="milliseconds"),
+        "duration_s": None,
+        "rows_in": rows_in,
+        "rows_out": None,
+        "retries": 0,
+        "peak_rss_bytes": None,
+        "rss_growth_bytes": None,
+        "status": "ok",
+        "labels": labels,
+    }
+
+    rss_before = peak_rss()
+    start = time.perf_counter()
+
+    try:
+        yield metric
+    except BaseException:
+        metric["status"] = "error"
+        raise
+    finally:
+        metric["duration_s"] = round(time.perf_counter() - start, 6)
+        metric["peak_rss_bytes"] = peak_rss()
+        if rss_before is not None:
+            metric["rss_growth_bytes"] = metric["peak_rss_bytes"] - rss_before
+
+        emit(metric)
+
+
+def tracked(stage: Optional[str] = None, rows_in: Optional[str] = None):
+
+    """
+    Decorator recording each call of a function with track(). 'rows_out' is the
+    length of the return value, if it has one
+
+    Parameters
+        - stage: The step's name. Defaults to the function's name
+        - rows_in: The name of the argument whose length is the number of rows going in
+
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows = None
+            if rows_in is not None:
+                rows = len(signature.bind(*args, **kwargs).arguments[rows_in])
+
+            with track(stage or func.__name__, rows_in=rows) as metric:
+                result = func(*args, **kwargs)
+                if hasattr(result, "__len__"):
+                    metric["rows_out"] = len(result)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def emit(metric: dict) -> None:
+
+    """
+    Add a record to this process's totals and, if METRICS_PATH is set, append it
+    to that file as a line of JSON
+
+    Parameters
+        - metric: The record, as yielded by track()
+
+    """
+
+    line = json.dumps(metric, default=str) + "\n"
+    path = os.environ.get(PATH_VARIABLE)
+
+    with _lock:
+        _add(_totals, metric)
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a") as f:
+                f.write(line)
+
+
+def totals() -> dict:
+
+    """
+    Return the totals of the steps recorded in this process so far - see summarise()
+    """
+
+    with _lock:
+        return {key: dict(value) for key, value in _totals.items()}
+
+
+# %%
+# Summarising records
+
+
+def _add(summary: dict, metric: dict) -> None:
+    total = summary.setdefault((metric["script"], metric["stage"]), {
+        "runs": 0,
+        "failures": 0,
+        "duration_s": 0.0,
+        "max_duration_s": 0.0,
+        "rows_in": 0,
+        "rows_out": 0,
+        "retries": 0,
+        "peak_rss_bytes": 0,
+    })
+
+    total["runs"] += 1
+    total["failures"] += metric["status"] != "ok"
+    total["duration_s"] += metric["duration_s"]
+    total["max_duration_s"] = max(total["max_duration_s"], metric["duration_s"])
+    total["rows_in"] += metric["rows_in"] or 0
+    total["rows_out"] += metric["rows_out"] or 0
+    total["retries"] += metric["retries"]
+    total["peak_rss_bytes"] = max(total["peak_rss_bytes"], metric["peak_rss_bytes"] or 0)
+
+
+def read_metrics(path: str, last_run: bool = False) -> list:
+
+    """
+    Read the records in a metrics file
+
+    Parameters
+        - path: The file, as written via METRICS_PATH
+        - last_run: Whether to keep only the records of the last run in the file
+
+    """
+
+    with open(path) as f:
+        metrics = [json.loads(line) for line in f if line.strip()]
+
+    if last_run and metrics:
+        metrics = [metric for metric in metrics if metric["run"] == metrics[-1]["run"]]
+
+    return metrics
+
+
+def summarise(metrics: Iterable[dict]) -> dict:
+
+    """
+    Return totals per (script, step): the number of runs and failures, the total
+    and longest durations, the total rows in and out and retries, and the highest
+    peak RSS
+
+    Parameters
+        - metrics: Records, as yielded by track()
+
+    """
+
+    summary = {}
+    for metric in metrics:
+        _add(summary, metric)
+
+    return summary
+
+
+# Prometheus metric names, types and help text for each total
+PROMETHEUS_METRICS = [
+    ("runs", "orgs_stage_runs_total", "counter", "Number of times the step ran"),
+    ("failures", "orgs_stage_failures_total", "counter", "Number of times the step failed"),
+    ("duration_s", "orgs_stage_duration_seconds_total", "counter", "Total time spent in the step"),
+    ("max_duration_s", "orgs_stage_duration_seconds_max", "gauge", "Longest single run of the step"),
+    ("rows_in", "orgs_stage_rows_in_total", "counter", "Rows going into the step"),
+    ("rows_out", "orgs_stage_rows_out_total", "counter", "Rows coming out of the step"),
+    ("retries", "orgs_stage_retries_total", "counter", "Retries made by the step"),
+    ("peak_rss_bytes", "orgs_stage_peak_rss_bytes", "gauge", "Peak resident set size of the process after the step"),
+]
+
+
+def to_prometheus(summary: dict) -> str:
+
+    """
+    Return totals from summarise() or totals() in the Prometheus text format,
+    labelled by script and step
+
+    Parameters
+        - summary: The totals
+
+    """
+
+    lines = []
+    for key, name, kind, description in PROMETHEUS_METRICS:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        for (script, stage), total in sorted(summary.items()):
+            lines.append(f'{name}{{script="{script}",stage="{stage}"}} {total[key]:g}')
+
+    return "\n".join(lines) + "\n"
+
+
+# %%
+# Command-line interface
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Summarise the metrics recorded by the scripts")
+    parser.add_argument("path", nargs="?", default=".cache/metrics.jsonl", help="Metrics file (default: .cache/metrics.jsonl)")
+    parser.add_argument("--last-run", action="store_true", help="Summarise only the last run in the file")
+    parser.add_argument("--prometheus", metavar="PATH", help="Also write the totals in the Prometheus text format")
+
+    args = parser.parse_args(argv)
+
+    summary = summarise(read_metrics(args.path, last_run=args.last_run))
+
+    for (script, stage), total in sorted(summary.items(), key=lambda item: -item[1]["duration_s"]):
+        print(
+            f"{script:<22} {stage:<28} {total['runs']:>6} runs {total['duration_s']:>9.3f}s"
+            f" {total['rows_in']:>9} in {total['rows_out']:>9} out {total['retries']:>3} retries"
+            f" {total['failures']:>3} failed {total['peak_rss_bytes'] / 1e6:>8.1f}MB peak"
+        )
+
+    if args.prometheus:
+        with open(args.prometheus, "w") as f:
+            f.write(to_prometheus(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# %%
+"""
+    Purpose
+        Migrate the random UUIDs already stored in the database to the
+        deterministic UUIDs now derived from govuk_identifier
+    Inputs
+        - SQL: testing.govuk_orgs
+        - SQL: testing.orgs_sponsorship
+        - SQL: testing.orgs_sponsorship_closure, if it exists
+    Outputs
+        - SQL: testing.govuk_orgs
+            - id replaced by utils.org_uuid(govuk_identifier)
+        - SQL: testing.orgs_sponsorship
+            - parent_org_id and child_org_id replaced to match
+        - SQL: testing.orgs_sponsorship_closure
+            - ancestor_id and descendant_id replaced to match, so that orgs_parenthood.py's
+              incremental update keeps matching it against orgs_sponsorship
+    Parameters
+        None
+    Notes
+        - Only needs running once. Rerunning it changes nothing
+        - orgs_parenthood.py should be rerun afterwards so that orgs_sponsorship's
+          own IDs are also derived deterministically
+"""
+
+import os
+
+import pandas as pd
+from sqlalchemy import Uuid, inspect, text
+
+import ds_utils.database_operations as dbo
+import sql_operations
+import utils
+
+# %%
+# Create connection to database
+engine = dbo.connect_sql_db(
+    driver="pyodbc",
+    driver_version=os.environ["ODBC_DRIVER"],
+    dialect="mssql",
+    server=os.environ["ODBC_SERVER"],
+    database=os.environ["ODBC_DATABASE"],
+    authentication=os.environ["ODBC_AUTHENTICATION"],
+    username=os.environ["AZURE_CLIENT_ID"],
+    password=os.environ["AZURE_CLIENT_SECRET"],
+)
+
+# %%
+# Work out the new UUID for every organisation whose UUID is still random
+df_sql = pd.read_sql_table(
+    table_name='govuk_orgs',
+    con=engine,
+    schema='testing',
+    columns=['id', 'govuk_identifier']
+)
+
+df_map = pd.DataFrame({
+    'old_id': df_sql['id'],
+    'new_id': df_sql['govuk_identifier'].map(utils.org_uuid),
+})
+df_map = df_map[df_map['old_id'].astype(str) != df_map['new_id'].astype(str)]
+
+print(f"{len(df_map)} of {len(df_sql)} organisations need new UUIDs")
+
+# %%
+# Apply the new UUIDs to govuk_orgs, orgs_sponsorship and orgs_sponsorship_closure in a
+# single transaction
+columns = [
+    ('govuk_orgs', 'id'),
+    ('orgs_sponsorship', 'parent_org_id'),
+    ('orgs_sponsorship', 'child_org_id'),
+]
+if inspect(engine).has_table('orgs_sponsorship_closure', schema='testing'):
+    columns += [
+        ('orgs_sponsorship_closure', 'ancestor_id'),
+        ('orgs_sponsorship_closure', 'descendant_id'),
+    ]
+
+if len(df_map):
+    with engine.begin() as conn:
+        sql_operations.bulk_to_sql(
+            df_map,
+            con=conn,
+            name='govuk_orgs_id_map',
+            schema='testing',
+            if_exists='replace',
+            dtype={'old_id': Uuid, 'new_id': Uuid}
+        )
+
+        for table, col in columns:
+            result = conn.execute(text(f"""
+                UPDATE testing.{table}
+                SET {col} = (SELECT m.new_id FROM testing.govuk_orgs_id_map AS m WHERE m.old_id = testing.{table}.{col})
+                WHERE {col} IN (SELECT old_id FROM testing.govuk_orgs_id_map)
+            """))
+            print(f"Updated {result.rowcount} rows of {table}.{col}")
+
+        conn.execute(text("DROP TABLE testing.govuk_orgs_id_map"))
@@ -0,0 +1,97 @@
+# %%
+import hashlib
+import os
+from typing import Optional
+
+import pandas as pd
+
+# LIST_COLUMNS and read_records() are re-exported for existing callers
+from json_operations import LIST_COLUMNS, read_records  # noqa: F401
+import metrics
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+# %%
+# Functions to be used for reading organisations data into a flat DataFrame
+
+DATE_COLUMNS = ["updated_at", "closed_at"]
+
+
+@metrics.tracked(rows_in="records")
+def normalise_records(records: list) -> pd.DataFrame:
+
+    """
+    Flatten a list of organisation records into a DataFrame, with one column
+    per key of 'details' in place of the 'details' column itself, and the
+    date columns parsed as UTC datetimes
+    E.g., {'title': ..., 'details': {'slug': ...}} -> columns 'title', 'slug'
+
+    Parameters
+        - records: Organisation records, as returned by the API
+
+    """
+
+    df = pd.json_normalize(records, max_level=1)
+
+    # Match the column order of df.drop(columns=['details']) + df['details'].apply(pd.Series)
+    details_cols = [col for col in df.columns if col.startswith("details.")]
+    df = df[[col for col in df.columns if col not in details_cols] + details_cols]
+    df.columns = [col.removeprefix("details.") for col in df.columns]
+
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], utc=True, format="ISO8601")
+
+    return df
+
+
+@metrics.tracked()
+def load_organisations(path: str = "organisations.json", cache_path: Optional[str] = None) -> pd.DataFrame:
+
+    """
+    Read an organisations file into a flat DataFrame - see normalise_records()
+
+    If cache_path is given and pyarrow is installed, the DataFrame is cached as
+    Parquet alongside a hash of the source file, and read from the cache for as
+    long as the source file is unchanged
+
+    Parameters
+        - path: The organisations file, either a JSON array or NDJSON
+        - cache_path: The Parquet file to cache the DataFrame in, if any
+
+    """
+
+    if cache_path is None or pyarrow is None:
+        return normalise_records(read_records(path))
+
+    with open(path, "rb") as f:
+        source_hash = hashlib.sha256(f.read()).hexdigest()
+
+    hash_path = cache_path + ".sha256"
+
+    if os.path.exists(cache_path) and os.path.exists(hash_path):
+        with open(hash_path) as f:
+            if f.read() == source_hash:
+                df = pd.read_parquet(cache_path)
+
+                # Parquet hands list columns back as arrays of dicts
+                for col in LIST_COLUMNS:
+                    if col in df.columns:
+                        df[col] = df[col].map(list)
+
+                return df
+
+    df = normalise_records(read_records(path))
+
+    # Write via temporary files, as more than one script can be filling the cache at once
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    df.to_parquet(f"{cache_path}.{os.getpid()}.tmp", index=False)
+    os.replace(f"{cache_path}.{os.getpid()}.tmp", cache_path)
+    with open(f"{hash_path}.{os.getpid()}.tmp", "w") as f:
+        f.write(source_hash)
+    os.replace(f"{hash_path}.{os.getpid()}.tmp", hash_path)
+
+    return df
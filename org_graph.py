@@ -0,0 +1,523 @@
+# %%
+from collections import deque
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# API_PREFIX and link_slug() are re-exported for existing callers
+from json_operations import API_PREFIX, link_slug  # noqa: F401
+
+# %%
+# In-memory graph of parent/child relationships between organisations
+
+
+class OrgGraph:
+
+    """
+    Directed graph of organisations, with an edge from each parent organisation
+    to each of its child organisations
+
+    Organisations are identified by slug (though any hashable label, such as a
+    UUID, works just as well), and held internally as integer node IDs
+    with adjacency in compressed sparse row form: the children of node i are
+    child_targets[child_offsets[i]:child_offsets[i + 1]], and likewise for parents.
+    Strongly connected components and a topological order of them are computed up
+    front, so that transitive closures can be built bottom-up and cached. Cycles
+    are tolerated: organisations in a cycle are each other's ancestors and descendants
+
+    Parameters
+        - nodes: Slugs of the organisations in the graph
+        - edges: (parent slug, child slug) pairs. Edges to or from slugs not in
+          nodes are ignored
+
+    """
+
+    def __init__(self, nodes: Iterable[str], edges: Iterable[tuple]):
+        self.slugs = list(dict.fromkeys(nodes))
+        self.index = {slug: i for i, slug in enumerate(self.slugs)}
+
+        pairs = {
+            (self.index[parent], self.index[child])
+            for parent, child in edges
+            if parent in self.index and child in self.index
+        }
+        pairs = np.array(sorted(pairs), dtype=np.int32).reshape(-1, 2)
+
+        self.child_offsets, self.child_targets = _csr(pairs[:, 0], pairs[:, 1], len(self.slugs))
+        self.parent_offsets, self.parent_sources = _csr(pairs[:, 1], pairs[:, 0], len(self.slugs))
+
+        self.component, self.components = self._strongly_connected_components()
+        self.topological_order = np.array(
+            [node for component in reversed(self.components) for node in component],
+            dtype=np.int32
+        )
+        self.depths = self._depths()
+
+        # Closures by component. Descendants are cached from component 0 upwards,
+        # ancestors from the last component downwards
+        self._descendant_cache = []
+        self._ancestor_cache = []
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "OrgGraph":
+
+        """
+        Build the graph from organisation records, as returned by the API,
+        using both their 'parent_organisations' and 'child_organisations' links
+
+        Parameters
+            - records: Organisation records
+
+        """
+
+        records = list(records)
+        edges = []
+
+        for record in records:
+            slug = record["details"]["slug"]
+            edges += [(link_slug(link), slug) for link in record["parent_organisations"]]
+            edges += [(slug, link_slug(link)) for link in record["child_organisations"]]
+
+        return cls((record["details"]["slug"] for record in records), edges)
+
+    def __len__(self) -> int:
+        return len(self.slugs)
+
+    def __contains__(self, slug: str) -> bool:
+        return slug in self.index
+
+    def _children(self, node: int) -> np.ndarray:
+        return self.child_targets[self.child_offsets[node]:self.child_offsets[node + 1]]
+
+    def _parents(self, node: int) -> np.ndarray:
+        return self.parent_sources[self.parent_offsets[node]:self.parent_offsets[node + 1]]
+
+    def _strongly_connected_components(self) -> tuple:
+
+        """
+        Find strongly connected components with an iterative version of Tarjan's
+        algorithm. Components come out in reverse topological order, i.e.
+        children before parents
+
+        Returns an array mapping each node to its component, and the list of
+        components, each a list of nodes
+        """
+
+        n = len(self.slugs)
+        index = np.full(n, -1, dtype=np.int32)
+        lowlink = np.zeros(n, dtype=np.int32)
+        on_stack = np.zeros(n, dtype=bool)
+        component = np.full(n, -1, dtype=np.int32)
+        components = []
+        stack = []
+        counter = 0
+
+        for root in range(n):
+            if index[root] != -1:
+                continue
+
+            work = [(root, 0)]
+            while work:
+                node, i = work.pop()
+
+                if i == 0:
+                    index[node] = lowlink[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack[node] = True
+
+                children = self._children(node)
+                if i < len(children):
+                    work.append((node, i + 1))
+                    child = children[i]
+                    if index[child] == -1:
+                        work.append((int(child), 0))
+                    elif on_stack[child]:
+                        lowlink[node] = min(lowlink[node], index[child])
+                    continue
+
+                if lowlink[node] == index[node]:
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component[member] = len(components)
+                        members.append(member)
+                        if member == node:
+                            break
+                    components.append(members)
+
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+        return component, components
+
+    def _depths(self) -> np.ndarray:
+
+        """
+        Return the length of the shortest path to each node from an organisation
+        with no parents, or -1 for nodes that can't be reached from one
+        """
+
+        depths = np.full(len(self.slugs), -1, dtype=np.int32)
+        roots = np.flatnonzero(np.diff(self.parent_offsets) == 0)
+        depths[roots] = 0
+
+        queue = deque(roots.tolist())
+        while queue:
+            node = queue.popleft()
+            for child in self._children(node):
+                if depths[child] == -1:
+                    depths[child] = depths[node] + 1
+                    queue.append(child)
+
+        return depths
+
+    def _descendants(self, component: int) -> frozenset:
+
+        """
+        Return the nodes reachable from a component, including the component's
+        own members if it is a cycle
+
+        Tarjan's algorithm numbers every component after the components below
+        it, so closures are built bottom-up from component 0 and cached
+
+        Parameters
+            - component: The component in question
+
+        """
+
+        for c in range(len(self._descendant_cache), component + 1):
+            result = set(self.components[c]) if self.is_cyclic_component(c) else set()
+
+            for node in self.components[c]:
+                for child in self._children(node):
+                    child_component = self.component[child]
+                    if child_component != c:
+                        result.add(int(child))
+                        result |= self._descendant_cache[child_component]
+
+            self._descendant_cache.append(frozenset(result))
+
+        return self._descendant_cache[component]
+
+    def _ancestors(self, component: int) -> frozenset:
+
+        """
+        Return the nodes that can reach a component, including the component's
+        own members if it is a cycle
+
+        Closures are built top-down from the last component and cached
+
+        Parameters
+            - component: The component in question
+
+        """
+
+        for c in range(len(self.components) - 1 - len(self._ancestor_cache), component - 1, -1):
+            result = set(self.components[c]) if self.is_cyclic_component(c) else set()
+
+            for node in self.components[c]:
+                for parent in self._parents(node):
+                    parent_component = self.component[parent]
+                    if parent_component != c:
+                        result.add(int(parent))
+                        result |= self._ancestor_cache[len(self.components) - 1 - parent_component]
+
+            self._ancestor_cache.append(frozenset(result))
+
+        return self._ancestor_cache[len(self.components) - 1 - component]
+
+    def build_closures(self) -> None:
+
+        """
+        Compute and cache every transitive closure up front, so that later
+        queries are lookups
+        """
+
+        self._descendants(len(self.components) - 1)
+        self._ancestors(0)
+
+    def is_cyclic_component(self, component: int) -> bool:
+
+        """
+        Whether a component is a cycle, i.e. has more than one member or a
+        member that is its own child
+
+        Parameters
+            - component: The component in question
+
+        """
+
+        members = self.components[component]
+        return len(members) > 1 or members[0] in self._children(members[0])
+
+    def cycles(self) -> list:
+
+        """
+        Return each group of organisations that are linked in a cycle, as lists of slugs
+        """
+
+        return [
+            [self.slugs[node] for node in self.components[component]]
+            for component in range(len(self.components))
+            if self.is_cyclic_component(component)
+        ]
+
+    def children(self, slug: str) -> list:
+
+        """
+        Return the slugs of an organisation's direct child organisations
+
+        Parameters
+            - slug: The organisation's slug
+
+        """
+
+        return [self.slugs[node] for node in self._children(self.index[slug])]
+
+    def parents(self, slug: str) -> list:
+
+        """
+        Return the slugs of an organisation's direct parent organisations
+
+        Parameters
+            - slug: The organisation's slug
+
+        """
+
+        return [self.slugs[node] for node in self._parents(self.index[slug])]
+
+    def descendants(self, slug: str) -> set:
+
+        """
+        Return the slugs of every organisation under an organisation, transitively
+
+        Parameters
+            - slug: The organisation's slug
+
+        """
+
+        return {self.slugs[node] for node in self._descendants(self.component[self.index[slug]])}
+
+    def ancestors(self, slug: str) -> set:
+
+        """
+        Return the slugs of every organisation above an organisation, transitively
+
+        Parameters
+            - slug: The organisation's slug
+
+        """
+
+        return {self.slugs[node] for node in self._ancestors(self.component[self.index[slug]])}
+
+    def is_descendant(self, slug: str, ancestor: str) -> bool:
+
+        """
+        Whether an organisation is under another, transitively
+
+        Parameters
+            - slug: The organisation that might be a descendant
+            - ancestor: The organisation that might be an ancestor
+
+        """
+
+        return self.index[slug] in self._descendants(self.component[self.index[ancestor]])
+
+    def subtree(self, slug: str) -> list:
+
+        """
+        Return the slugs of an organisation and every organisation under it, in
+        topological order (parents before children)
+
+        Parameters
+            - slug: The organisation's slug
+
+        """
+
+        node = self.index[slug]
+        members = self._descendants(self.component[node]) | {node}
+
+        return [self.slugs[n] for n in self.topological_order if n in members]
+
+    def depth(self, slug: str) -> Optional[int]:
+
+        """
+        Return the number of levels between an organisation and the nearest
+        organisation above it with no parents, or None if it is in a cycle that
+        can't be reached from one
+        E.g., 0 for a ministerial department, 1 for one of its agencies
+
+        Parameters
+            - slug: The organisation's slug
+
+        """
+
+        depth = self.depths[self.index[slug]]
+
+        return None if depth == -1 else int(depth)
+
+    def lowest_common_ancestors(self, slug_a: str, slug_b: str) -> list:
+
+        """
+        Return the lowest organisations that both organisations are under (or
+        are), i.e. those common ancestors with no other common ancestor below
+        them. There may be more than one, as organisations can have several
+        parents
+
+        Parameters
+            - slug_a: The first organisation's slug
+            - slug_b: The second organisation's slug
+
+        """
+
+        node_a, node_b = self.index[slug_a], self.index[slug_b]
+        common = (
+            (self._ancestors(self.component[node_a]) | {node_a}) &
+            (self._ancestors(self.component[node_b]) | {node_b})
+        )
+
+        lowest = [
+            node for node in common
+            if not (self._descendants(self.component[node]) - {node}) & common
+        ]
+
+        return sorted(self.slugs[node] for node in lowest)
+
+    def edges(self) -> set:
+
+        """
+        Return every (parent slug, child slug) pair in the graph
+        """
+
+        return {
+            (self.slugs[parent], self.slugs[child])
+            for parent in range(len(self.slugs))
+            for child in self._children(parent)
+        }
+
+    def closure_rows(self, slugs: Optional[Iterable[str]] = None) -> list:
+
+        """
+        Return (ancestor, descendant, depth) rows for every organisation and each
+        organisation under it, transitively, where depth is the number of levels
+        between them. Each organisation is also paired with itself at depth 0
+
+        Parameters
+            - slugs: The ancestors to return rows for. Defaults to every organisation
+
+        """
+
+        rows = []
+
+        for slug in (self.slugs if slugs is None else slugs):
+            node = self.index[slug]
+            distances = {node: 0}
+            queue = deque([node])
+
+            # Breadth-first, so the first path found to each organisation is the shortest
+            while queue:
+                current = queue.popleft()
+                for child in self._children(current):
+                    child = int(child)
+                    if child not in distances:
+                        distances[child] = distances[current] + 1
+                        queue.append(child)
+
+            rows += [(slug, self.slugs[descendant], depth) for descendant, depth in distances.items()]
+
+        return rows
+
+
+# %%
+# Functions to be used for maintaining a closure table of the graph
+
+
+def closure_table(graph: OrgGraph, slugs: Optional[Iterable[str]] = None) -> pd.DataFrame:
+
+    """
+    Return the graph's closure table, with ancestor_id, descendant_id and depth
+    columns - see OrgGraph.closure_rows()
+
+    Parameters
+        - graph: The graph in question
+        - slugs: The ancestors to return rows for. Defaults to every organisation
+
+    """
+
+    return pd.DataFrame(
+        graph.closure_rows(slugs),
+        columns=["ancestor_id", "descendant_id", "depth"]
+    ).astype({"depth": "int32"})
+
+
+def affected_ancestors(old_graph: OrgGraph, new_graph: OrgGraph) -> set:
+
+    """
+    Return the organisations whose closure rows may differ between two versions
+    of the graph: organisations added or removed, and the parent of every edge
+    added or removed, along with all of its ancestors in either version
+
+    Parameters
+        - old_graph: The previous version of the graph
+        - new_graph: The current version of the graph
+
+    """
+
+    affected = set(old_graph.slugs).symmetric_difference(new_graph.slugs)
+
+    for parent, _ in old_graph.edges().symmetric_difference(new_graph.edges()):
+        affected.add(parent)
+        for graph in (old_graph, new_graph):
+            if parent in graph:
+                affected |= graph.ancestors(parent)
+
+    return affected
+
+
+def update_closure_table(closure: pd.DataFrame, old_graph: OrgGraph, new_graph: OrgGraph) -> tuple:
+
+    """
+    Bring a closure table built from old_graph up to date with new_graph,
+    recomputing rows only for the organisations affected by the changes
+
+    Returns the updated closure table, and the set of affected organisations,
+    whose rows (as ancestor) are the only ones to have been replaced
+
+    Parameters
+        - closure: The closure table built from old_graph
+        - old_graph: The previous version of the graph
+        - new_graph: The current version of the graph
+
+    """
+
+    affected = affected_ancestors(old_graph, new_graph)
+
+    closure = pd.concat([
+        closure[~closure["ancestor_id"].isin(affected)],
+        closure_table(new_graph, [slug for slug in new_graph.slugs if slug in affected]),
+    ], ignore_index=True)
+
+    return closure, affected
+
+
+def _csr(sources: np.ndarray, targets: np.ndarray, n: int) -> tuple:
+
+    """
+    Return (offsets, targets) arrays holding each source's targets contiguously
+
+    Parameters
+        - sources: The source node of each edge
+        - targets: The target node of each edge
+        - n: The number of nodes
+
+    """
+
+    order = np.argsort(sources, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.int32)
+    np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+
+    return offsets, targets[order].astype(np.int32)
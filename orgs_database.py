@@ -1,21 +1,26 @@
 # %%
-import pandas as pd
+import datetime
 import os
-import uuid
 from sqlalchemy import NVARCHAR, Uuid
 from sqlalchemy.dialects.mssql import DATE
 import ds_utils.database_operations as dbo
+import pandas as pd
+import normalise
+import rules
+import scd
+from snapshot_store import SnapshotStore
+import sql_operations
+import utils
 
 # %%
-# Read in data
+# Read in data, with "details" column flattened
 
-df = pd.read_json('organisations.json')
+df_edited = normalise.load_organisations('organisations.json', cache_path='.cache/organisations.parquet')
 
 # %%
-# Flatten "details" column
-df_edited = pd.concat(
-    [df.drop(columns=["details"]), df["details"].apply(pd.Series)], axis=1
-    )
+# Fix format values - see rules.FORMAT_RULES
+
+df_edited = rules.apply_rules(df_edited, [rules.FORMAT_RULES], record=False)
 
 # %%
 # Remove redundant columns
@@ -33,12 +38,30 @@ df_edited = df_edited.drop(columns=dropped_cols)
 df_edited = df_edited.drop_duplicates(ignore_index=True)
 
 # %%
-# Add a UUID column
-df_edited.insert(0, 'uuid', [uuid.uuid4() for _ in range(len(df_edited))])
+# Add a UUID column, derived from analytics_identifier
+df_edited.insert(0, 'uuid', df_edited['analytics_identifier'].map(utils.org_uuid))
 
 # %%
-# Create start and end date columns
-df_edited[['start_date', 'end_date']] = [None, None]
+# Create start and end date columns, from the history of snapshots
+# NB: organisations.json is added to the snapshot store keyed on the run date, in the same
+# %Y%m%d form as explore_data.py uses, so at most once a day. The start date is the first
+# snapshot an organisation appeared in
+store = SnapshotStore('.cache/snapshots.db')
+snapshot_date = datetime.date.today().strftime('%Y%m%d')
+dates = store.dates()
+if not dates or snapshot_date > dates[-1]:
+    store.ingest_file('organisations.json', snapshot_date)
+
+history = scd.SCD2History(store)
+history.update()
+
+df_validity = history.validity()
+store.close()
+
+for col in ['start_date', 'end_date']:
+    df_validity[col] = pd.to_datetime(df_validity[col], format='%Y%m%d').dt.date
+
+df_edited = df_edited.merge(df_validity, how='left', on='analytics_identifier', validate='m:1')
 
 # %%
 # Edit URL column, rename and reorder columns
@@ -75,38 +98,18 @@ engine = dbo.connect_sql_db(
 )
 
 # %%
-# Read 'govuk_orgs' table and write to DataFrame
+# Apply df_edited to 'govuk_orgs'
+# NB: Rows no longer in the data are closed by setting their end date. Existing rows keep
+# their start date, as the snapshot store may not go back as far as the table does
 
-df_sql = pd.read_sql_table(
-    table_name='govuk_orgs',
+sql_operations.upsert_table(
+    df_edited,
     con=engine,
-    schema='testing',
-    parse_dates=[
-        'start_date', 'end_date'
-        ]
-    )
-
-# %%
-# Merge to find matches and replace new UUID with old where match exists
-
-df_merged = df_edited.merge(
-    df_sql[['govuk_identifier', 'id']],
-    on='govuk_identifier',
-    how='left',
-    suffixes=('_new', '_old')
-)
-
-df_edited['id'] = df_merged['id_old'].fillna(df_merged['id_new'])
-
-# %%
-# Push df_edited (with correct UUIDs) back to SQL db
-
-df_edited.to_sql(
     name='govuk_orgs',
-    con=engine,
+    key='govuk_identifier',
     schema='testing',
-    if_exists='replace',
-    index=False,
+    preserve=('id', 'start_date'),
+    close_col='end_date',
     dtype={
         'id': Uuid,
         'govuk_identifier': NVARCHAR(20),
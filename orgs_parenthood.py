@@ -1,22 +1,20 @@
 # %%
-import pandas as pd
 import os
 import ds_utils.database_operations as dbo
+import normalise
+import org_graph
+import sql_operations
 import utils
 import uuid
-from sqlalchemy import Uuid
+from sqlalchemy import Uuid, inspect
 
 # %%
 # Read orgs file, drop cols and filter out childless/parentless orgs
 
-df = pd.read_json('organisations.json')
-
-df = pd.concat(
-    [df.drop(columns=["details"]), df["details"].apply(pd.Series)], axis=1
-    )
+df = normalise.load_organisations('organisations.json', cache_path='.cache/organisations.parquet')
 
 dropcols = ['id', 'title', 'format', 'updated_at', 'web_url',
-            'superseded_organisations', 'superseding_organisations', 'slug',
+            'superseded_organisations', 'superseding_organisations',
             'abbreviation', 'logo_formatted_name', 'organisation_brand_colour_class_name',
             'organisation_logo_type_class_name', 'closed_at',
             'govuk_status', 'govuk_closed_status', 'content_id']
@@ -24,62 +22,36 @@ dropcols = ['id', 'title', 'format', 'updated_at', 'web_url',
 df = df.drop(columns=dropcols).rename(columns={'analytics_identifier': 'govuk_identifier'})
 
 # %%
-# Read in SQL data
-
-engine = dbo.connect_sql_db(
-    driver="pyodbc",
-    driver_version=os.environ["ODBC_DRIVER"],
-    dialect="mssql",
-    server=os.environ["ODBC_SERVER"],
-    database=os.environ["ODBC_DATABASE"],
-    authentication=os.environ["ODBC_AUTHENTICATION"],
-    username=os.environ["AZURE_CLIENT_ID"],
-    password=os.environ["AZURE_CLIENT_SECRET"],
-)
-
-df_sql = pd.read_sql_table(
-    table_name='govuk_orgs',
-    con=engine,
-    schema='testing',
-    )
-
-# %%
-# Merge on govuk_identifier
+# Add UUIDs, derived from govuk_identifier as in orgs_database.py
+# NB: This means govuk_orgs doesn't need to be read back from the database
 
-df_merged = df.merge(
-    df_sql[['id', 'govuk_identifier']],
-    on='govuk_identifier',
-    how='inner'
-)
+df.insert(0, 'id', df['govuk_identifier'].map(utils.org_uuid))
 
-order = ['id', 'govuk_identifier', 'parent_organisations', 'child_organisations']
-df_merged = df_merged.reindex(columns=order)
+order = ['id', 'govuk_identifier', 'slug', 'parent_organisations', 'child_organisations']
+df = df.reindex(columns=order)
 
 # %%
-# Filter for orgs with non-empty child org columns and edit
-
-df_sponsor = df_merged[
-    df['child_organisations'].apply(lambda x: isinstance(x, list) and len(x) > 0)
-].drop(columns=['parent_organisations'])
+# Explode child org columns to one row per parent/child pair and edit
+# NB: Orgs with no child orgs drop out here
 
-# Edit columns
-utils.flatten_list_of_dicts(
-    df_sponsor,
+df_sponsor = utils.explode_list_of_dicts(
+    df.drop(columns=['slug', 'parent_organisations']),
     'child_organisations',
     'id'
     )
 
-utils.remove_prefixes(
+# Edit columns
+df_sponsor = utils.remove_prefix_exploded(
     df=df_sponsor,
     col='child_organisations',
     prefix='https://www.gov.uk/api/organisations/'
 )
 
-utils.match_and_replace(
-    df1=df_sql,
+df_sponsor = utils.match_and_replace_exploded(
+    df1=df,
     df2=df_sponsor,
     edit_col='child_organisations',
-    key_col='url_name',
+    key_col='slug',
     val_col='id'
 )
 
@@ -87,22 +59,117 @@ df_sponsor = df_sponsor.rename(
     columns={'id': 'parent_org_id',
              'child_organisations': 'child_org_id'})
 
-df_sponsor = df_sponsor.explode('child_org_id').reset_index(drop=True).drop(columns=['govuk_identifier'])
+# NB: Child organisations missing from the data can't be given a UUID, so are dropped
+df_sponsor = df_sponsor.dropna(subset=['child_org_id']).reset_index(drop=True).drop(columns=['govuk_identifier'])
 
-df_sponsor.insert(0, 'id', [uuid.uuid4() for x in range(len(df_sponsor))])
+df_sponsor.insert(0, 'id', [
+    utils.sponsorship_uuid(parent_org_id, child_org_id)
+    for parent_org_id, child_org_id in zip(df_sponsor['parent_org_id'], df_sponsor['child_org_id'])
+])
 
 # %%
-# Push to database
+# Build the sponsorship graph, for the closure table
+# NB: The closure table pairs each organisation with every organisation under it,
+# transitively, and with itself at depth 0
 
-df_sponsor.to_sql(
-    name='orgs_sponsorship',
-    con=engine,
-    schema='testing',
-    if_exists='replace',
-    index=False,
-    dtype={
-        'id': Uuid,
-        'parent_org_id': Uuid,
-        'child_or_id': Uuid
-    }
+graph = org_graph.OrgGraph(
+    df['id'],
+    zip(df_sponsor['parent_org_id'], df_sponsor['child_org_id'])
 )
+
+# %%
+# Create connection to database
+
+engine = dbo.connect_sql_db(
+    driver="pyodbc",
+    driver_version=os.environ["ODBC_DRIVER"],
+    dialect="mssql",
+    server=os.environ["ODBC_SERVER"],
+    database=os.environ["ODBC_DATABASE"],
+    authentication=os.environ["ODBC_AUTHENTICATION"],
+    username=os.environ["AZURE_CLIENT_ID"],
+    password=os.environ["AZURE_CLIENT_SECRET"],
+)
+
+# %%
+# Work out which organisations' closure rows need rebuilding, by comparing against
+# the sponsorship graph as it was last written
+# NB: This relies on orgs_sponsorship and orgs_sponsorship_closure always describing the
+# same graph, which holds as both are written in a single transaction below. If either
+# table is missing, the closure table is rebuilt in full
+
+db_inspector = inspect(engine)
+if all(
+    db_inspector.has_table(table, schema='testing')
+    for table in ['orgs_sponsorship', 'orgs_sponsorship_closure']
+):
+    df_sponsor_old = sql_operations.read_table(
+        con=engine,
+        name='orgs_sponsorship',
+        schema='testing',
+        columns=['parent_org_id', 'child_org_id']
+    )
+    df_nodes_old = sql_operations.read_table(
+        con=engine,
+        name='orgs_sponsorship_closure',
+        schema='testing',
+        columns=['ancestor_id']
+    ).drop_duplicates()
+
+    # NB: Some drivers hand UUIDs back as strings, which wouldn't match the UUIDs in graph
+    df_sponsor_old = df_sponsor_old.map(lambda x: uuid.UUID(str(x)))
+    df_nodes_old = df_nodes_old.map(lambda x: uuid.UUID(str(x)))
+
+    graph_old = org_graph.OrgGraph(
+        df_nodes_old['ancestor_id'],
+        zip(df_sponsor_old['parent_org_id'], df_sponsor_old['child_org_id'])
+    )
+    affected = org_graph.affected_ancestors(graph_old, graph)
+    df_closure = org_graph.closure_table(graph, [node for node in graph.slugs if node in affected])
+else:
+    affected = None
+    df_closure = org_graph.closure_table(graph)
+
+# %%
+# Push to database
+# NB: Both tables are written in one transaction, so that a failure leaves neither changed
+
+with engine.begin() as conn:
+    sql_operations.bulk_to_sql(
+        df_sponsor,
+        con=conn,
+        name='orgs_sponsorship',
+        schema='testing',
+        if_exists='replace',
+        dtype={
+            'id': Uuid,
+            'parent_org_id': Uuid,
+            'child_org_id': Uuid
+        }
+    )
+
+    if affected is None:
+        sql_operations.bulk_to_sql(
+            df_closure,
+            con=conn,
+            name='orgs_sponsorship_closure',
+            schema='testing',
+            if_exists='replace',
+            dtype={
+                'ancestor_id': Uuid,
+                'descendant_id': Uuid,
+            }
+        )
+    elif affected:
+        sql_operations.replace_rows(
+            df_closure,
+            con=conn,
+            name='orgs_sponsorship_closure',
+            key='ancestor_id',
+            keys=affected,
+            schema='testing',
+            dtype={
+                'ancestor_id': Uuid,
+                'descendant_id': Uuid,
+            }
+        )
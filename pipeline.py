@@ -0,0 +1,380 @@
+# %%
+"""
+    Purpose
+        Run the data pipeline: extract_data.py, then orgs_database.py, orgs_parenthood.py
+        and binary_snapshot.py
+    Inputs
+        - The stages' scripts, the local modules they import and their input files,
+          see STAGES
+    Outputs
+        - JSON: .cache/pipeline_state.json
+            - The outcome and input hash of each stage's last run
+    Parameters
+        None
+    Notes
+        - Command-line usage:
+            python pipeline.py                       (run every stage that needs running)
+            python pipeline.py --stage parenthood    (rerun one stage, e.g. after it failed)
+            python pipeline.py --failed              (rerun failed stages, and those they blocked)
+            python pipeline.py --force               (run every stage)
+        - A stage is skipped if it last succeeded and the hash of its script, the local
+          modules it imports (found by parsing the script, see local_imports()) and its
+          input files is unchanged since. Stages with no input files, such as extract,
+          always run
+        - Stages whose dependencies have finished run concurrently, each in its own process
+        - The stages' metrics are appended to .cache/metrics.jsonl (or --metrics), and
+          can be summarised with: python metrics.py --last-run
+"""
+
+import argparse
+import ast
+import datetime
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Optional
+
+import metrics
+
+# %%
+# Stages
+
+
+@dataclass
+class Stage:
+
+    """
+    A step of the pipeline, run as a script in its own process
+
+    Parameters
+        - name: The stage's name
+        - script: The script to run
+        - args: Command-line arguments for the script
+        - inputs: Data files the stage reads. Together with the script and the local
+          modules it imports, these decide whether it needs rerunning
+        - outputs: Files the stage writes, for reference
+        - after: Stages that must finish first
+
+    """
+
+    name: str
+    script: str
+    args: list = field(default_factory=list)
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    after: list = field(default_factory=list)
+
+
+# NB: orgs_parenthood.py derives organisation IDs from govuk_identifier rather than
+# reading govuk_orgs back, so it doesn't depend on orgs_database.py and the two can run
+# side by side
+STAGES = [
+    Stage(
+        "extract", "extract_data.py",
+        outputs=["organisations.json", "organisations_changes.json"],
+    ),
+    Stage(
+        "database", "orgs_database.py",
+        inputs=["organisations.json"],
+        outputs=["govuk_orgs", ".cache/snapshots.db"],
+        after=["extract"],
+    ),
+    Stage(
+        "parenthood", "orgs_parenthood.py",
+        inputs=["organisations.json"],
+        outputs=["orgs_sponsorship", "orgs_sponsorship_closure"],
+        after=["extract"],
+    ),
+    Stage(
+        "binary_snapshot", "binary_snapshot.py",
+        args=["organisations.json", "organisations.bin"],
+        inputs=["organisations.json"],
+        outputs=["organisations.bin"],
+        after=["extract"],
+    ),
+]
+
+STATE_PATH = ".cache/pipeline_state.json"
+
+
+def local_imports(script: str) -> list:
+
+    """
+    Return the local modules a script imports, directly or through other local
+    modules, as paths. Imports anywhere in a module count, including those inside
+    functions, and modules that aren't files alongside the script are ignored
+
+    Parameters
+        - script: The script in question
+
+    """
+
+    directory = os.path.dirname(script)
+    found = set()
+    to_parse = [script]
+
+    while to_parse:
+        with open(to_parse.pop(), "rb") as f:
+            tree = ast.parse(f.read())
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+
+            for name in names:
+                path = os.path.join(directory, *name.split(".")) + ".py"
+                if path not in found and path != script and os.path.exists(path):
+                    found.add(path)
+                    to_parse.append(path)
+
+    return sorted(found)
+
+
+def input_hash(stage: Stage) -> Optional[str]:
+
+    """
+    Return a hash of a stage's script, the local modules it imports and its input
+    files, or None if the stage has no input files and so must always run
+
+    Parameters
+        - stage: The stage in question
+
+    """
+
+    if not stage.inputs:
+        return None
+
+    digest = hashlib.sha256()
+    for arg in stage.args:
+        digest.update(arg.encode() + b"\0")
+    for path in [stage.script] + local_imports(stage.script) + stage.inputs:
+        digest.update(path.encode() + b"\0")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+
+    return digest.hexdigest()
+
+
+def read_state(path: str = STATE_PATH) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_state(state: dict, path: str = STATE_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+
+def run_stage(stage: Stage, env: Optional[dict] = None) -> tuple:
+
+    """
+    Run a stage's script, returning its exit code, combined output and duration
+
+    Parameters
+        - stage: The stage to run
+        - env: Environment variables for the script. Defaults to this process's
+
+    """
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, stage.script] + stage.args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        env=env,
+    )
+
+    return result.returncode, result.stdout, time.perf_counter() - start
+
+
+def run_pipeline(
+        stages: list = STAGES,
+        only: Optional[list] = None,
+        force: bool = False,
+        max_workers: int = 4,
+        state_path: str = STATE_PATH,
+        metrics_path: Optional[str] = None
+        ) -> dict:
+
+    """
+    Run the stages in dependency order, running stages concurrently once their
+    dependencies have finished, and skipping those whose inputs are unchanged
+    since they last succeeded
+
+    Returns a dict of stage name: outcome ('succeeded', 'failed', 'skipped' or
+    'blocked', where a dependency failed). Raises ValueError if a stage depends on
+    an unknown stage, or stages depend on each other in a cycle
+
+    Parameters
+        - stages: The stages of the pipeline
+        - only: The names of the stages to run. Their dependencies are treated as
+          finished, and they're run whether or not their inputs have changed
+        - force: Whether to run stages whose inputs are unchanged
+        - max_workers: The maximum number of stages to run at once
+        - state_path: The file recording each stage's last run
+        - metrics_path: The file for the stages to append metrics to, if any - see
+          metrics.py. Every stage's metrics are given the same run ID
+
+    """
+
+    stages = {stage.name: stage for stage in stages}
+    for stage in stages.values():
+        unknown = set(stage.after) - set(stages)
+        if unknown:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {sorted(unknown)}")
+
+    # Check that the dependencies can be ordered, as stages in a cycle would never become ready
+    ordered = set()
+    while len(ordered) < len(stages):
+        ready_stages = {
+            name for name, stage in stages.items()
+            if name not in ordered and set(stage.after) <= ordered
+        }
+        if not ready_stages:
+            raise ValueError(f"Stages depend on each other in a cycle: {sorted(set(stages) - ordered)}")
+        ordered |= ready_stages
+
+    selected = set(stages) if only is None else set(only)
+    unknown = selected - set(stages)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}")
+
+    env = dict(os.environ)
+    if metrics_path:
+        env[metrics.PATH_VARIABLE] = metrics_path
+        env[metrics.RUN_VARIABLE] = datetime.datetime.now().strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+
+    state = read_state(state_path)
+    outcomes = {name: "skipped" for name in set(stages) - selected}
+    running = {}
+
+    def ready(name: str) -> bool:
+        return name not in outcomes and name not in running.values() and all(
+            dependency in outcomes for dependency in stages[name].after
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(outcomes) < len(stages):
+            for name in sorted(selected):
+                if not ready(name):
+                    continue
+
+                stage = stages[name]
+                failed = [dependency for dependency in stage.after if outcomes[dependency] in ("failed", "blocked")]
+                if failed:
+                    outcomes[name] = "blocked"
+                    state[name] = {
+                        **state.get(name, {}),
+                        "status": "blocked",
+                        "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                    }
+                    write_state(state, state_path)
+                    print(f"[{name}] Not run, as {', '.join(failed)} didn't succeed")
+                    continue
+
+                current_hash = input_hash(stage)
+                previous = state.get(name, {})
+                if (
+                    not force and only is None and current_hash is not None
+                    and previous.get("status") == "succeeded" and previous.get("hash") == current_hash
+                ):
+                    outcomes[name] = "skipped"
+                    print(f"[{name}] Inputs unchanged since {previous.get('finished_at')}. Skipped")
+                    continue
+
+                print(f"[{name}] Running {stage.script}")
+                running[executor.submit(run_stage, stage, env)] = name
+                state[name] = {"hash": current_hash, "status": "running"}
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                returncode, output, duration = future.result()
+
+                outcomes[name] = "succeeded" if returncode == 0 else "failed"
+                state[name].update(
+                    status=outcomes[name],
+                    finished_at=datetime.datetime.now().isoformat(timespec="seconds"),
+                    duration=round(duration, 2),
+                )
+                write_state(state, state_path)
+
+                for line in output.splitlines():
+                    print(f"[{name}] {line}")
+                print(f"[{name}] {outcomes[name].capitalize()} in {duration:.1f}s")
+
+    return outcomes
+
+
+def failed_stages(state: dict) -> list:
+
+    """
+    Return the stages that didn't succeed last time: those that failed or were
+    interrupted, and those not run because a dependency failed
+
+    Parameters
+        - state: The state of each stage's last run, see read_state()
+
+    """
+
+    return [name for name, run in state.items() if run.get("status") in ("failed", "running", "blocked")]
+
+
+# %%
+# Command-line interface
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the data pipeline")
+    parser.add_argument(
+        "--stage", action="append", choices=[stage.name for stage in STAGES],
+        help="Run only this stage, whatever its inputs. Can be repeated"
+    )
+    parser.add_argument(
+        "--failed", action="store_true",
+        help="Rerun only the stages that failed last time, and those not run because of them"
+    )
+    parser.add_argument("--force", action="store_true", help="Run every stage, whatever its inputs")
+    parser.add_argument("--max-workers", type=int, default=4, help="Maximum number of stages to run at once")
+    parser.add_argument(
+        "--metrics", default=os.environ.get(metrics.PATH_VARIABLE, ".cache/metrics.jsonl"),
+        help="File for the stages to append metrics to (default: $METRICS_PATH or .cache/metrics.jsonl)"
+    )
+
+    args = parser.parse_args(argv)
+
+    only = args.stage
+    if args.failed:
+        only = failed_stages(read_state())
+        if not only:
+            print("No failed stages to rerun")
+            return
+
+    outcomes = run_pipeline(only=only, force=args.force, max_workers=args.max_workers, metrics_path=args.metrics)
+    print(", ".join(f"{name}: {outcome}" for name, outcome in outcomes.items()))
+
+    if any(outcome in ("failed", "blocked") for outcome in outcomes.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+# %%
+"""
+    Purpose
+        Serve read-only lookups of organisations data over HTTP, as JSON
+    Inputs
+        - JSON: organisations.json
+    Outputs
+        - HTTP: JSON responses
+    Parameters
+        None
+    Notes
+        - Command-line usage:
+            python query_service.py organisations.json --port 8000
+        - Endpoints:
+            GET /organisation?analytics_identifier=D7    (or slug=, content_id=, title=)
+            GET /search?q=department for&limit=20        (prefix search on titles)
+            GET /children?slug=ministry-of-justice       (&transitive=1 for all descendants)
+            GET /parents?slug=hm-prison-and-probation-service   (&transitive=1 for all ancestors)
+            GET /health
+        - The file is reloaded when its modification time changes, checked at most once
+          a second. Requests are served from the previous version until the new one has
+          loaded
+"""
+
+import argparse
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from matching import normalise_name
+import json_operations
+from org_graph import OrgGraph
+
+# %%
+# In-memory indexes
+
+
+class OrganisationIndex:
+
+    """
+    Organisation records indexed by analytics_identifier, slug, content_id and
+    normalised title, with a sorted list of normalised titles for prefix search
+    and a graph of parent/child relationships. Each record is encoded as JSON once,
+    up front
+
+    Parameters
+        - records: Organisation records, as returned by the API
+
+    """
+
+    def __init__(self, records: list):
+        self.records = {}
+        self.encoded = {}
+        self.by_slug = {}
+        self.by_content_id = {}
+        self.by_title = {}
+
+        for record in records:
+            identifier = record["analytics_identifier"]
+            self.records[identifier] = record
+            self.encoded[identifier] = json.dumps(record).encode()
+            self.by_slug[record["details"]["slug"]] = identifier
+            self.by_content_id[record["details"]["content_id"]] = identifier
+            self.by_title.setdefault(normalise_name(record["title"]), []).append(identifier)
+
+        self.titles = sorted(
+            (title, identifier)
+            for title, identifiers in self.by_title.items()
+            for identifier in identifiers
+        )
+        self.graph = OrgGraph.from_records(records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def lookup(self, field: str, value: str) -> list:
+
+        """
+        Return the analytics_identifiers of the organisations with a given
+        analytics_identifier, slug, content_id or title. Titles are compared
+        once normalised, so can match more than one organisation
+
+        Parameters
+            - field: 'analytics_identifier', 'slug', 'content_id' or 'title'
+            - value: The value to look up
+
+        """
+
+        if field == "analytics_identifier":
+            return [value] if value in self.records else []
+        if field == "title":
+            return self.by_title.get(normalise_name(value), [])
+
+        identifier = {"slug": self.by_slug, "content_id": self.by_content_id}[field].get(value)
+
+        return [identifier] if identifier else []
+
+    def search(self, prefix: str, limit: int = 20) -> list:
+
+        """
+        Return the analytics_identifiers of organisations whose normalised titles
+        start with a prefix, in title order
+
+        Parameters
+            - prefix: The prefix, normalised as for titles
+            - limit: The maximum number of organisations to return
+
+        """
+
+        prefix = normalise_name(prefix)
+        start = bisect.bisect_left(self.titles, (prefix,))
+
+        identifiers = []
+        for title, identifier in self.titles[start:start + limit]:
+            if not title.startswith(prefix):
+                break
+            identifiers.append(identifier)
+
+        return identifiers
+
+    def related(self, slug: str, direction: str, transitive: bool = False) -> list:
+
+        """
+        Return the analytics_identifiers of an organisation's children or parents,
+        or all its descendants or ancestors
+
+        Parameters
+            - slug: The organisation's slug
+            - direction: 'children' or 'parents'
+            - transitive: Whether to follow links all the way down or up
+
+        """
+
+        if transitive:
+            slugs = self.graph.descendants(slug) if direction == "children" else self.graph.ancestors(slug)
+        else:
+            slugs = self.graph.children(slug) if direction == "children" else self.graph.parents(slug)
+
+        return sorted(self.by_slug[slug] for slug in slugs if slug in self.by_slug)
+
+    def to_json(self, identifiers: list) -> bytes:
+
+        """
+        Return the records of organisations as a JSON array
+
+        Parameters
+            - identifiers: The organisations' analytics_identifiers
+
+        """
+
+        return b"[" + b",".join(self.encoded[identifier] for identifier in identifiers) + b"]"
+
+
+class OrganisationService:
+
+    """
+    Holds the OrganisationIndex for an organisations file, rebuilding it when the
+    file changes
+
+    Parameters
+        - path: The organisations file, either a JSON array or NDJSON
+        - check_interval: The minimum number of seconds between checks of the
+          file's modification time
+
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked = 0.0
+
+        self.mtime = os.stat(path).st_mtime
+        self.index = OrganisationIndex(json_operations.read_records(path))
+
+    def current(self) -> OrganisationIndex:
+
+        """
+        Return the index, first reloading it if the file has changed since it
+        was loaded
+        """
+
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self.index
+
+        with self._lock:
+            if now - self._checked >= self.check_interval:
+                self._checked = now
+                try:
+                    mtime = os.stat(self.path).st_mtime
+                    if mtime != self.mtime:
+                        self.index = OrganisationIndex(json_operations.read_records(self.path))
+                        self.mtime = mtime
+                        print(f"Reloaded {len(self.index)} organisations from {self.path}")
+                # Any failure to reload, e.g. a record of an unexpected shape, leaves the
+                # previous version in place rather than failing the request
+                except Exception as e:
+                    print(f"Error: Couldn't reload {self.path}, still serving the previous version: {e!r}")
+
+        return self.index
+
+
+# %%
+# HTTP server
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    """
+    Request handler for the endpoints listed at the top of this file. The
+    service is set on the server as server.service
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    # Send each response's headers and body together, without waiting on Nagle's
+    # algorithm, so that keep-alive connections aren't held up by delayed ACKs
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        index = self.server.service.current()
+
+        if url.path == "/organisation":
+            fields = [field for field in ("analytics_identifier", "slug", "content_id", "title") if field in params]
+            if len(fields) != 1:
+                return self._send(400, {"error": "Give one of analytics_identifier, slug, content_id or title"})
+
+            identifiers = index.lookup(fields[0], params[fields[0]])
+            if not identifiers:
+                return self._send(404, {"error": "No such organisation"})
+
+            return self._send(200, index.to_json(identifiers))
+
+        if url.path == "/search":
+            try:
+                limit = int(params.get("limit", 20))
+            except ValueError:
+                return self._send(400, {"error": "limit must be a number"})
+
+            return self._send(200, index.to_json(index.search(params.get("q", ""), limit=limit)))
+
+        if url.path in ("/children", "/parents"):
+            slug = params.get("slug")
+            if slug not in index.graph:
+                return self._send(404, {"error": "No such organisation"})
+
+            identifiers = index.related(slug, url.path[1:], transitive=params.get("transitive") in ("1", "true"))
+
+            return self._send(200, index.to_json(identifiers))
+
+        if url.path == "/health":
+            return self._send(200, {"organisations": len(index), "mtime": self.server.service.mtime})
+
+        return self._send(404, {"error": "No such endpoint"})
+
+    def _send(self, status: int, body) -> None:
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        # Logging every request would cost more than serving it
+        pass
+
+
+def make_server(path: str, host: str = "127.0.0.1", port: int = 8000) -> ThreadingHTTPServer:
+
+    """
+    Return a server for an organisations file, ready to serve_forever()
+
+    Parameters
+        - path: The organisations file
+        - host: The address to listen on
+        - port: The port to listen on. 0 picks a free port
+
+    """
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.service = OrganisationService(path)
+
+    return server
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve organisations data over HTTP")
+    parser.add_argument("path", nargs="?", default="organisations.json", help="Organisations file (default: organisations.json)")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+
+    args = parser.parse_args(argv)
+
+    server = make_server(args.path, args.host, args.port)
+    print(f"Serving {len(server.service.index)} organisations on http://{args.host}:{server.server_address[1]}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# %%
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# %%
+# Declarative cleaning rules for organisations data, applied in a single vectorised pass per rule set
+
+# Each rule set holds rules that set one or more columns. Within a rule set, the first
+# rule whose conditions all hold for a row applies to it, so rules are mutually exclusive.
+# Rule sets are applied in order, so each sees the values set by the ones before it.
+# NB: This is why there's one np.select per rule set rather than one across all of them:
+# STATUS_RULES sets govuk_status, which CLOSED_STATUS_RULES and EXCLUDE_RULES then read,
+# so a single pass would need their conditions rewritten in terms of the original
+# values. Status exclusion taking priority over format exclusion comes from the order
+# of the rules within EXCLUDE_RULES. Each pass only touches the columns its rules use
+# Conditions map a column to a value (==), a list of values (isin) or {'not_in': [...]}.
+# Columns a rule set sets are left as they are for rows no rule applies to, or set to
+# the rule set's 'defaults' if given
+
+# Organisations whose format is wrong in the GOV.UK data
+# NB: Ordnance Survey - D38 - is a public corporation, therefore probably is correctly
+# categorised as 'other'
+FORMAT_RULES = {
+    "name": "format",
+    "rules": [
+        {
+            "name": "format_ministerial_department",
+            "when": {"title": [
+                "Department for Business, Energy & Industrial Strategy",
+                "Department for Digital, Culture, Media & Sport",
+                "Department for International Trade",
+                "Department for Levelling Up, Housing and Communities",
+                "Office of the Secretary of State for Scotland",
+                "Office of the Secretary of State for Wales",
+            ]},
+            "then": {"format": "Ministerial department"},
+        },
+        {
+            "name": "format_executive_office",
+            "when": {"title": ["Office for National Statistics"]},
+            "then": {"format": "Executive office"},
+        },
+    ],
+}
+
+# Set 'transitioning' (and other statuses) to 'closed' or 'devolved' based on
+# govuk_closed_status, and any remaining 'exempt' to 'live'
+# NB: The latter is done on the thesis that 'exempt' is just a descriptor of whether
+# something has a separate website
+STATUS_RULES = {
+    "name": "govuk_status",
+    "rules": [
+        {
+            "name": "status_closed",
+            "when": {
+                "govuk_status": {"not_in": ["closed", "live"]},
+                "govuk_closed_status": [
+                    "changed_name",
+                    "left_gov",
+                    "merged",
+                    "no_longer_exists",
+                    "replaced",
+                    "split",
+                ],
+            },
+            "then": {"govuk_status": "closed"},
+        },
+        {
+            "name": "status_devolved",
+            "when": {
+                "govuk_status": {"not_in": ["closed", "live"]},
+                "govuk_closed_status": "devolved",
+            },
+            "then": {"govuk_status": "devolved"},
+        },
+        {
+            "name": "status_exempt_live",
+            "when": {"govuk_status": "exempt"},
+            "then": {"govuk_status": "live"},
+        },
+    ],
+}
+
+# Blank govuk_closed_status where govuk_status is 'live'
+CLOSED_STATUS_RULES = {
+    "name": "govuk_closed_status",
+    "rules": [
+        {
+            "name": "closed_status_live",
+            "when": {"govuk_status": "live"},
+            "then": {"govuk_closed_status": None},
+        },
+    ],
+}
+
+# Flag organisations for exclusion, either because of their status or their format
+EXCLUDE_RULES = {
+    "name": "exclude",
+    "defaults": {"exclude": False, "exclude_reason": None},
+    "rules": [
+        {
+            "name": "exclude_govuk_status",
+            "when": {"govuk_status": ["closed", "devolved", "joining"]},
+            "then": {"exclude": True, "exclude_reason": "govuk_status"},
+        },
+        {
+            "name": "exclude_format",
+            "when": {"format": [
+                "Civil service",
+                "Court",
+                "Devolved administration",
+                "Executive office",
+                "Ministerial department",
+                "Sub organisation",
+                "Tribunal",
+            ]},
+            "then": {"exclude": True, "exclude_reason": "format"},
+        },
+    ],
+}
+
+CLEANING_RULES = [FORMAT_RULES, STATUS_RULES, CLOSED_STATUS_RULES, EXCLUDE_RULES]
+
+
+def _condition(series: pd.Series, spec) -> np.ndarray:
+
+    """
+    Return a boolean array of whether each value of a column meets a condition
+
+    Parameters
+        - series: The column
+        - spec: A value, a list of values or {'not_in': [...]}
+
+    """
+
+    if isinstance(spec, dict):
+        return ~series.isin(spec["not_in"]).to_numpy()
+    if isinstance(spec, list):
+        return series.isin(spec).to_numpy()
+
+    return (series == spec).fillna(False).to_numpy(dtype=bool)
+
+
+def apply_rule_set(df: pd.DataFrame, rule_set: dict, record: bool = True) -> pd.DataFrame:
+
+    """
+    Apply a rule set to a DataFrame in place. The rule that applies to each row is
+    worked out in one np.select over the rules' conditions, and each rule's
+    values are then set on just the rows it applies to
+
+    Parameters
+        - df: The DataFrame in question
+        - rule_set: The rule set, e.g. FORMAT_RULES
+        - record: Whether to add a categorical '<rule set name>_rule' column with
+          the name of the rule that applied to each row, if any
+
+    """
+
+    rules = rule_set["rules"]
+
+    conditions = []
+    for rule in rules:
+        condition = np.ones(len(df), dtype=bool)
+        for col, spec in rule["when"].items():
+            condition &= _condition(df[col], spec)
+        conditions.append(condition)
+
+    fired = np.select(conditions, np.arange(len(rules)), default=-1)
+
+    for col, default in rule_set.get("defaults", {}).items():
+        df[col] = default
+
+    for i, rule in enumerate(rules):
+        rows = fired == i
+        if rows.any():
+            for col, value in rule["then"].items():
+                df.loc[rows, col] = value
+
+    if record:
+        df[f"{rule_set['name']}_rule"] = pd.Categorical.from_codes(
+            fired, categories=[rule["name"] for rule in rules]
+        )
+
+    return df
+
+
+def apply_rules(df: pd.DataFrame, rule_sets: Optional[list] = None, record: bool = True) -> pd.DataFrame:
+
+    """
+    Return a copy of a DataFrame with rule sets applied, in order - see apply_rule_set()
+
+    Parameters
+        - df: The DataFrame in question
+        - rule_sets: The rule sets to apply. Defaults to CLEANING_RULES
+        - record: Whether to record the rule that applied to each row, per rule set
+
+    """
+
+    df = df.copy()
+
+    for rule_set in CLEANING_RULES if rule_sets is None else rule_sets:
+        apply_rule_set(df, rule_set, record=record)
+
+    return df
@@ -0,0 +1,215 @@
+# %%
+import hashlib
+import json
+from typing import Optional
+
+import pandas as pd
+
+from org_graph import link_slug
+from snapshot_store import SnapshotStore
+
+# %%
+# Slowly-changing-dimension (type 2) history of organisations, built from a snapshot store
+
+# Link columns, held as sorted lists of slugs
+LINK_COLUMNS = [
+    "parent_organisations",
+    "child_organisations",
+    "superseded_organisations",
+    "superseding_organisations",
+]
+
+
+def attributes(record: dict) -> dict:
+
+    """
+    Return the attributes of an organisation record whose changes are tracked,
+    leaving out ones that change without the organisation changing, such as
+    'updated_at' and the logo and brand colour details
+
+    Parameters
+        - record: An organisation record, as returned by the API
+
+    """
+
+    details = record["details"]
+
+    return {
+        "title": record["title"],
+        "format": record["format"],
+        "slug": details["slug"],
+        "abbreviation": details["abbreviation"],
+        "govuk_status": details["govuk_status"],
+        "govuk_closed_status": details["govuk_closed_status"],
+        "closed_at": details["closed_at"],
+        **{col: sorted(link_slug(link) for link in record[col]) for col in LINK_COLUMNS},
+    }
+
+
+class SCD2History:
+
+    """
+    Type 2 slowly-changing-dimension history of organisations, held alongside the
+    snapshots in a SnapshotStore
+
+    Each version of an organisation has the date of the snapshot it first appeared
+    in (start_date) and the date of the first snapshot it no longer appeared in,
+    either because its attributes changed or because it was dropped (end_date).
+    The current version of each organisation has no end_date. A new version is
+    only started when one of the attributes returned by attributes() changes
+
+    update() processes only the snapshots added to the store since it last ran
+
+    Parameters
+        - store: The snapshot store
+
+    """
+
+    def __init__(self, store: SnapshotStore):
+        self.store = store
+        self.con = store.con
+
+        self.con.executescript("""
+            CREATE TABLE IF NOT EXISTS scd2_versions (
+                analytics_identifier TEXT NOT NULL,
+                attributes_hash TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT,
+                attributes TEXT NOT NULL,
+                PRIMARY KEY (analytics_identifier, start_date)
+            );
+            CREATE INDEX IF NOT EXISTS scd2_versions_end_date ON scd2_versions (end_date);
+            CREATE TABLE IF NOT EXISTS scd2_processed (
+                snapshot_date TEXT PRIMARY KEY
+            );
+        """)
+
+    def processed_date(self) -> Optional[str]:
+
+        """
+        Return the date of the latest snapshot processed, if any
+        """
+
+        return self.con.execute("SELECT MAX(snapshot_date) FROM scd2_processed").fetchone()[0]
+
+    def update(self) -> dict:
+
+        """
+        Process the snapshots added to the store since the last update, in date
+        order
+
+        Returns a dict of the number of versions opened and closed
+
+        """
+
+        processed_date = self.processed_date()
+        counts = {"opened": 0, "closed": 0}
+
+        for date in self.store.dates():
+            if processed_date is not None and date <= processed_date:
+                continue
+
+            for key, count in self._apply(date, self.store.records(date)).items():
+                counts[key] += count
+
+        print(f"Updated SCD2 history: {counts}")
+
+        return counts
+
+    def _apply(self, date: str, records: list) -> dict:
+
+        """
+        Apply a single snapshot to the history: close the open versions of
+        organisations that have changed or been dropped, and open new versions of
+        organisations that have changed or been added
+
+        Parameters
+            - date: The snapshot's date
+            - records: The snapshot's records
+
+        """
+
+        open_versions = {
+            identifier: (rowid, attributes_hash)
+            for rowid, identifier, attributes_hash in self.con.execute(
+                "SELECT rowid, analytics_identifier, attributes_hash FROM scd2_versions WHERE end_date IS NULL"
+            )
+        }
+
+        opened = []
+        seen = set()
+        for record in records:
+            identifier = record["analytics_identifier"]
+            seen.add(identifier)
+
+            attributes_json = json.dumps(attributes(record))
+            attributes_hash = hashlib.sha1(attributes_json.encode()).hexdigest()
+
+            if open_versions.get(identifier, (None, None))[1] != attributes_hash:
+                opened.append((identifier, attributes_hash, date, attributes_json))
+
+        changed = {row[0] for row in opened}
+        closed = [
+            (date, rowid)
+            for identifier, (rowid, _) in open_versions.items()
+            if identifier not in seen or identifier in changed
+        ]
+
+        with self.con:
+            self.con.executemany(
+                "UPDATE scd2_versions SET end_date = ? WHERE rowid = ?",
+                closed
+            )
+            self.con.executemany(
+                "INSERT INTO scd2_versions (analytics_identifier, attributes_hash, start_date, attributes) "
+                "VALUES (?, ?, ?, ?)",
+                opened
+            )
+            self.con.execute("INSERT INTO scd2_processed VALUES (?)", (date,))
+
+        return {"opened": len(opened), "closed": len(closed)}
+
+    def versions(self, as_at: Optional[str] = None) -> pd.DataFrame:
+
+        """
+        Return the versions of every organisation, with analytics_identifier,
+        start_date, end_date and attribute columns
+
+        Parameters
+            - as_at: If given, only the versions valid on this date, e.g. '20240115'
+              - i.e. the organisations as they were at the latest snapshot on or
+              before it
+
+        """
+
+        query = "SELECT analytics_identifier, start_date, end_date, attributes FROM scd2_versions"
+        params = ()
+        if as_at is not None:
+            query += " WHERE start_date <= ? AND (end_date IS NULL OR end_date > ?)"
+            params = (as_at, as_at)
+
+        df = pd.read_sql_query(query + " ORDER BY start_date, rowid", self.con, params=params)
+
+        df_attributes = pd.DataFrame([json.loads(value) for value in df["attributes"]], index=df.index)
+
+        return pd.concat([df.drop(columns=["attributes"]), df_attributes], axis=1)
+
+    def validity(self) -> pd.DataFrame:
+
+        """
+        Return the date each organisation first appeared (start_date) and, if it
+        has since been dropped, the date of the first snapshot it no longer
+        appeared in (end_date), one row per analytics_identifier
+        """
+
+        return pd.read_sql_query(
+            """
+            SELECT
+                analytics_identifier,
+                MIN(start_date) AS start_date,
+                CASE WHEN COUNT(*) = COUNT(end_date) THEN MAX(end_date) END AS end_date
+            FROM scd2_versions
+            GROUP BY analytics_identifier
+            """,
+            self.con
+        )
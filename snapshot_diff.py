@@ -0,0 +1,287 @@
+# %%
+"""
+    Purpose
+        Compare two organisations.json snapshots and classify the changes between them
+    Inputs
+        - JSON: The earlier snapshot
+        - JSON: The later snapshot
+    Outputs
+        - JSON or Markdown: The changes, printed or written to a file
+    Parameters
+        None
+    Notes
+        - Command-line usage:
+            python snapshot_diff.py old/organisations.json organisations.json --format markdown
+        - An organisation can appear under more than one type of change, e.g. if it's
+          renamed and re-parented at the same time
+"""
+
+import argparse
+import hashlib
+import json
+from typing import Iterable, Iterator, Optional
+
+import json_operations
+from json_operations import link_slug
+
+# %%
+# Diffing of snapshots
+
+CHANGE_TYPES = ["added", "removed", "renamed", "reformatted", "status_changed", "reparented"]
+
+# The fields compared for each type of change between two versions of a record
+FIELDS = {
+    "renamed": ["title"],
+    "reformatted": ["format"],
+    "status_changed": ["govuk_status", "govuk_closed_status"],
+    "reparented": ["parent_organisations"],
+}
+
+
+def _key(record: dict, key: str) -> str:
+    return record["details"][key] if key == "content_id" else record[key]
+
+
+def _hash(record: dict) -> str:
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+def _fields(record: dict) -> dict:
+
+    """
+    Return the fields of a record compared by diff_snapshots()
+
+    Parameters
+        - record: An organisation record, as returned by the API
+
+    """
+
+    return {
+        "title": record["title"],
+        "format": record["format"],
+        "govuk_status": record["details"]["govuk_status"],
+        "govuk_closed_status": record["details"]["govuk_closed_status"],
+        "parent_organisations": sorted(link_slug(link) for link in record["parent_organisations"]),
+    }
+
+
+def _entry(record: dict) -> dict:
+    return {
+        "analytics_identifier": record["analytics_identifier"],
+        "slug": record["details"]["slug"],
+        "title": record["title"],
+    }
+
+
+class SnapshotDiff:
+
+    """
+    Diff a snapshot against an earlier one as its records stream through, so
+    that neither snapshot needs to be held in full - see diff_snapshots()
+
+    Only a hash, the compared fields and the identifiers of each earlier record
+    are kept, so the earlier records can be streamed in with add_old().
+    Organisations not seen by the time changes() is called count as removed
+
+    Parameters
+        - old_records: The earlier snapshot's records. Empty if they're to be
+          added with add_old()
+        - key: The identifier to match records on, 'analytics_identifier' or 'content_id'
+
+    """
+
+    def __init__(self, old_records: Iterable[dict], key: str = "analytics_identifier"):
+        self.key = key
+        self._old = {}
+        self._seen = set()
+        self._changes = {change_type: [] for change_type in CHANGE_TYPES}
+
+        self.add_old(old_records)
+
+    def add_old(self, records: Iterable[dict]) -> None:
+
+        """
+        Record records of the earlier snapshot. Must be called before any
+        records of the later snapshot are added
+
+        Parameters
+            - records: Records of the earlier snapshot
+
+        """
+
+        for record in records:
+            self._old[_key(record, self.key)] = (_hash(record), _fields(record), _entry(record))
+
+    def add(self, record: dict) -> None:
+
+        """
+        Compare a record of the later snapshot against its earlier version
+
+        Parameters
+            - record: An organisation record, as returned by the API
+
+        """
+
+        identifier = _key(record, self.key)
+        if identifier in self._seen:
+            return
+        self._seen.add(identifier)
+
+        if identifier not in self._old:
+            self._changes["added"].append(_entry(record))
+            return
+
+        old_hash, old_fields, _ = self._old[identifier]
+        if _hash(record) == old_hash:
+            return
+
+        new_fields = _fields(record)
+        for change_type, fields in FIELDS.items():
+            changed = {
+                field: {"old": old_fields[field], "new": new_fields[field]}
+                for field in fields
+                if old_fields[field] != new_fields[field]
+            }
+            if changed:
+                self._changes[change_type].append({**_entry(record), "changes": changed})
+
+    def track(self, pages: Iterable[tuple]) -> Iterator[tuple]:
+
+        """
+        Pass (page_number, records) pages through unchanged, comparing each
+        record along the way
+
+        Parameters
+            - pages: Iterable of (page_number, records), as yielded by
+              api_operations.CheckpointStore.iter_pages()
+
+        """
+
+        for page_number, records in pages:
+            for record in records:
+                self.add(record)
+
+            yield page_number, records
+
+    def changes(self) -> dict:
+
+        """
+        Return the changes, as from diff_snapshots(). Only meaningful once every
+        record of the later snapshot has been added
+        """
+
+        removed = [entry for identifier, (_, _, entry) in self._old.items() if identifier not in self._seen]
+
+        return {**self._changes, "removed": removed}
+
+
+def diff_snapshots(old_records: Iterable[dict], new_records: Iterable[dict], key: str = "analytics_identifier") -> dict:
+
+    """
+    Return the organisations added, removed, renamed, reformatted, status-changed
+    and re-parented between two snapshots, as a dict of lists keyed on the
+    types of change in CHANGE_TYPES
+
+    Records are matched on key, and only records whose hash differs between the
+    snapshots are compared field by field. Each entry holds the organisation's
+    identifiers and title and, for changes, the old and new values of the
+    fields that changed
+
+    Parameters
+        - old_records: The earlier snapshot's records
+        - new_records: The later snapshot's records
+        - key: The identifier to match records on, 'analytics_identifier' or 'content_id'
+
+    """
+
+    diff = SnapshotDiff(old_records, key)
+    for record in new_records:
+        diff.add(record)
+
+    return diff.changes()
+
+
+def _cell(value) -> str:
+
+    """
+    Return a value as the contents of a Markdown table cell, with pipes escaped
+    so that they don't end the cell
+
+    Parameters
+        - value: The value in question. None is left blank, and lists are joined
+
+    """
+
+    if isinstance(value, list):
+        value = ", ".join(value)
+
+    return "" if value is None else str(value).replace("|", "\\|")
+
+
+def to_markdown(changes: dict) -> str:
+
+    """
+    Return a diff from diff_snapshots() as a Markdown report, with a table per
+    type of change
+
+    Parameters
+        - changes: The diff
+
+    """
+
+    lines = ["# Changes to GOV.UK organisations", ""]
+    lines += [f"- {change_type.replace('_', ' ').capitalize()}: {len(changes[change_type])}" for change_type in CHANGE_TYPES]
+
+    for change_type in CHANGE_TYPES:
+        if not changes[change_type]:
+            continue
+
+        lines += ["", f"## {change_type.replace('_', ' ').capitalize()}", ""]
+
+        if change_type in FIELDS:
+            lines += ["| Organisation | Identifier | Field | Old | New |", "| --- | --- | --- | --- | --- |"]
+            for item in changes[change_type]:
+                for field, values in item["changes"].items():
+                    lines.append(
+                        f"| {_cell(item['title'])} | {_cell(item['analytics_identifier'])} | {field} "
+                        f"| {_cell(values['old'])} | {_cell(values['new'])} |"
+                    )
+        else:
+            lines += ["| Organisation | Identifier |", "| --- | --- |"]
+            lines += [
+                f"| {_cell(item['title'])} | {_cell(item['analytics_identifier'])} |"
+                for item in changes[change_type]
+            ]
+
+    return "\n".join(lines) + "\n"
+
+
+# %%
+# Command-line interface
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare two organisations.json snapshots")
+    parser.add_argument("old", help="The earlier snapshot")
+    parser.add_argument("new", help="The later snapshot")
+    parser.add_argument(
+        "--key", choices=["analytics_identifier", "content_id"], default="analytics_identifier",
+        help="The identifier to match organisations on (default: analytics_identifier)"
+    )
+    parser.add_argument("--format", choices=["json", "markdown"], default="json", help="Output format (default: json)")
+    parser.add_argument("--output", help="File to write to. Defaults to printing")
+
+    args = parser.parse_args(argv)
+
+    changes = diff_snapshots(json_operations.read_records(args.old), json_operations.read_records(args.new), key=args.key)
+    output = to_markdown(changes) if args.format == "markdown" else json.dumps(changes, indent=4)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# %%
+"""
+    Purpose
+        Store a history of organisations.json snapshots, keeping only one copy of
+        each record for as long as it stays unchanged
+    Inputs
+        - JSON: Any organisations.json snapshot, e.g. from the history of this repo
+    Outputs
+        - SQLite: The snapshot store (snapshots.db by default)
+    Parameters
+        None
+    Notes
+        - Command-line usage:
+            python snapshot_store.py ingest organisations.json --date 20241101
+            python snapshot_store.py list
+            python snapshot_store.py export history.parquet
+        - Snapshots must be ingested in date order
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from compact import compact_frame, take
+import normalise
+
+# %%
+# Snapshot store
+
+
+class SnapshotStore:
+
+    """
+    SQLite store of organisations snapshots, deduplicated so that a record which
+    doesn't change between consecutive snapshots is held once, as a version with
+    the dates of the first and last snapshots it appeared in unchanged
+
+    Parameters
+        - path: The SQLite database file
+
+    """
+
+    def __init__(self, path: str = "snapshots.db"):
+        self.path = path
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.con = sqlite3.connect(path)
+
+        self.con.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                snapshot_date TEXT PRIMARY KEY,
+                source TEXT,
+                record_count INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS versions (
+                analytics_identifier TEXT NOT NULL,
+                record_hash TEXT NOT NULL,
+                first_date TEXT NOT NULL,
+                last_date TEXT NOT NULL,
+                record TEXT NOT NULL,
+                PRIMARY KEY (analytics_identifier, first_date)
+            );
+            CREATE INDEX IF NOT EXISTS versions_last_date ON versions (last_date);
+        """)
+
+    def close(self) -> None:
+        self.con.close()
+
+    def dates(self) -> list:
+
+        """
+        Return the dates of the snapshots in the store, in order
+        """
+
+        return [row[0] for row in self.con.execute("SELECT snapshot_date FROM snapshots ORDER BY snapshot_date")]
+
+    def ingest(self, records: Iterable[dict], date: str, source: Optional[str] = None) -> dict:
+
+        """
+        Add a snapshot to the store. Records unchanged since the previous snapshot
+        extend their existing version; other records start a new version
+
+        Returns a dict of the number of records that were unchanged and new/changed
+
+        Parameters
+            - records: The snapshot's organisation records
+            - date: The snapshot's date, e.g. '20241101'. Must be later than any
+              snapshot already in the store
+            - source: Where the snapshot came from, for reference
+
+        """
+
+        dates = self.dates()
+        if dates and date <= dates[-1]:
+            raise ValueError(f"Snapshot {date} is not later than the latest snapshot in the store ({dates[-1]})")
+
+        previous_date = dates[-1] if dates else None
+        open_versions = {
+            identifier: (rowid, record_hash)
+            for rowid, identifier, record_hash in self.con.execute(
+                "SELECT rowid, analytics_identifier, record_hash FROM versions WHERE last_date = ?",
+                (previous_date,)
+            )
+        }
+
+        unchanged, changed = [], []
+        seen = set()
+        for record in records:
+            identifier = record["analytics_identifier"]
+
+            # Records can be repeated across pages of the API
+            if identifier in seen:
+                continue
+            seen.add(identifier)
+
+            record_json = json.dumps(record)
+            record_hash = hashlib.sha1(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+            rowid, previous_hash = open_versions.get(identifier, (None, None))
+            if previous_hash == record_hash:
+                unchanged.append((date, rowid))
+            else:
+                changed.append((identifier, record_hash, date, date, record_json))
+
+        with self.con:
+            self.con.executemany(
+                "UPDATE versions SET last_date = ? WHERE rowid = ?",
+                unchanged
+            )
+            self.con.executemany("INSERT INTO versions VALUES (?, ?, ?, ?, ?)", changed)
+            self.con.execute(
+                "INSERT INTO snapshots VALUES (?, ?, ?)",
+                (date, source, len(unchanged) + len(changed))
+            )
+
+        counts = {"unchanged": len(unchanged), "changed": len(changed)}
+        print(f"Ingested snapshot {date}: {counts}")
+
+        return counts
+
+    def ingest_file(self, path: str, date: str) -> dict:
+
+        """
+        Add a snapshot file to the store - see ingest()
+
+        Parameters
+            - path: The snapshot file, either a JSON array or NDJSON
+            - date: The snapshot's date, e.g. '20241101'
+
+        """
+
+        return self.ingest(normalise.read_records(path), date, source=path)
+
+    def records(self, date: str) -> list:
+
+        """
+        Return the records in a snapshot, as ingested
+
+        Parameters
+            - date: The snapshot's date, e.g. '20241101'
+
+        """
+
+        return [
+            json.loads(record) for (record,) in self.con.execute(
+                "SELECT record FROM versions WHERE first_date <= ? AND last_date >= ? ORDER BY rowid",
+                (date, date)
+            )
+        ]
+
+    def load_versions(self) -> pd.DataFrame:
+
+        """
+        Return every distinct version of every record, flattened as by
+        normalise.normalise_records(), with first_date and last_date columns
+        """
+
+        df_versions = pd.read_sql_query(
+            "SELECT first_date, last_date, record FROM versions ORDER BY first_date, rowid",
+            self.con
+        )
+
+        df = normalise.normalise_records([json.loads(record) for record in df_versions["record"]])
+        df.insert(0, "first_date", df_versions["first_date"])
+        df.insert(1, "last_date", df_versions["last_date"])
+
+        return df
+
+    def load_history(self, compact: bool = False):
+
+        """
+        Return the full history as one DataFrame, with a row for each record in
+        each snapshot and a 'date' column, in date order. Each distinct version
+        is parsed once and then repeated across the snapshots it appeared in
+
+        Parameters
+            - compact: Whether to return the compact form from
+              compact.compact_frame() - (DataFrame, dict of LinkLists) - in which
+              repeating a version costs only integer codes
+
+        """
+
+        dates = np.array(self.dates())
+        df = self.load_versions()
+
+        first = np.searchsorted(dates, df["first_date"].to_numpy(dtype=str))
+        last = np.searchsorted(dates, df["last_date"].to_numpy(dtype=str))
+        counts = last - first + 1
+
+        rows = np.repeat(np.arange(len(df)), counts)
+        offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        date_positions = np.repeat(first, counts) + offsets
+
+        # Put rows in date order
+        order = np.argsort(date_positions, kind="stable")
+        rows, date_positions = rows[order], date_positions[order]
+
+        df = df.drop(columns=["first_date", "last_date"])
+
+        if compact:
+            df, links = take(*compact_frame(df), rows)
+            df.insert(0, "date", pd.Categorical.from_codes(date_positions, categories=dates))
+
+            return df, links
+
+        df = df.iloc[rows].reset_index(drop=True)
+        df.insert(0, "date", dates[date_positions])
+
+        return df
+
+
+# %%
+# Command-line interface
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Store and retrieve organisations.json snapshots")
+    parser.add_argument("--store", default="snapshots.db", help="SQLite snapshot store (default: snapshots.db)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Add snapshot files to the store")
+    ingest_parser.add_argument("paths", nargs="+", help="Snapshot files")
+    ingest_parser.add_argument(
+        "--date", action="append",
+        help="Date of each snapshot, e.g. 20241101, in the same order as the files"
+    )
+
+    subparsers.add_parser("list", help="List the snapshots in the store")
+
+    export_parser = subparsers.add_parser("export", help="Export the full history as Parquet or CSV")
+    export_parser.add_argument("output", help="Output file, ending .parquet or .csv")
+
+    args = parser.parse_args(argv)
+    store = SnapshotStore(args.store)
+
+    if args.command == "ingest":
+        if not args.date or len(args.date) != len(args.paths):
+            parser.error("give one --date per snapshot file")
+
+        for date, path in sorted(zip(args.date, args.paths)):
+            store.ingest_file(path, date)
+
+    elif args.command == "list":
+        for date, source, record_count in store.con.execute(
+            "SELECT snapshot_date, source, record_count FROM snapshots ORDER BY snapshot_date"
+        ):
+            print(f"{date}  {record_count:>6} records  {source or ''}")
+
+    elif args.command == "export":
+        df = store.load_history()
+        if args.output.endswith(".parquet"):
+            df.to_parquet(args.output, index=False)
+        else:
+            df.to_csv(args.output, index=False)
+        print(f"Exported {len(df)} rows to {args.output}")
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
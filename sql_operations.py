@@ -0,0 +1,333 @@
+# %%
+import datetime
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Union
+
+import pandas as pd
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+import metrics
+
+# %%
+# Functions to be used for writing DataFrames to the database
+
+# SQL Server accepts at most 2,100 parameters per statement
+MSSQL_MAX_PARAMETERS = 2100
+
+
+def bulk_to_sql(
+        df: pd.DataFrame,
+        con: Union[Engine, Connection],
+        name: str,
+        schema: Optional[str] = None,
+        if_exists: str = "fail",
+        dtype: Optional[dict] = None,
+        chunksize: int = 1000
+        ) -> int:
+
+    """
+    Write a DataFrame to a table in bulk, rather than one round trip per row as
+    DataFrame.to_sql() does by default
+
+    With pyodbc, rows are sent with fast_executemany, which binds each chunk as a
+    single parameter array. With other drivers, rows are sent as multi-row
+    INSERT statements. Either way, rows are sent chunksize at a time
+
+    Returns the number of rows written, and prints the rate they were written at
+
+    Parameters
+        - df: The rows to write
+        - con: The SQLAlchemy engine or connection to write through
+        - name: The table to write to
+        - schema: The schema holding the table
+        - if_exists: What to do if the table exists, as for DataFrame.to_sql()
+        - dtype: Column types, as passed to DataFrame.to_sql()
+        - chunksize: The number of rows to send per round trip
+
+    """
+
+    if con.dialect.driver == "pyodbc":
+        engine = con.engine
+        if not event.contains(engine, "before_cursor_execute", _set_fast_executemany):
+            event.listen(engine, "before_cursor_execute", _set_fast_executemany)
+        method = None
+    else:
+        method = "multi"
+
+        if con.dialect.name == "mssql":
+            chunksize = min(chunksize, MSSQL_MAX_PARAMETERS // max(len(df.columns), 1) - 1)
+
+    start = time.perf_counter()
+
+    with metrics.track("bulk_to_sql", rows_in=len(df), table=name, chunksize=chunksize) as metric:
+        df.to_sql(
+            name=name,
+            con=con,
+            schema=schema,
+            if_exists=if_exists,
+            index=False,
+            dtype=dtype,
+            chunksize=chunksize,
+            method=method
+        )
+        metric["rows_out"] = len(df)
+
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {len(df)} rows to {name} in {elapsed:.2f}s ({len(df) / elapsed if elapsed else 0:,.0f} rows/s)")
+
+    return len(df)
+
+
+def read_table(
+        con: Union[Engine, Connection],
+        name: str,
+        schema: Optional[str] = None,
+        columns: Optional[list] = None
+        ) -> pd.DataFrame:
+
+    """
+    Read a table into a DataFrame, as pd.read_sql_table(), recording the read
+    with metrics.track()
+
+    Parameters
+        - con: The SQLAlchemy engine or connection to read through
+        - name: The table to read
+        - schema: The schema holding the table
+        - columns: The columns to read. Defaults to all of them
+
+    """
+
+    with metrics.track("read_table", table=name) as metric:
+        df = pd.read_sql_table(table_name=name, con=con, schema=schema, columns=columns)
+        metric["rows_out"] = len(df)
+
+    return df
+
+
+@contextmanager
+def _begin(con: Union[Engine, Connection]) -> Iterator[Connection]:
+
+    """
+    Yield a connection in a transaction: a new one from an engine, or the given
+    connection, joining its transaction if it is already in one. The transaction
+    is committed when the block exits, unless it belongs to the caller
+
+    Parameters
+        - con: The SQLAlchemy engine or connection to write through
+
+    """
+
+    if isinstance(con, Engine):
+        with con.begin() as conn:
+            yield conn
+    elif con.in_transaction():
+        yield con
+    else:
+        with con.begin():
+            yield con
+
+
+def _set_fast_executemany(conn, cursor, statement, parameters, context, executemany):
+    if executemany:
+        cursor.fast_executemany = True
+
+
+def upsert_table(
+        df: pd.DataFrame,
+        con: Union[Engine, Connection],
+        name: str,
+        key: str,
+        schema: Optional[str] = None,
+        dtype: Optional[dict] = None,
+        preserve: tuple = (),
+        close_col: Optional[str] = None,
+        close_value: Optional[datetime.date] = None,
+        chunksize: int = 1000
+        ) -> dict:
+
+    """
+    Apply the rows of a DataFrame to a table with set-based statements, rather
+    than dropping and recreating the table
+
+    The DataFrame is written to a staging table with bulk_to_sql(), then in a single
+    transaction:
+        - rows whose key isn't in the table are inserted
+        - rows whose key is in the table are updated, but only where a value
+          has changed
+        - if close_col is given, rows in the table whose key isn't in the
+          DataFrame have close_col set to close_value, if it isn't set already
+
+    If the table doesn't exist yet it is created from the DataFrame
+
+    Returns a dict of the number of rows inserted, updated and closed
+
+    Parameters
+        - df: The rows to apply
+        - con: The SQLAlchemy engine or connection to write through. With a
+          connection already in a transaction, the writes are part of it
+        - name: The table to write to
+        - key: The column identifying a row
+        - schema: The schema holding the table
+        - dtype: Column types, as passed to DataFrame.to_sql()
+        - preserve: Columns whose existing values shouldn't be updated, e.g. IDs
+        - close_col: The column to set on rows no longer in df, e.g. an end date
+        - close_value: The value to set close_col to. Defaults to today's date
+        - chunksize: The number of rows to send per round trip when staging
+
+    """
+
+    if not inspect(con).has_table(name, schema=schema):
+        bulk_to_sql(df, con=con, name=name, schema=schema, dtype=dtype, chunksize=chunksize)
+        counts = {"inserted": len(df), "updated": 0, "closed": 0}
+        print(f"Created {name}: {counts}")
+        return counts
+
+    staging_name = f"{name}_staging"
+    quote = con.dialect.identifier_preparer.quote
+
+    target = _qualified_name(con, name, schema)
+    staging = _qualified_name(con, staging_name, schema)
+
+    columns = [quote(col) for col in df.columns]
+    update_columns = [quote(col) for col in df.columns if col != key and col not in preserve]
+    key_col = quote(key)
+
+    changed = " OR ".join(
+        f"(s.{col} <> t.{col} OR (s.{col} IS NULL AND t.{col} IS NOT NULL) OR (s.{col} IS NOT NULL AND t.{col} IS NULL))"
+        for col in update_columns
+    ) or "1 = 0"
+    assignments = ", ".join(f"{col} = s.{col}" for col in update_columns)
+
+    if con.dialect.name == "mssql":
+        update_sql = f"""
+            UPDATE t SET {assignments}
+            FROM {target} AS t
+            JOIN {staging} AS s ON s.{key_col} = t.{key_col}
+            WHERE {changed}
+        """
+    else:
+        update_sql = f"""
+            UPDATE {target} AS t SET {assignments}
+            FROM {staging} AS s
+            WHERE s.{key_col} = t.{key_col} AND ({changed})
+        """
+
+    # NB: The anti-joins below use NOT IN on an uncorrelated subquery rather than a correlated
+    # NOT EXISTS. Neither table need have an index on the key, and SQLite runs NOT EXISTS as a
+    # nested loop without one, whereas it materialises the NOT IN subquery into an index.
+    # NULL keys are excluded, as a NULL in the subquery would make NOT IN match nothing
+    insert_sql = f"""
+        INSERT INTO {target} ({", ".join(columns)})
+        SELECT {", ".join(f"s.{col}" for col in columns)}
+        FROM {staging} AS s
+        WHERE s.{key_col} NOT IN (SELECT t.{key_col} FROM {target} AS t WHERE t.{key_col} IS NOT NULL)
+    """
+
+    if close_col is not None:
+        close_col = quote(close_col)
+        close_value = close_value or datetime.date.today()
+
+        if con.dialect.name == "mssql":
+            close_sql = f"""
+                UPDATE t SET {close_col} = :close_value
+                FROM {target} AS t
+                WHERE t.{close_col} IS NULL
+                AND t.{key_col} NOT IN (SELECT s.{key_col} FROM {staging} AS s WHERE s.{key_col} IS NOT NULL)
+            """
+        else:
+            close_sql = f"""
+                UPDATE {target} AS t SET {close_col} = :close_value
+                WHERE t.{close_col} IS NULL
+                AND t.{key_col} NOT IN (SELECT s.{key_col} FROM {staging} AS s WHERE s.{key_col} IS NOT NULL)
+            """
+
+    with _begin(con) as conn:
+        bulk_to_sql(df, con=conn, name=staging_name, schema=schema, if_exists="replace", dtype=dtype, chunksize=chunksize)
+
+        counts = {
+            "updated": conn.execute(text(update_sql)).rowcount if update_columns else 0,
+            "inserted": conn.execute(text(insert_sql)).rowcount,
+            "closed": conn.execute(text(close_sql), {"close_value": close_value}).rowcount if close_col else 0,
+        }
+
+        conn.execute(text(f"DROP TABLE {staging}"))
+
+    print(f"Applied {len(df)} rows to {name}: {counts}")
+
+    return counts
+
+
+def replace_rows(
+        df: pd.DataFrame,
+        con: Union[Engine, Connection],
+        name: str,
+        key: str,
+        keys: Iterable,
+        schema: Optional[str] = None,
+        dtype: Optional[dict] = None,
+        chunksize: int = 1000
+        ) -> dict:
+
+    """
+    Delete the rows of a table whose key is in keys, then insert the rows of a
+    DataFrame in their place, in a single transaction. Used to rewrite only the
+    parts of a table that have changed
+
+    Returns a dict of the number of rows deleted and inserted
+
+    Parameters
+        - df: The rows to insert
+        - con: The SQLAlchemy engine or connection to write through. With a
+          connection already in a transaction, the writes are part of it
+        - name: The table to write to
+        - key: The column identifying which rows to replace. Needn't be unique
+        - keys: The key values whose rows should be replaced
+        - schema: The schema holding the table
+        - dtype: Column types, as passed to DataFrame.to_sql()
+        - chunksize: The number of rows to send per round trip
+
+    """
+
+    keys_name = f"{name}_keys"
+    target = _qualified_name(con, name, schema)
+    staging = _qualified_name(con, keys_name, schema)
+    key_col = con.dialect.identifier_preparer.quote(key)
+
+    df_keys = pd.DataFrame({key: list(keys)})
+
+    with _begin(con) as conn:
+        bulk_to_sql(
+            df_keys, con=conn, name=keys_name, schema=schema, if_exists="replace",
+            dtype={key: dtype[key]} if dtype and key in dtype else None, chunksize=chunksize
+        )
+
+        deleted = conn.execute(text(
+            f"DELETE FROM {target} WHERE {key_col} IN (SELECT {key_col} FROM {staging})"
+        )).rowcount
+        bulk_to_sql(df, con=conn, name=name, schema=schema, if_exists="append", dtype=dtype, chunksize=chunksize)
+
+        conn.execute(text(f"DROP TABLE {staging}"))
+
+    counts = {"deleted": deleted, "inserted": len(df)}
+    print(f"Replaced rows for {len(df_keys)} keys in {name}: {counts}")
+
+    return counts
+
+
+def _qualified_name(con: Union[Engine, Connection], name: str, schema: Optional[str]) -> str:
+
+    """
+    Return a quoted, schema-qualified table name
+
+    Parameters
+        - con: The SQLAlchemy engine or connection the name will be used with
+        - name: The table name
+        - schema: The schema holding the table, if any
+
+    """
+
+    quote = con.dialect.identifier_preparer.quote
+
+    return f"{quote(schema)}.{quote(name)}" if schema else quote(name)
@@ -0,0 +1,513 @@
+# %%
+"""
+    Purpose
+        Generate synthetic organisations data in the same form as organisations.json,
+        at any scale, for benchmarking
+    Inputs
+        - None
+    Outputs
+        - JSON: An organisations file
+        - SQLite: Optionally, a snapshot store holding a series of daily snapshots
+    Parameters
+        None
+    Notes
+        - Command-line usage:
+            python synthetic.py --scale 10 --output synthetic/organisations.json
+            python synthetic.py --scale 10 --snapshots 30 --store synthetic/snapshots.db
+        - Scale is relative to the real data, i.e. scale 1 is REAL_COUNT records
+        - Formats, statuses, the number of parents each organisation has and the other
+          distributions are taken from the real data as at July 2025
+        - Parent/child links form a forest rooted in departments, with a few
+          organisations having more than one parent and a few sub-organisations having
+          children of their own. Children are spread unevenly, as in the real data where
+          a handful of departments have 30-60 each
+        - Closed organisations that were replaced, merged, split or renamed are
+          superseded by other organisations, which list them in turn, and are
+          occasionally superseded by organisations that have themselves since closed
+        - The same seed always gives the same data
+"""
+
+import argparse
+import datetime
+import json
+import os
+import re
+import uuid
+from typing import Iterator, Optional
+
+import numpy as np
+
+# %%
+# Distributions, from the real data
+
+REAL_COUNT = 1262
+
+API_URL = "https://www.gov.uk/api/organisations/"
+WEB_URL = "https://www.gov.uk/government/organisations/"
+
+# Format: (weight, analytics_identifier prefix)
+FORMATS = {
+    "Other": (497, "OT"),
+    "Sub organisation": (183, "OT"),
+    "Executive non-departmental public body": (173, "PB"),
+    "Executive agency": (146, "EA"),
+    "Advisory non-departmental public body": (83, "PB"),
+    "Ministerial department": (52, "D"),
+    "Tribunal": (34, "PB"),
+    "Court": (25, "CO"),
+    "Public corporation": (25, "PC"),
+    "Non-ministerial department": (24, "D"),
+    "Independent monitoring body": (7, "IM"),
+    "Special health authority": (4, "PB"),
+    "Ad-hoc advisory group": (3, "AG"),
+    "Devolved government": (3, "DA"),
+    "Executive office": (2, "EO"),
+    "Civil service": (1, "CS"),
+}
+
+# Formats that sit at the top of the parent/child forest
+TOP_FORMATS = {"Ministerial department", "Non-ministerial department", "Devolved government", "Executive office"}
+
+# Formats that can have children of their own, beneath a department
+MIDDLE_FORMATS = {"Executive agency", "Executive non-departmental public body", "Other"}
+
+# (govuk_status, govuk_closed_status): weight
+STATUSES = {
+    ("live", None): 356,
+    ("closed", "no_longer_exists"): 345,
+    ("exempt", None): 299,
+    ("closed", "replaced"): 64,
+    ("closed", "changed_name"): 60,
+    ("closed", "devolved"): 60,
+    ("closed", "merged"): 43,
+    ("closed", "split"): 14,
+    ("joining", None): 11,
+    ("closed", "left_gov"): 9,
+    ("transitioning", None): 1,
+}
+
+# Closed statuses whose organisations are superseded, with the number of successors
+SUCCESSORS = {"replaced": 1, "changed_name": 1, "merged": 1, "split": 2}
+
+# Number of parents of organisations beneath the top of the forest: weight
+PARENT_COUNTS = {0: 400, 1: 756, 2: 35, 3: 5, 4: 4}
+
+LOGO_TYPES = {"single-identity": 725, "no-identity": 349, "custom": 121, "mod": 29, "ho": 10}
+
+# Words titles are made up from
+TITLE_KINDS = [
+    "Office for", "Agency for", "Department for", "Commission for", "Authority for",
+    "Council for", "Board of", "Service for", "Committee on", "Institute of",
+    "Ministry of", "Tribunal for", "Panel on", "Inspectorate of", "Centre for",
+]
+TITLE_TOPICS = [
+    "Health", "Justice", "Transport", "Education", "Defence", "Energy", "Housing",
+    "Culture", "Environment", "Trade", "Science", "Work", "Pensions", "Revenue",
+    "Fisheries", "Food", "Water", "Land", "Prisons", "Probation", "Skills", "Sport",
+    "Heritage", "Marine", "Nuclear", "Rail", "Roads", "Aviation", "Statistics",
+    "Standards", "Security", "Borders", "Veterans", "Wales", "Scotland", "Rivers",
+]
+TITLE_QUALIFIERS = [
+    "", "", "", "", "Rural", "Regional", "National", "Public", "Civil", "Digital",
+    "Maritime", "Industrial", "Local", "Northern", "Historic", "Independent",
+]
+STOP_WORDS = {"of", "for", "on", "and", "the"}
+
+LINK_FIELDS = [
+    "parent_organisations",
+    "child_organisations",
+    "superseded_organisations",
+    "superseding_organisations",
+]
+
+
+def _choice(rng: np.random.Generator, weights: dict, size: int) -> list:
+
+    """
+    Return size keys of weights, drawn in proportion to their weights
+    """
+
+    keys = list(weights)
+    p = np.array([weights[key] if not isinstance(weights[key], tuple) else weights[key][0] for key in keys], dtype=float)
+    positions = rng.choice(len(keys), size=size, p=p / p.sum())
+
+    return [keys[position] for position in positions]
+
+
+def _link(slug: str) -> dict:
+    return {"id": API_URL + slug, "web_url": WEB_URL + slug}
+
+
+def _slugify(title: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-")
+
+
+def _timestamp(rng: np.random.Generator, start: int = 2013, end: int = 2025) -> datetime.datetime:
+    start = datetime.datetime(start, 1, 1, tzinfo=datetime.timezone.utc)
+    seconds = (datetime.datetime(end, 7, 31, tzinfo=datetime.timezone.utc) - start).total_seconds()
+
+    return start + datetime.timedelta(seconds=int(rng.integers(seconds)))
+
+
+def _title(rng: np.random.Generator, titles: set) -> str:
+
+    """
+    Return a title not already in titles, and add it
+    """
+
+    qualifier = TITLE_QUALIFIERS[rng.integers(len(TITLE_QUALIFIERS))]
+    topics = rng.choice(len(TITLE_TOPICS), size=rng.integers(1, 3), replace=False)
+    topic = " and ".join(TITLE_TOPICS[i] for i in topics)
+    title = f"{TITLE_KINDS[rng.integers(len(TITLE_KINDS))]} {qualifier} {topic}".replace("  ", " ")
+
+    if title in titles:
+        suffix = 2
+        while f"{title} {suffix}" in titles:
+            suffix += 1
+        title = f"{title} {suffix}"
+
+    titles.add(title)
+
+    return title
+
+
+def _record(
+        rng: np.random.Generator,
+        title: str,
+        format: str,
+        status: tuple,
+        analytics_identifier: str
+        ) -> dict:
+
+    """
+    Return a record with no links, in the key order of the API
+    """
+
+    slug = _slugify(title)
+    words = [word for word in title.split() if word.lower() not in STOP_WORDS and not word.isdigit()]
+    closed = status[0] == "closed"
+
+    return {
+        "id": API_URL + slug,
+        "title": title,
+        "format": format,
+        "updated_at": _timestamp(rng).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "web_url": WEB_URL + slug,
+        "details": {
+            "slug": slug,
+            "abbreviation": "".join(word[0] for word in words).upper() if rng.random() < 0.8 else None,
+            "logo_formatted_name": title,
+            "organisation_brand_colour_class_name": None,
+            "organisation_logo_type_class_name": _choice(rng, LOGO_TYPES, 1)[0],
+            "closed_at": (
+                _timestamp(rng).strftime("%Y-%m-%dT00:00:00.000+01:00")
+                if closed and rng.random() < 0.5 else None
+            ),
+            "govuk_status": status[0],
+            "govuk_closed_status": status[1],
+            "content_id": str(uuid.UUID(bytes=rng.bytes(16), version=4)),
+        },
+        "analytics_identifier": analytics_identifier,
+        "parent_organisations": [],
+        "child_organisations": [],
+        "superseded_organisations": [],
+        "superseding_organisations": [],
+    }
+
+
+def _heavy_tailed_weights(rng: np.random.Generator, n: int) -> np.ndarray:
+
+    """
+    Return weights for choosing among n organisations, such that a few are chosen
+    far more often than the rest
+    """
+
+    weights = rng.pareto(1.2, size=n) + 0.05
+
+    return weights / weights.sum()
+
+
+# %%
+# Generating records
+
+
+def generate_records(scale: float = 1, seed: int = 0, count: Optional[int] = None) -> list:
+
+    """
+    Return synthetic organisation records, in the same form as those returned by
+    the API, sorted by slug
+
+    Parameters
+        - scale: The number of records relative to the real data
+        - seed: Seed for the random number generator
+        - count: The number of records, in place of scale
+
+    """
+
+    rng = np.random.default_rng(seed)
+    n = count if count is not None else max(int(round(REAL_COUNT * scale)), 2)
+
+    formats = _choice(rng, FORMATS, n)
+    # Ensure there's somewhere to hang the forest from
+    formats[0] = "Ministerial department"
+    statuses = _choice(rng, STATUSES, n)
+
+    titles = set()
+    identifiers = {}
+    records = []
+    for format, status in zip(formats, statuses):
+        prefix = FORMATS[format][1]
+        identifiers[prefix] = identifiers.get(prefix, 0) + 1
+        records.append(_record(rng, _title(rng, titles), format, status, f"{prefix}{identifiers[prefix]}"))
+
+    _add_parents(rng, records)
+    _add_successors(rng, records)
+
+    return sorted(records, key=lambda record: record["details"]["slug"])
+
+
+def _add_parents(rng: np.random.Generator, records: list) -> None:
+
+    """
+    Link organisations to their parents, departments first and then organisations
+    with children of their own, so that links always run down the forest
+    """
+
+    is_top = np.array([record["format"] in TOP_FORMATS for record in records])
+    can_be_middle = np.array([record["format"] in MIDDLE_FORMATS for record in records]) & ~is_top
+
+    top = np.flatnonzero(is_top)
+    middle = np.flatnonzero(can_be_middle)
+    middle = middle[:max(len(middle) // 20, 1)]
+    is_middle = np.zeros(len(records), dtype=bool)
+    is_middle[middle] = True
+    rest = np.flatnonzero(~is_top & ~is_middle)
+
+    def link(child: int, parent: int) -> None:
+        records[child]["parent_organisations"].append(_link(records[parent]["details"]["slug"]))
+        records[parent]["child_organisations"].append(_link(records[child]["details"]["slug"]))
+
+    # Organisations with children of their own sit directly beneath a department
+    top_weights = _heavy_tailed_weights(rng, len(top))
+    for i, parent in zip(middle, rng.choice(top, size=len(middle), p=top_weights)):
+        link(i, parent)
+
+    # Draw every other organisation's parents in one go, mostly departments
+    parent_counts = np.array(_choice(rng, PARENT_COUNTS, len(rest)))
+    draws = parent_counts.sum()
+    parents = np.where(
+        rng.random(draws) < 0.1,
+        rng.choice(middle, size=draws, p=_heavy_tailed_weights(rng, len(middle))),
+        rng.choice(top, size=draws, p=top_weights),
+    )
+
+    for i, drawn in zip(rest, np.split(parents, np.cumsum(parent_counts)[:-1])):
+        for parent in sorted(set(drawn.tolist())):
+            link(i, parent)
+
+    # Some departments' brand colours follow their own slug, and their children's theirs
+    for i in top:
+        if rng.random() < 0.7:
+            records[i]["details"]["organisation_brand_colour_class_name"] = records[i]["details"]["slug"]
+    for record in records:
+        if record["details"]["organisation_brand_colour_class_name"] is None and record["parent_organisations"]:
+            parent_slug = record["parent_organisations"][0]["id"][len(API_URL):]
+            if rng.random() < 0.6:
+                record["details"]["organisation_brand_colour_class_name"] = parent_slug
+
+
+def _add_successors(rng: np.random.Generator, records: list) -> None:
+
+    """
+    Link closed organisations that were replaced, merged, split or renamed to the
+    organisations that superseded them. Successors are mostly open, with the rest
+    closed organisations later in a random order, so chains don't loop
+    """
+
+    superseded = [
+        (i, SUCCESSORS[record["details"]["govuk_closed_status"]])
+        for i, record in enumerate(records)
+        if record["details"]["govuk_closed_status"] in SUCCESSORS
+    ]
+    open_ = np.array([i for i, record in enumerate(records) if record["details"]["govuk_status"] != "closed"])
+    if not superseded or not len(open_):
+        return
+
+    closed = np.array([i for i, record in enumerate(records) if record["details"]["govuk_status"] == "closed"])
+    rank = np.full(len(records), -1)
+    rank[closed] = rng.permutation(len(closed))
+    closed_by_rank = np.empty(len(closed), dtype=int)
+    closed_by_rank[rank[closed]] = closed
+
+    draws = sum(count for _, count in superseded)
+    open_successors = iter(rng.choice(open_, size=draws, p=_heavy_tailed_weights(rng, len(open_))).tolist())
+    use_closed = iter((rng.random(draws) < 0.15).tolist())
+    offsets = iter(rng.integers(1, 50, size=draws).tolist())
+
+    for i, successor_count in superseded:
+        successors = set()
+        for _ in range(successor_count):
+            successor, offset = next(open_successors), next(offsets)
+            if next(use_closed) and rank[i] + offset < len(closed):
+                successor = int(closed_by_rank[rank[i] + offset])
+            if successor != i:
+                successors.add(successor)
+
+        for successor in sorted(successors):
+            records[i]["superseding_organisations"].append(_link(records[successor]["details"]["slug"]))
+            records[successor]["superseded_organisations"].append(_link(records[i]["details"]["slug"]))
+
+
+# %%
+# Generating a series of snapshots
+
+
+def evolve(records: list, date: datetime.date, seed: int = 0, churn: float = 0.002) -> list:
+
+    """
+    Return the next day's records: a copy of records with a share of organisations
+    renamed, closed and replaced, re-parented, updated in place or newly added
+
+    Parameters
+        - records: The previous day's records
+        - date: The new day's date, used as updated_at for changed records
+        - seed: Seed for the random number generator
+        - churn: The share of organisations changing per day
+
+    """
+
+    rng = np.random.default_rng([seed, date.toordinal()])
+    records = json.loads(json.dumps(records))
+    by_slug = {record["details"]["slug"]: record for record in records}
+    titles = {record["title"] for record in records}
+    updated_at = datetime.datetime.combine(date, datetime.time(9)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    open_ = [record for record in records if record["details"]["govuk_status"] != "closed"]
+    tops = [record for record in open_ if record["format"] in TOP_FORMATS]
+    change_count = rng.binomial(len(records), churn)
+    changes = rng.choice(["rename", "close", "reparent", "update", "add"], size=change_count, p=[0.15, 0.15, 0.15, 0.4, 0.15])
+
+    next_identifier = len(records)
+    for change in changes:
+        record = open_[rng.integers(len(open_))]
+        slug = record["details"]["slug"]
+
+        if change in ("rename", "close", "add"):
+            next_identifier += 1
+            status = ("live", None) if change != "add" else _choice(rng, STATUSES, 1)[0]
+            new = _record(rng, _title(rng, titles), record["format"], status, f"SY{next_identifier}")
+            new["updated_at"] = updated_at
+            records.append(new)
+            by_slug[new["details"]["slug"]] = new
+
+            if change == "add":
+                continue
+
+            # The new organisation takes over the old one's place in the forest
+            for parent in record["parent_organisations"]:
+                new["parent_organisations"].append(parent)
+                by_slug[parent["id"][len(API_URL):]]["child_organisations"].append(_link(new["details"]["slug"]))
+
+            record["details"]["govuk_status"] = "closed"
+            record["details"]["govuk_closed_status"] = "changed_name" if change == "rename" else "replaced"
+            record["details"]["closed_at"] = f"{date.isoformat()}T00:00:00.000+01:00"
+            record["superseding_organisations"].append(_link(new["details"]["slug"]))
+            new["superseded_organisations"].append(_link(slug))
+
+        elif change == "reparent" and record["format"] not in TOP_FORMATS:
+            if not tops:
+                continue
+            parent = tops[rng.integers(len(tops))]
+            if parent["details"]["slug"] in {link["id"][len(API_URL):] for link in record["parent_organisations"]}:
+                continue
+
+            for old in record["parent_organisations"]:
+                old_parent = by_slug[old["id"][len(API_URL):]]
+                old_parent["child_organisations"] = [
+                    link for link in old_parent["child_organisations"] if link["id"] != API_URL + slug
+                ]
+                old_parent["updated_at"] = updated_at
+
+            record["parent_organisations"] = [_link(parent["details"]["slug"])]
+            parent["child_organisations"].append(_link(slug))
+            parent["updated_at"] = updated_at
+
+        else:
+            words = [word for word in record["title"].split() if word.lower() not in STOP_WORDS]
+            record["details"]["abbreviation"] = "".join(word[0] for word in words).upper() + str(rng.integers(10))
+
+        record["updated_at"] = updated_at
+
+    return sorted(records, key=lambda record: record["details"]["slug"])
+
+
+def generate_snapshots(
+        scale: float = 1,
+        snapshots: int = 30,
+        start: datetime.date = datetime.date(2025, 1, 1),
+        seed: int = 0,
+        churn: float = 0.002
+        ) -> Iterator[tuple]:
+
+    """
+    Yield (date as YYYYMMDD, records) for a series of daily snapshots, starting from
+    generate_records() and evolving by evolve() each day
+
+    Parameters
+        - scale: The number of records on the first day, relative to the real data
+        - snapshots: The number of snapshots
+        - start: The date of the first snapshot
+        - seed: Seed for the random number generator
+        - churn: The share of organisations changing per day
+
+    """
+
+    records = generate_records(scale, seed=seed)
+
+    for day in range(snapshots):
+        date = start + datetime.timedelta(days=day)
+        if day:
+            records = evolve(records, date, seed=seed, churn=churn)
+        yield date.strftime("%Y%m%d"), records
+
+
+# %%
+# Command-line interface
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic organisations data")
+    parser.add_argument("--scale", type=float, default=1, help="Number of records relative to the real data (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random number generator (default: 0)")
+    parser.add_argument("--output", help="Organisations file to write, with the last snapshot's records if --snapshots is given")
+    parser.add_argument("--snapshots", type=int, default=1, help="Number of daily snapshots to generate (default: 1)")
+    parser.add_argument("--churn", type=float, default=0.002, help="Share of organisations changing per day (default: 0.002)")
+    parser.add_argument("--store", help="Snapshot store to ingest the snapshots into")
+
+    args = parser.parse_args(argv)
+
+    if not args.output and not args.store:
+        parser.error("give --output, --store or both")
+
+    store = None
+    if args.store:
+        from snapshot_store import SnapshotStore
+
+        store = SnapshotStore(args.store)
+
+    for date, records in generate_snapshots(args.scale, args.snapshots, seed=args.seed, churn=args.churn):
+        if store is not None:
+            store.ingest(records, date, source="synthetic")
+
+    if store is not None:
+        store.close()
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(records, f)
+        print(f"Wrote {len(records)} organisations to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+# The scripts are flat modules in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Pages of the API, cut from the first records of organisations.json
+API_PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "api_pages")
+
+
+def load_api_pages() -> list:
+
+    """
+    Return the fixture pages of the API, in page order
+    """
+
+    paths = sorted(
+        glob.glob(os.path.join(API_PAGES_DIR, "page_*.json")),
+        key=lambda path: int(os.path.basename(path)[len("page_"):-len(".json")])
+    )
+
+    pages = []
+    for path in paths:
+        with open(path) as f:
+            pages.append(json.load(f))
+
+    return pages
+
+
+def make_record(i: int, **changes) -> dict:
+
+    """
+    Return a minimal organisation record, in the form returned by the API
+
+    Parameters
+        - i: A number making the record's identifiers unique
+        - changes: Values to replace, e.g. title='...'
+
+    """
+
+    record = {
+        "id": f"https://www.gov.uk/api/organisations/org-{i}",
+        "title": f"Organisation {i}",
+        "format": "Other",
+        "updated_at": f"2024-01-01T00:00:{i % 60:02d}.000+00:00",
+        "web_url": f"https://www.gov.uk/government/organisations/org-{i}",
+        "details": {
+            "slug": f"org-{i}",
+            "abbreviation": None,
+            "logo_formatted_name": f"Organisation {i}",
+            "organisation_brand_colour_class_name": None,
+            "organisation_logo_type_class_name": "no-identity",
+            "closed_at": None,
+            "govuk_status": "live",
+            "govuk_closed_status": None,
+            "content_id": f"00000000-0000-0000-0000-{i:012d}",
+        },
+        "analytics_identifier": f"OT{i}",
+        "parent_organisations": [],
+        "child_organisations": [],
+        "superseded_organisations": [],
+        "superseding_organisations": [],
+    }
+    record.update(changes)
+
+    return record
+
+
+class StubAPI:
+
+    """
+    Stand-in for the GOV.UK organisations API, serving records page by page
+    from a local HTTP server, with ETags and 304s for unchanged pages
+
+    Pages in failing get a 404. Pages in unavailable get a 503 for as many
+    requests as the value given, then are served as normal
+
+    Parameters
+        - records: The records to serve
+        - page_size: The number of records per page
+        - delay: Seconds to wait before answering each request, as a function of
+          the page number, if any
+
+    """
+
+    def __init__(self, records: list, page_size: int = 5, delay=None):
+        self.records = records
+        self.page_size = page_size
+        self.delay = delay
+        self.failing = set()
+        self.unavailable = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                page_number = int(parse_qs(urlsplit(self.path).query)["page"][0])
+
+                with api._lock:
+                    api.requests.append((page_number, self.headers.get("If-None-Match")))
+                    api.in_flight += 1
+                    api.max_in_flight = max(api.max_in_flight, api.in_flight)
+
+                try:
+                    if api.delay is not None:
+                        time.sleep(api.delay(page_number))
+                    self._respond(page_number)
+                finally:
+                    with api._lock:
+                        api.in_flight -= 1
+
+            def _respond(self, page_number):
+                if page_number in api.failing:
+                    self._send(404, b"Not found")
+                    return
+
+                with api._lock:
+                    unavailable = api.unavailable.get(page_number, 0) > 0
+                    if unavailable:
+                        api.unavailable[page_number] -= 1
+                if unavailable:
+                    self._send(503, b"Service unavailable")
+                    return
+
+                body = json.dumps(api.page(page_number)).encode()
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, b"", etag)
+                else:
+                    self._send(200, body, etag)
+
+            def _send(self, status, body, etag=None):
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url_stub = f"http://127.0.0.1:{self.server.server_address[1]}/api/organisations?page="
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def page_count(self) -> int:
+        return max(-(-len(self.records) // self.page_size), 1)
+
+    def page(self, page_number: int) -> dict:
+        start = (page_number - 1) * self.page_size
+        return {
+            "results": self.records[start:start + self.page_size],
+            "total": len(self.records),
+            "pages": self.page_count,
+            "current_page": page_number,
+            "page_size": self.page_size,
+            "start_index": start + 1,
+        }
+
+    def requested_pages(self) -> list:
+        return sorted(page_number for page_number, _ in self.requests)
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_api():
+    pages = load_api_pages()
+    api = StubAPI([record for page in pages for record in page["results"]], page_size=pages[0]["page_size"])
+    yield api
+    api.close()
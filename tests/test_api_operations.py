@@ -0,0 +1,225 @@
+import json
+import os
+
+import pytest
+
+import api_operations
+from conftest import StubAPI, load_api_pages
+
+HEADERS = {"accept": "application/json"}
+
+
+# %%
+# Fetching pages
+
+
+def test_stub_serves_the_fixture_pages(stub_api):
+    pages = load_api_pages()
+
+    with api_operations.create_session() as session:
+        fetched = [
+            api_operations.fetch_page(session, stub_api.url_stub, page_number, HEADERS)
+            for page_number in range(1, len(pages) + 1)
+        ]
+
+    assert fetched == pages
+
+
+def test_unavailable_page_is_retried_with_backoff(stub_api, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(api_operations.time, "sleep", sleeps.append)
+    stub_api.unavailable = {2: 2}
+
+    with api_operations.create_session() as session:
+        data = api_operations.fetch_page(session, stub_api.url_stub, 2, HEADERS)
+
+    assert data == stub_api.page(2)
+    assert stub_api.requested_pages() == [2, 2, 2]
+    assert sleeps == [5, 10]
+
+
+def test_page_unavailable_on_every_attempt_is_given_up_on(stub_api, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(api_operations.time, "sleep", sleeps.append)
+    stub_api.unavailable = {2: 3}
+
+    with api_operations.create_session() as session:
+        data = api_operations.fetch_page(session, stub_api.url_stub, 2, HEADERS, max_retries=3)
+
+    assert data is None
+    assert stub_api.requested_pages() == [2, 2, 2]
+    assert sleeps == [5, 10]
+
+
+def test_pages_fetched_concurrently_are_written_in_order(tmp_path):
+    records = [record for page in load_api_pages() for record in page["results"]]
+
+    # Later pages answer sooner, so pages complete out of order
+    api = StubAPI(records, page_size=1, delay=lambda page_number: 0.01 * (len(records) - page_number))
+    try:
+        checkpoints = api_operations.CheckpointStore(str(tmp_path / "checkpoints"))
+        api_operations.fetch_to_checkpoints(api.url_stub, HEADERS, checkpoints, max_workers=8)
+
+        path = str(tmp_path / "organisations.json")
+        count = api_operations.write_records(checkpoints.iter_pages(), path)
+    finally:
+        api.close()
+
+    assert api.max_in_flight > 1
+    assert api.requested_pages() == list(range(1, len(records) + 1))
+    assert count == len(records)
+    with open(path) as f:
+        assert json.load(f) == records
+
+
+# %%
+# Conditional requests and PageCache
+
+
+def test_unchanged_page_is_served_from_cache(stub_api, tmp_path):
+    cache = api_operations.PageCache(str(tmp_path / "pages"))
+    url = stub_api.url_stub + "1"
+
+    with api_operations.create_session() as session:
+        first = api_operations.fetch_page(session, stub_api.url_stub, 1, HEADERS, cache=cache)
+        cache.commit()
+
+        cache = api_operations.PageCache(str(tmp_path / "pages"))
+        second = api_operations.fetch_page(session, stub_api.url_stub, 1, HEADERS, cache=cache)
+
+    assert second == first == stub_api.page(1)
+
+    # The second request carries the first's ETag, and the server answered 304
+    (_, first_etag), (_, second_etag) = stub_api.requests
+    assert first_etag is None
+    assert second_etag == cache.get(url)["etag"]
+    assert cache.unchanged == 1 and cache.changed == 0
+    assert cache.all_unchanged()
+
+
+def test_changed_page_is_pending_until_commit(stub_api, tmp_path):
+    cache = api_operations.PageCache(str(tmp_path / "pages"))
+    url = stub_api.url_stub + "1"
+
+    with api_operations.create_session() as session:
+        api_operations.fetch_page(session, stub_api.url_stub, 1, HEADERS, cache=cache)
+
+        # Until committed, the page isn't used to make requests conditional
+        assert cache.has_pending()
+        assert cache.get(url) is None
+        assert cache.conditional_headers(url) == {}
+        assert not cache.all_unchanged()
+
+        cache.commit()
+        committed = cache.get(url)
+        assert not cache.has_pending()
+        assert json.loads(committed["body"]) == stub_api.page(1)
+
+        stub_api.records[0] = {**stub_api.records[0], "title": "Renamed organisation"}
+        cache = api_operations.PageCache(str(tmp_path / "pages"))
+        data = api_operations.fetch_page(session, stub_api.url_stub, 1, HEADERS, cache=cache)
+
+    assert data["results"][0]["title"] == "Renamed organisation"
+    assert stub_api.requests[-1] == (1, committed["etag"])
+    assert cache.changed == 1 and not cache.all_unchanged()
+
+    # The committed copy is kept until the new one is committed
+    assert cache.get(url) == committed
+    cache.commit()
+    assert json.loads(cache.get(url)["body"])["results"][0]["title"] == "Renamed organisation"
+
+
+def test_pending_pages_survive_a_failed_run(stub_api, tmp_path):
+    cache = api_operations.PageCache(str(tmp_path / "pages"))
+
+    with api_operations.create_session() as session:
+        api_operations.fetch_page(session, stub_api.url_stub, 1, HEADERS, cache=cache)
+
+        # A run that fails before committing leaves its change pending, so the next
+        # run neither makes the request conditional nor treats the page as unchanged
+        cache = api_operations.PageCache(str(tmp_path / "pages"))
+        api_operations.fetch_page(session, stub_api.url_stub, 1, HEADERS, cache=cache)
+
+    assert [etag for _, etag in stub_api.requests] == [None, None]
+    assert cache.changed == 1
+    assert cache.has_pending()
+    assert not cache.all_unchanged()
+
+
+def extract(url_stub: str, directory, path: str) -> api_operations.PageCache:
+
+    """
+    Fetch every page through a cache and checkpoints in directory, and write the
+    records to path, as extract_data.py does
+    """
+
+    cache = api_operations.PageCache(str(directory / "pages"))
+    checkpoints = api_operations.CheckpointStore(str(directory / "checkpoints"))
+    api_operations.fetch_to_checkpoints(url_stub, HEADERS, checkpoints, cache=cache)
+    api_operations.write_records(checkpoints.iter_pages(), path, cache=cache)
+    checkpoints.clear()
+
+    return cache
+
+
+def test_write_records_leaves_unchanged_file_untouched(stub_api, tmp_path):
+    path = str(tmp_path / "organisations.json")
+
+    assert not extract(stub_api.url_stub, tmp_path, path).all_unchanged()
+    os.utime(path, (0, 0))
+
+    assert extract(stub_api.url_stub, tmp_path, path).all_unchanged()
+    assert os.path.getmtime(path) == 0
+    with open(path) as f:
+        assert json.load(f) == stub_api.records
+
+
+# %%
+# Resuming from checkpoints
+
+
+def test_rerun_fetches_only_failed_pages(stub_api, tmp_path):
+    stub_api.page_size = 2
+    stub_api.failing = {3, 5}
+    checkpoints = api_operations.CheckpointStore(str(tmp_path / "checkpoints"))
+
+    with pytest.raises(api_operations.IncompleteRetrievalError, match=r"\[3, 5\]"):
+        api_operations.fetch_to_checkpoints(stub_api.url_stub, HEADERS, checkpoints)
+
+    assert checkpoints.missing_pages() == [3, 5]
+    assert stub_api.requested_pages() == list(range(1, stub_api.page_count + 1))
+
+    stub_api.failing = set()
+    stub_api.requests = []
+    api_operations.fetch_to_checkpoints(stub_api.url_stub, HEADERS, checkpoints)
+
+    assert stub_api.requested_pages() == [3, 5]
+    assert checkpoints.missing_pages() == []
+
+    resumed_path = str(tmp_path / "resumed.json")
+    api_operations.write_records(checkpoints.iter_pages(), resumed_path)
+
+    clean_path = str(tmp_path / "clean.json")
+    extract(stub_api.url_stub, tmp_path / "clean", clean_path)
+
+    with open(resumed_path) as resumed, open(clean_path) as clean:
+        assert resumed.read() == clean.read()
+    with open(resumed_path) as f:
+        assert json.load(f) == stub_api.records
+
+
+def test_stale_checkpoints_are_discarded(tmp_path):
+    directory = str(tmp_path / "checkpoints")
+    checkpoints = api_operations.CheckpointStore(directory)
+    checkpoints.start(2)
+    checkpoints.save(1, [])
+
+    # A run a little under a day later, as the next day's scheduled run starting early
+    manifest = checkpoints.manifest()
+    manifest["started_at"] -= 23 * 60 * 60
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    checkpoints = api_operations.CheckpointStore(directory)
+    assert checkpoints.manifest() is None
+    assert os.listdir(directory) == []
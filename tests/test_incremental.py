@@ -0,0 +1,39 @@
+import json
+
+from conftest import load_api_pages
+from incremental import ChangeTracker
+
+RECORDS = [record for page in load_api_pages() for record in page["results"]]
+
+
+def pages(records: list, page_size: int = 5) -> list:
+    return [(i // page_size + 1, records[i:i + page_size]) for i in range(0, len(records), page_size)]
+
+
+def test_changeset_from_previous_records_added_a_page_at_a_time(tmp_path):
+    changes_path = str(tmp_path / "organisations_changes.json")
+    watermark = max(record["updated_at"] for record in RECORDS)
+
+    new_records = [dict(record) for record in RECORDS[1:]]
+    new_records[0]["updated_at"] = "2099-01-01T00:00:00Z"
+    new_records.append({**RECORDS[0], "analytics_identifier": "OT9999"})
+
+    tracker = ChangeTracker([], changes_path)
+    for _, records in pages(RECORDS):
+        tracker.add_previous(records)
+
+    assert list(tracker.track(pages(new_records))) == pages(new_records)
+    tracker.write(changes_path)
+
+    with open(changes_path) as f:
+        assert json.load(f) == {
+            "previous_watermark": watermark,
+            "watermark": "2099-01-01T00:00:00Z",
+            "added": ["OT9999"],
+            "changed": [new_records[0]["analytics_identifier"]],
+            "removed": [RECORDS[0]["analytics_identifier"]],
+        }
+
+    # The next run takes its high-water mark from the changeset, not the records
+    tracker = ChangeTracker(new_records, changes_path)
+    assert tracker.previous_watermark == "2099-01-01T00:00:00Z"
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+import json_operations
+from conftest import load_api_pages
+
+RECORDS = [record for page in load_api_pages() for record in page["results"]]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_iter_records_matches_reading_the_whole_file(tmp_path, chunk_size, indent):
+    path = str(tmp_path / "organisations.json")
+    with open(path, "w") as f:
+        json.dump(RECORDS, f, indent=indent)
+
+    assert list(json_operations.iter_records(path, chunk_size=chunk_size)) == json_operations.read_records(path) == RECORDS
+
+
+def test_iter_records_reads_ndjson(tmp_path):
+    path = str(tmp_path / "organisations.ndjson")
+    with open(path, "w") as f:
+        f.write("\n".join(json.dumps(record) for record in RECORDS) + "\n")
+
+    assert list(json_operations.iter_records(path, chunk_size=5)) == RECORDS
+
+
+@pytest.mark.parametrize("text", ["[]", "  [ ]\n", ""])
+def test_iter_records_of_an_empty_file(tmp_path, text):
+    path = tmp_path / "organisations.json"
+    path.write_text(text)
+
+    assert list(json_operations.iter_records(str(path), chunk_size=1)) == []
+
+
+def test_iter_pages_yields_page_size_records_at_a_time(tmp_path):
+    path = str(tmp_path / "organisations.json")
+    with open(path, "w") as f:
+        json.dump(RECORDS, f)
+
+    pages = list(json_operations.iter_pages(path, page_size=6))
+
+    assert [page_number for page_number, _ in pages] == [1, 2, 3, 4]
+    assert [len(records) for _, records in pages] == [6, 6, 6, 2]
+    assert [record for _, records in pages for record in records] == RECORDS
@@ -0,0 +1,94 @@
+import pandas as pd
+
+from conftest import make_record
+from lineage import Lineage, remap
+
+API_PREFIX = "https://www.gov.uk/api/organisations/"
+
+
+def link(slug: str) -> dict:
+    return {"id": API_PREFIX + slug, "web_url": f"https://www.gov.uk/government/organisations/{slug}"}
+
+
+def slugged(i: int, slug: str, **changes) -> dict:
+    record = make_record(i, **changes)
+    record["details"] = {**record["details"], "slug": slug}
+    return record
+
+
+def records() -> list:
+
+    """
+    Return records in which old-name was renamed to mid-name then new-name,
+    old-split split into part-a and part-b, merged-1 and merged-2 merged into
+    part-a, and loop-1 and loop-2 supersede each other. gone is superseded by
+    not-in-data, which isn't itself in the records
+    """
+
+    return [
+        slugged(1, "old-name", superseding_organisations=[link("mid-name")]),
+        # The rename from mid-name is only recorded on new-name's side
+        slugged(2, "mid-name"),
+        slugged(3, "new-name", superseded_organisations=[link("mid-name")]),
+        slugged(4, "old-split", superseding_organisations=[link("part-a"), link("part-b")]),
+        slugged(5, "part-a"),
+        slugged(6, "part-b"),
+        slugged(7, "merged-1", superseding_organisations=[link("part-a")]),
+        slugged(8, "merged-2", superseding_organisations=[link("part-a")]),
+        slugged(9, "loop-1", superseding_organisations=[link("loop-2")]),
+        slugged(10, "loop-2", superseding_organisations=[link("loop-1")]),
+        slugged(11, "gone", superseding_organisations=[link("not-in-data")]),
+    ]
+
+
+def test_resolve_follows_renames_splits_and_merges():
+    lineage = Lineage(records())
+
+    assert lineage.resolve("old-name") == {"new-name"}
+    assert lineage.resolve("old-split") == {"part-a", "part-b"}
+    assert lineage.resolve("merged-1") == lineage.resolve("merged-2") == {"part-a"}
+    assert lineage.resolve("new-name") == {"new-name"}
+    assert lineage.resolve("gone") == {"not-in-data"}
+    assert "not-in-data" in lineage
+
+    # Organisations in a cycle with no way out resolve to themselves
+    assert lineage.resolve("loop-1") == {"loop-1"}
+    assert lineage.resolve("loop-2") == {"loop-2"}
+
+
+def test_successor_table():
+    lookup = Lineage(records()).successor_table(["old-name", "old-split", "gone"]).set_index(["slug", "successor_slug"])
+
+    assert list(lookup.index) == [
+        ("old-name", "new-name"), ("old-split", "part-a"), ("old-split", "part-b"), ("gone", "not-in-data")
+    ]
+    assert list(lookup["analytics_identifier"]) == ["OT1", "OT4", "OT4", "OT11"]
+    assert list(lookup["successor_analytics_identifier"].fillna("")) == ["OT3", "OT5", "OT6", ""]
+    assert list(lookup["successor_count"]) == [1, 2, 2, 1]
+
+
+def test_remap_repeats_splits_and_keeps_unknown_organisations():
+    lookup = Lineage(records()).successor_table()
+    df = pd.DataFrame({"org": ["old-name", "old-split", "unknown"], "value": [1, 2, 3]})
+
+    df_remapped = remap(df, "org", lookup)
+
+    assert list(df_remapped["org"]) == ["old-name", "old-split", "old-split", "unknown"]
+    assert list(df_remapped["successor_slug"].fillna("")) == ["new-name", "part-a", "part-b", ""]
+    assert list(df_remapped["value"]) == [1, 2, 2, 3]
+    assert "slug" not in df_remapped.columns
+
+
+def test_remap_doesnt_match_null_keys():
+    lookup = Lineage(records()).successor_table()
+
+    # not-in-data has no analytics_identifier in the lookup, so mustn't match the null here
+    assert lookup["analytics_identifier"].isna().any()
+
+    df = pd.DataFrame({"identifier": ["OT1", None], "value": [1, 2]})
+    df_remapped = remap(df, "identifier", lookup, key="analytics_identifier")
+
+    assert len(df_remapped) == 2
+    assert list(df_remapped["value"]) == [1, 2]
+    assert df_remapped.loc[0, "successor_slug"] == "new-name"
+    assert pd.isna(df_remapped.loc[1, "successor_slug"])
@@ -0,0 +1,39 @@
+import pandas as pd
+
+import matching
+from match_store import MatchStore
+
+
+def test_limit_holds_when_right_names_normalise_the_same():
+    df_matches = matching.match_names(
+        ["Department for Transport"], ["Dept for Transport", "Dept. for Transport"], limit=1
+    )
+
+    assert list(df_matches["right"]) == ["Dept for Transport"]
+    assert list(df_matches["rank"]) == [1]
+
+
+def test_fuzzy_merge_returns_one_row_per_left_row():
+    df_left = pd.DataFrame({"name": ["Department for Transport", "HM Treasury"]})
+    df_right = pd.DataFrame({
+        "title": ["Dept for Transport", "Dept. for Transport", "His Majesty's Treasury"],
+        "code": ["D9", "D9b", "D15"],
+    })
+
+    df_merge = matching.fuzzy_merge(df_left, df_right, "name", "title")
+
+    assert list(df_merge["name"]) == ["Department for Transport", "HM Treasury"]
+    assert list(df_merge["code"]) == ["D9", "D15"]
+
+
+def test_stored_score_of_zero_is_used_for_confirmed_pairs(tmp_path):
+    store = MatchStore(str(tmp_path / "matches.db"))
+    pair = (matching.normalise_name("Office for Students"), matching.normalise_name("Student Loans Company"))
+    store.save_scores([(pair, 0)], matching.SCORER_VERSION)
+    store.set_override("Office for Students", "Student Loans Company", "match")
+
+    df_matches = matching.match_names(["Office for Students"], ["Student Loans Company"], store=store)
+    store.close()
+
+    assert list(df_matches["decision"]) == ["manual"]
+    assert list(df_matches["score"]) == [0]
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+from org_graph import OrgGraph, affected_ancestors, closure_table, update_closure_table
+
+# A diamond under dept - dept -> agency-a, agency-b -> office - and a cycle between
+# board-x and board-y, with board-y over panel-z
+NODES = ["dept", "agency-a", "agency-b", "office", "board-x", "board-y", "panel-z", "standalone"]
+EDGES = [
+    ("dept", "agency-a"),
+    ("dept", "agency-b"),
+    ("agency-a", "office"),
+    ("agency-b", "office"),
+    ("board-x", "board-y"),
+    ("board-y", "board-x"),
+    ("board-y", "panel-z"),
+    # Ignored, as unknown-org isn't in the graph
+    ("unknown-org", "dept"),
+]
+
+
+def sorted_closure(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(["ancestor_id", "descendant_id"], ignore_index=True)
+
+
+def test_adjacency_is_held_in_csr_form():
+    graph = OrgGraph(NODES, EDGES)
+
+    assert list(graph.child_offsets) == [0, 2, 3, 4, 4, 5, 7, 7, 7]
+    assert [graph.slugs[node] for node in graph.child_targets] == [
+        "agency-a", "agency-b", "office", "office", "board-y", "board-x", "panel-z"
+    ]
+    assert graph.children("dept") == ["agency-a", "agency-b"]
+    assert graph.parents("office") == ["agency-a", "agency-b"]
+    assert graph.parents("dept") == []
+    assert graph.edges() == set(EDGES[:-1])
+
+
+def test_cycles_and_closures():
+    graph = OrgGraph(NODES, EDGES)
+
+    assert [sorted(cycle) for cycle in graph.cycles()] == [["board-x", "board-y"]]
+
+    # Organisations in a cycle are each other's ancestors and descendants, and their own
+    assert graph.descendants("board-x") == {"board-x", "board-y", "panel-z"}
+    assert graph.ancestors("panel-z") == {"board-x", "board-y"}
+    assert graph.ancestors("board-y") == {"board-x", "board-y"}
+
+    # The diamond's bottom is reached by two paths, but listed once
+    assert graph.descendants("dept") == {"agency-a", "agency-b", "office"}
+    assert graph.ancestors("office") == {"dept", "agency-a", "agency-b"}
+    assert graph.is_descendant("office", "dept")
+    assert not graph.is_descendant("dept", "office")
+    assert graph.lowest_common_ancestors("agency-a", "agency-b") == ["dept"]
+    assert graph.lowest_common_ancestors("office", "agency-a") == ["agency-a"]
+
+    subtree = graph.subtree("dept")
+    assert subtree[0] == "dept" and subtree[-1] == "office"
+
+    assert [graph.depth(slug) for slug in ["dept", "agency-b", "office", "standalone"]] == [0, 1, 2, 0]
+    assert graph.depth("board-x") is None and graph.depth("panel-z") is None
+
+
+def test_closures_are_cached_by_component():
+    graph = OrgGraph(NODES, EDGES)
+    assert graph._descendant_cache == [] and graph._ancestor_cache == []
+
+    graph.descendants("office")
+    cached = len(graph._descendant_cache)
+    assert cached <= len(graph.components)
+
+    graph.build_closures()
+    assert len(graph._descendant_cache) == len(graph._ancestor_cache) == len(graph.components)
+
+    # Later queries are answered from the cache, so return the same sets as computing afresh
+    fresh = OrgGraph(NODES, EDGES)
+    for slug in NODES:
+        assert graph.descendants(slug) == fresh.descendants(slug)
+        assert graph.ancestors(slug) == fresh.ancestors(slug)
+
+
+def test_closure_table_depths_are_shortest_paths():
+    closure = closure_table(OrgGraph(NODES, EDGES), ["dept", "board-x"]).set_index(["ancestor_id", "descendant_id"])
+
+    assert closure.loc[("dept", "dept"), "depth"] == 0
+    assert closure.loc[("dept", "office"), "depth"] == 2
+    assert closure.loc[("board-x", "panel-z"), "depth"] == 2
+    assert closure["depth"].dtype == np.int32
+
+
+def test_edge_update_recomputes_only_affected_rows():
+    old_graph = OrgGraph(NODES, EDGES)
+    old_graph.build_closures()
+    closure = closure_table(old_graph)
+
+    # office moves from under agency-b to under panel-z, and a new organisation joins
+    new_edges = [edge for edge in EDGES if edge != ("agency-b", "office")] + [("panel-z", "office"), ("office", "unit")]
+    new_graph = OrgGraph(NODES + ["unit"], new_edges)
+
+    affected = affected_ancestors(old_graph, new_graph)
+    assert affected == {"agency-b", "dept", "panel-z", "board-x", "board-y", "office", "unit", "agency-a"}
+
+    updated, updated_affected = update_closure_table(closure, old_graph, new_graph)
+    assert updated_affected == affected
+    pd.testing.assert_frame_equal(sorted_closure(updated), sorted_closure(closure_table(new_graph)))
+
+    # Each graph keeps its own caches, so the old graph's closures are unchanged
+    assert old_graph.descendants("board-x") == {"board-x", "board-y", "panel-z"}
+    assert new_graph.descendants("board-x") == {"board-x", "board-y", "panel-z", "office", "unit"}
+    assert new_graph.ancestors("office") == {"dept", "agency-a", "board-x", "board-y", "panel-z"}
@@ -0,0 +1,74 @@
+import pytest
+
+import pipeline
+
+
+def write_script(path, source: str) -> str:
+    path.write_text(source)
+    return str(path)
+
+
+def test_local_imports_are_followed_transitively(tmp_path):
+    write_script(tmp_path / "helpers.py", "import json\nfrom graph import walk\n")
+    write_script(tmp_path / "graph.py", "def walk():\n    import shapes\n")
+    write_script(tmp_path / "shapes.py", "")
+    write_script(tmp_path / "unused.py", "")
+    script = write_script(tmp_path / "stage.py", "import os\nimport helpers\nimport requests\n")
+
+    assert pipeline.local_imports(script) == [str(tmp_path / name) for name in ("graph.py", "helpers.py", "shapes.py")]
+
+
+def test_changed_imported_module_changes_input_hash(tmp_path):
+    write_script(tmp_path / "helpers.py", "VALUE = 1\n")
+    stage = pipeline.Stage(
+        "stage", write_script(tmp_path / "stage.py", "import helpers\n"),
+        inputs=[write_script(tmp_path / "data.json", "[]")]
+    )
+
+    before = pipeline.input_hash(stage)
+    write_script(tmp_path / "helpers.py", "VALUE = 2\n")
+
+    assert pipeline.input_hash(stage) != before
+
+
+def test_failed_reruns_blocked_stages(tmp_path):
+    fail = write_script(tmp_path / "fail.py", "import sys\nsys.exit(1)\n")
+    succeed = write_script(tmp_path / "succeed.py", "")
+    state_path = str(tmp_path / "state.json")
+
+    stages = [
+        pipeline.Stage("first", fail),
+        pipeline.Stage("second", succeed, after=["first"]),
+        pipeline.Stage("third", succeed, after=["second"]),
+        pipeline.Stage("other", succeed),
+    ]
+
+    outcomes = pipeline.run_pipeline(stages, state_path=state_path)
+    assert outcomes == {"first": "failed", "second": "blocked", "third": "blocked", "other": "succeeded"}
+
+    only = pipeline.failed_stages(pipeline.read_state(state_path))
+    assert sorted(only) == ["first", "second", "third"]
+
+    stages[0].script = succeed
+    outcomes = pipeline.run_pipeline(stages, only=only, state_path=state_path)
+    assert outcomes == {"first": "succeeded", "second": "succeeded", "third": "succeeded", "other": "skipped"}
+    assert pipeline.failed_stages(pipeline.read_state(state_path)) == []
+
+
+def test_cycle_is_rejected_before_running(tmp_path):
+    script = write_script(tmp_path / "succeed.py", "")
+    state_path = str(tmp_path / "state.json")
+
+    stages = [
+        pipeline.Stage("first", script),
+        pipeline.Stage("second", script, after=["first", "third"]),
+        pipeline.Stage("third", script, after=["second"]),
+    ]
+
+    with pytest.raises(ValueError, match=r"cycle: \['second', 'third'\]"):
+        pipeline.run_pipeline(stages, state_path=state_path)
+
+    with pytest.raises(ValueError, match="cycle"):
+        pipeline.run_pipeline([pipeline.Stage("self", script, after=["self"])], state_path=state_path)
+
+    assert pipeline.read_state(state_path) == {}
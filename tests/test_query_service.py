@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+
+import pytest
+import requests
+
+from conftest import make_record
+import query_service
+
+PREFIX = "https://www.gov.uk/api/organisations/"
+
+
+def link(i: int) -> dict:
+    return {"id": f"{PREFIX}org-{i}", "web_url": f"https://www.gov.uk/government/organisations/org-{i}"}
+
+
+def linked_records() -> list:
+
+    """
+    Return three organisations, org-1 the parent of org-2 and org-2 the parent of org-3
+    """
+
+    return [
+        make_record(1, title="Department for Testing", child_organisations=[link(2)]),
+        make_record(2, title="Testing Agency", parent_organisations=[link(1)], child_organisations=[link(3)]),
+        make_record(3, title="Office of Test Standards", parent_organisations=[link(2)]),
+    ]
+
+
+def write_records(path: str, records: list, mtime: float) -> None:
+    with open(path, "w") as f:
+        json.dump(records, f)
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def service(tmp_path):
+    path = str(tmp_path / "organisations.json")
+    write_records(path, linked_records(), 1_000_000)
+
+    server = query_service.make_server(path, port=0)
+    server.service.check_interval = 0
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    with requests.Session() as session:
+        yield path, lambda endpoint, **params: session.get(base_url + endpoint, params=params, timeout=10)
+
+    server.shutdown()
+    server.server_close()
+
+
+def identifiers(response) -> list:
+    return [record["analytics_identifier"] for record in response.json()]
+
+
+@pytest.mark.parametrize("field, value", [
+    ("analytics_identifier", "OT2"),
+    ("slug", "org-2"),
+    ("content_id", "00000000-0000-0000-0000-000000000002"),
+    ("title", "testing agency"),
+])
+def test_organisation(service, field, value):
+    _, get = service
+    response = get("/organisation", **{field: value})
+
+    assert response.status_code == 200
+    assert response.json() == [linked_records()[1]]
+
+
+def test_organisation_errors(service):
+    _, get = service
+
+    assert get("/organisation", slug="no-such-org").status_code == 404
+    assert get("/organisation").status_code == 400
+    assert get("/organisation", slug="org-1", analytics_identifier="OT1").status_code == 400
+
+
+def test_search(service):
+    _, get = service
+
+    assert identifiers(get("/search", q="test")) == ["OT2"]
+    assert identifiers(get("/search", q="")) == ["OT1", "OT3", "OT2"]
+    assert identifiers(get("/search", q="", limit=1)) == ["OT1"]
+    assert get("/search", q="test", limit="many").status_code == 400
+
+
+def test_children_and_parents(service):
+    _, get = service
+
+    assert identifiers(get("/children", slug="org-1")) == ["OT2"]
+    assert identifiers(get("/children", slug="org-1", transitive=1)) == ["OT2", "OT3"]
+    assert identifiers(get("/parents", slug="org-3")) == ["OT2"]
+    assert identifiers(get("/parents", slug="org-3", transitive="true")) == ["OT1", "OT2"]
+    assert get("/children", slug="no-such-org").status_code == 404
+
+
+def test_health_and_unknown_endpoint(service):
+    _, get = service
+
+    assert get("/health").json() == {"organisations": 3, "mtime": 1_000_000}
+    assert get("/no-such-endpoint").status_code == 404
+
+
+def test_bad_reload_keeps_serving_previous_version(service):
+    path, get = service
+
+    # A record with null details can't be indexed
+    write_records(path, linked_records() + [make_record(4, details=None)], 1_000_100)
+    assert get("/health").json() == {"organisations": 3, "mtime": 1_000_000}
+    assert get("/organisation", slug="org-1").status_code == 200
+
+    write_records(path, "not a list of records", 1_000_200)
+    assert get("/health").json()["organisations"] == 3
+
+    # Once the file is fixed, it's picked up
+    write_records(path, linked_records() + [make_record(4)], 1_000_300)
+    assert get("/health").json() == {"organisations": 4, "mtime": 1_000_300}
+    assert identifiers(get("/organisation", slug="org-4")) == ["OT4"]
@@ -0,0 +1,111 @@
+import pandas as pd
+
+import rules
+
+MINISTERIAL_DEPARTMENTS = [
+    "Department for Business, Energy & Industrial Strategy",
+    "Department for Digital, Culture, Media & Sport",
+    "Department for International Trade",
+    "Department for Levelling Up, Housing and Communities",
+    "Office of the Secretary of State for Scotland",
+    "Office of the Secretary of State for Wales",
+]
+
+EXCLUDED_FORMATS = [
+    "Civil service",
+    "Court",
+    "Devolved administration",
+    "Executive office",
+    "Ministerial department",
+    "Sub organisation",
+    "Tribunal",
+]
+
+CLOSED_STATUSES = ["changed_name", "left_gov", "merged", "no_longer_exists", "replaced", "split"]
+
+
+def loc_cleaning(df: pd.DataFrame) -> pd.DataFrame:
+
+    """
+    Clean a DataFrame with the .loc assignments explore_data.py used before rules.py
+    """
+
+    df = df.copy()
+
+    df.loc[df["title"].isin(MINISTERIAL_DEPARTMENTS), "format"] = "Ministerial department"
+    df.loc[df["title"].isin(["Office for National Statistics"]), "format"] = "Executive office"
+
+    df["exclude"] = False
+    df.loc[df["format"].isin(EXCLUDED_FORMATS), ["exclude", "exclude_reason"]] = [True, "format"]
+
+    df.loc[
+        (~df["govuk_status"].isin(["closed", "live"])) & (df["govuk_closed_status"].isin(CLOSED_STATUSES)),
+        "govuk_status"
+    ] = "closed"
+    df.loc[
+        (~df["govuk_status"].isin(["closed", "live"])) & (df["govuk_closed_status"] == "devolved"),
+        "govuk_status"
+    ] = "devolved"
+    df.loc[df["govuk_status"] == "exempt", "govuk_status"] = "live"
+
+    df.loc[df["govuk_status"] == "live", "govuk_closed_status"] = pd.NA
+
+    df.loc[
+        df["govuk_status"].isin(["closed", "devolved", "joining"]), ["exclude", "exclude_reason"]
+    ] = [True, "govuk_status"]
+
+    return df
+
+
+def frame() -> pd.DataFrame:
+    rows = [
+        # title, format, govuk_status, govuk_closed_status
+        ("Department for International Trade", "Other", "closed", "merged"),
+        ("Office for National Statistics", "Non-ministerial department", "live", None),
+        ("Transitioning and merged", "Other", "transitioning", "merged"),
+        ("Transitioning and devolved", "Executive agency", "transitioning", "devolved"),
+        ("Transitioning only", "Other", "transitioning", None),
+        ("Exempt and devolved", "Other", "exempt", "devolved"),
+        ("Exempt", "Tribunal", "exempt", None),
+        ("Live with a closed status", "Other", "live", "changed_name"),
+        ("Joining", "Court", "joining", None),
+        ("Closed already", "Other", "closed", "no_longer_exists"),
+        ("Ministerial and devolved", "Ministerial department", "transitioning", "devolved"),
+        ("Live", "Other", "live", None),
+    ]
+
+    return pd.DataFrame(rows, columns=["title", "format", "govuk_status", "govuk_closed_status"])
+
+
+def test_apply_rules_matches_loc_cleaning():
+    expected = loc_cleaning(frame())
+    cleaned = rules.apply_rules(frame(), record=False)
+
+    pd.testing.assert_frame_equal(
+        cleaned.astype(object).where(cleaned.notna(), None),
+        expected[cleaned.columns].astype(object).where(expected[cleaned.columns].notna(), None),
+    )
+
+
+def test_status_exclusion_takes_priority_over_format():
+    cleaned = rules.apply_rules(frame()).set_index("title")
+
+    # Excluded for both format and status: status wins, as it did in explore_data.py
+    assert cleaned.loc["Department for International Trade", "exclude_reason"] == "govuk_status"
+    assert cleaned.loc["Ministerial and devolved", "exclude_rule"] == "exclude_govuk_status"
+    assert cleaned.loc["Office for National Statistics", "exclude_reason"] == "format"
+    assert not cleaned.loc["Transitioning only", "exclude"]
+
+
+def test_status_rules_apply_before_closed_status_rules():
+    cleaned = rules.apply_rules(frame()).set_index("title")
+
+    # Exempt becomes live, so its closed status is then blanked; exempt with a closed status
+    # of devolved is made devolved first, so keeps it
+    assert cleaned.loc["Exempt", "govuk_status"] == "live"
+    assert cleaned.loc["Exempt", "govuk_closed_status_rule"] == "closed_status_live"
+    assert cleaned.loc["Exempt and devolved", "govuk_status"] == "devolved"
+    assert cleaned.loc["Exempt and devolved", "govuk_closed_status"] == "devolved"
+    assert pd.isna(cleaned.loc["Live with a closed status", "govuk_closed_status"])
+    assert cleaned.loc["Transitioning and merged", "govuk_status_rule"] == "status_closed"
+    assert pd.isna(cleaned.loc["Live", "govuk_status_rule"])
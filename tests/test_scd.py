@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from scd import SCD2History
+from snapshot_store import SnapshotStore
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "snapshots")
+
+# 20240102 renames OT2, drops OT3 and adds OT4. 20240103 brings OT3 back unchanged
+DATES = ["20240101", "20240102", "20240103"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots.db"))
+    yield store
+    store.close()
+
+
+def ingest(store: SnapshotStore, date: str) -> None:
+    store.ingest_file(os.path.join(FIXTURE_DIR, f"{date}.json"), date)
+
+
+def intervals(history: SCD2History) -> list:
+    df = history.versions()
+    df["end_date"] = df["end_date"].fillna("")
+
+    return list(zip(df["analytics_identifier"], df["title"], df["start_date"], df["end_date"]))
+
+
+def test_versions_open_close_and_reopen(store):
+    history = SCD2History(store)
+    counts = []
+
+    # One snapshot at a time, each update processing only the new one
+    for date in DATES:
+        ingest(store, date)
+        counts.append(history.update())
+        assert history.processed_date() == date
+
+    assert counts == [
+        {"opened": 3, "closed": 0},
+        {"opened": 2, "closed": 2},
+        {"opened": 1, "closed": 0},
+    ]
+
+    assert intervals(history) == [
+        ("OT1", "Organisation 1", "20240101", ""),
+        ("OT2", "Organisation 2", "20240101", "20240102"),
+        ("OT3", "Organisation 3", "20240101", "20240102"),
+        ("OT2", "Organisation 2 (renamed)", "20240102", ""),
+        ("OT4", "Organisation 4", "20240102", ""),
+        ("OT3", "Organisation 3", "20240103", ""),
+    ]
+
+    # Nothing left to process
+    assert history.update() == {"opened": 0, "closed": 0}
+
+    as_at = history.versions(as_at="20240102")
+    assert sorted(zip(as_at["analytics_identifier"], as_at["title"])) == [
+        ("OT1", "Organisation 1"), ("OT2", "Organisation 2 (renamed)"), ("OT4", "Organisation 4")
+    ]
+
+    validity = history.validity().set_index("analytics_identifier")
+    assert validity.loc["OT3", "start_date"] == "20240101"
+    assert validity["end_date"].isna().all()
+
+
+def test_update_processes_several_snapshots_at_once(store, tmp_path):
+    for date in DATES:
+        ingest(store, date)
+
+    history = SCD2History(store)
+    assert history.update() == {"opened": 6, "closed": 2}
+
+    one_at_a_time = SnapshotStore(str(tmp_path / "one_at_a_time.db"))
+    one_at_a_time_history = SCD2History(one_at_a_time)
+    for date in DATES:
+        ingest(one_at_a_time, date)
+        one_at_a_time_history.update()
+
+    assert intervals(history) == intervals(one_at_a_time_history)
+    one_at_a_time.close()
+
+
+def test_untracked_changes_and_drops(store):
+    for date in DATES:
+        ingest(store, date)
+    history = SCD2History(store)
+    history.update()
+
+    # A new updated_at alone doesn't start a version, but dropping an organisation closes it
+    records = [
+        {**record, "updated_at": "2024-01-04T00:00:00.000+00:00"}
+        for record in store.records("20240103")
+        if record["analytics_identifier"] != "OT4"
+    ]
+    store.ingest(records, "20240104")
+
+    assert history.update() == {"opened": 0, "closed": 1}
+
+    validity = history.validity().set_index("analytics_identifier")
+    assert validity.loc["OT4", "end_date"] == "20240104"
+    assert validity.drop(index="OT4")["end_date"].isna().all()
@@ -0,0 +1,85 @@
+import copy
+import json
+
+import snapshot_diff
+from conftest import load_api_pages
+
+RECORDS = [record for page in load_api_pages() for record in page["results"]]
+
+
+def new_snapshot() -> list:
+
+    """
+    Return a copy of RECORDS with the first record removed, one added, and
+    records renamed, reformatted, reopened and re-parented
+    """
+
+    records = copy.deepcopy(RECORDS[1:])
+
+    records[0]["title"] = "Renamed | with a pipe"
+    records[1]["format"] = "Executive agency"
+    records[2]["details"]["govuk_status"] = "live"
+    records[2]["details"]["govuk_closed_status"] = None
+    records[3]["parent_organisations"] = []
+    records[4]["updated_at"] = "2099-01-01T00:00:00Z"
+
+    added = copy.deepcopy(RECORDS[0])
+    added["analytics_identifier"] = "OT9999"
+    added["details"]["content_id"] = "00000000-0000-0000-0000-000000009999"
+
+    return records + [added]
+
+
+def identifiers(changes: dict) -> dict:
+    return {change_type: [item["analytics_identifier"] for item in items] for change_type, items in changes.items()}
+
+
+def test_diff_classifies_changes():
+    new_records = new_snapshot()
+    changes = snapshot_diff.diff_snapshots(RECORDS, new_records)
+
+    assert identifiers(changes) == {
+        "added": ["OT9999"],
+        "removed": [RECORDS[0]["analytics_identifier"]],
+        "renamed": [new_records[0]["analytics_identifier"]],
+        "reformatted": [new_records[1]["analytics_identifier"]],
+        "status_changed": [new_records[2]["analytics_identifier"]],
+        "reparented": [new_records[3]["analytics_identifier"]],
+    }
+    assert changes["renamed"][0]["changes"] == {"title": {"old": RECORDS[1]["title"], "new": "Renamed | with a pipe"}}
+    assert changes["status_changed"][0]["changes"] == {
+        "govuk_status": {"old": "closed", "new": "live"},
+        "govuk_closed_status": {"old": "no_longer_exists", "new": None},
+    }
+
+    # A change to updated_at alone isn't reported
+    assert new_records[4]["analytics_identifier"] not in json.dumps(changes)
+
+
+def test_streamed_diff_matches_diff_snapshots():
+    new_records = new_snapshot()
+
+    diff = snapshot_diff.SnapshotDiff([], key="content_id")
+    for page in load_api_pages():
+        diff.add_old(page["results"])
+
+    pages = [(1, new_records[:7]), (2, new_records[7:])]
+    assert list(diff.track(pages)) == pages
+
+    assert diff.changes() == snapshot_diff.diff_snapshots(RECORDS, new_records, key="content_id")
+
+
+def test_markdown_escapes_pipes():
+    report = snapshot_diff.to_markdown(snapshot_diff.diff_snapshots(RECORDS, new_snapshot()))
+    lines = report.splitlines()
+
+    renamed = [line for line in lines if "with a pipe" in line]
+    assert renamed == [
+        f"| Renamed \\| with a pipe | {RECORDS[1]['analytics_identifier']} | title "
+        f"| {RECORDS[1]['title']} | Renamed \\| with a pipe |"
+    ]
+
+    # Every table row has the same number of unescaped pipes as its header
+    for line in lines:
+        if line.startswith("|"):
+            assert line.replace("\\|", "").count("|") in (3, 6)
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+import binary_snapshot
+import normalise
+from compact import LinkLists, compact_frame, take
+from conftest import load_api_pages
+from json_operations import LIST_COLUMNS, link_slug
+
+RECORDS = [record for page in load_api_pages() for record in page["results"]]
+
+
+# %%
+# Binary snapshots
+
+
+def test_binary_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "organisations.bin")
+    assert binary_snapshot.write_snapshot(RECORDS, path) == len(RECORDS)
+
+    with binary_snapshot.BinarySnapshot(path) as snapshot:
+        assert len(snapshot) == len(RECORDS)
+        assert list(snapshot) == RECORDS
+
+        for position, record in enumerate(RECORDS):
+            assert snapshot.find(record["analytics_identifier"]) == position
+            assert snapshot.get(record["analytics_identifier"]) == record
+
+        assert snapshot.get("XX999") is None
+        assert "XX999" not in snapshot
+
+
+def test_empty_binary_snapshot(tmp_path):
+    path = str(tmp_path / "organisations.bin")
+    assert binary_snapshot.write_snapshot([], path) == 0
+
+    with binary_snapshot.BinarySnapshot(path) as snapshot:
+        assert len(snapshot) == 0
+        assert list(snapshot) == []
+        assert snapshot.get(RECORDS[0]["analytics_identifier"]) is None
+
+
+def test_binary_snapshot_tolerates_missing_and_unknown_keys(tmp_path, capsys):
+    record = {key: value for key, value in RECORDS[0].items() if key not in ("format", "child_organisations")}
+    record["new_key"] = "value"
+    path = str(tmp_path / "organisations.bin")
+
+    binary_snapshot.write_snapshot([record], path)
+    assert "new_key" in capsys.readouterr().out
+
+    with binary_snapshot.BinarySnapshot(path) as snapshot:
+        read_back = snapshot.record(0)
+
+    assert read_back["format"] is None
+    assert read_back["child_organisations"] == []
+    assert "new_key" not in read_back
+
+
+# %%
+# Compact frames
+
+
+@pytest.mark.parametrize("col", LIST_COLUMNS)
+def test_link_lists_round_trip(col):
+    lists = [record[col] for record in RECORDS]
+    link_lists = LinkLists.from_lists(lists)
+
+    assert len(link_lists) == len(RECORDS)
+    assert [link_lists[i] for i in range(len(link_lists))] == [[link_slug(link) for link in links] for links in lists]
+
+    rows = np.array([3, 0, 3], dtype=np.int32)
+    taken = link_lists.take(rows)
+    assert [taken[i] for i in range(len(taken))] == [link_lists[row] for row in rows]
+
+
+def test_empty_link_lists():
+    link_lists = LinkLists.from_lists([])
+
+    assert len(link_lists) == 0
+    assert len(link_lists.take(np.array([], dtype=np.int32))) == 0
+    assert link_lists.to_frame().empty
+
+
+def test_compact_frame_round_trip():
+    df = normalise.normalise_records(RECORDS)
+    df_compact, links = compact_frame(df)
+
+    assert sorted(links) == sorted(LIST_COLUMNS)
+    for col in df_compact.columns:
+        assert list(df_compact[col].astype(object)) == list(df[col].astype(object)), col
+    for col in LIST_COLUMNS:
+        assert [links[col][i] for i in range(len(df))] == [[link_slug(link) for link in value] for value in df[col]]
+
+    rows = np.array([1, 1, 0])
+    df_taken, links_taken = take(df_compact, links, rows)
+    assert list(df_taken["analytics_identifier"]) == list(df["analytics_identifier"].iloc[rows])
+    assert links_taken["parent_organisations"][0] == links["parent_organisations"][1]
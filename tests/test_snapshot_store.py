@@ -0,0 +1,114 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import normalise
+from snapshot_store import SnapshotStore
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "snapshots")
+
+# 20240102 renames OT2, drops OT3, adds OT4 and repeats OT1. 20240103 brings OT3 back
+# unchanged from 20240101
+DATES = ["20240101", "20240102", "20240103"]
+
+
+def fixture_path(date: str) -> str:
+    return os.path.join(FIXTURE_DIR, f"{date}.json")
+
+
+def fixture_records(date: str) -> list:
+
+    """
+    Return a fixture's records, keeping the first of any repeated organisation,
+    as the store does
+    """
+
+    with open(fixture_path(date)) as f:
+        records = json.load(f)
+
+    return list({record["analytics_identifier"]: record for record in reversed(records)}.values())[::-1]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def filled_store(store):
+    for date in DATES:
+        store.ingest_file(fixture_path(date), date)
+    return store
+
+
+def test_unchanged_records_extend_their_version(store):
+    counts = [store.ingest_file(fixture_path(date), date) for date in DATES]
+
+    assert counts == [
+        {"unchanged": 0, "changed": 3},
+        {"unchanged": 1, "changed": 2},
+        {"unchanged": 3, "changed": 1},
+    ]
+
+    versions = store.con.execute(
+        "SELECT analytics_identifier, first_date, last_date FROM versions ORDER BY analytics_identifier, first_date"
+    ).fetchall()
+
+    # OT3 returning counts as a new version, as it was missing in between
+    assert versions == [
+        ("OT1", "20240101", "20240103"),
+        ("OT2", "20240101", "20240101"),
+        ("OT2", "20240102", "20240103"),
+        ("OT3", "20240101", "20240101"),
+        ("OT3", "20240103", "20240103"),
+        ("OT4", "20240102", "20240103"),
+    ]
+
+
+@pytest.mark.parametrize("date", ["20240102", "20231231"])
+def test_snapshots_must_be_ingested_in_date_order(filled_store, date):
+    filled_store.ingest_file(fixture_path("20240101"), "20240104")
+
+    with pytest.raises(ValueError, match="not later than the latest snapshot"):
+        filled_store.ingest_file(fixture_path("20240101"), date)
+
+    assert filled_store.dates() == DATES + ["20240104"]
+
+
+def test_records_reconstructs_each_snapshot(filled_store):
+    assert filled_store.dates() == DATES
+
+    for date in DATES:
+        key = lambda record: record["analytics_identifier"]  # noqa: E731
+        assert sorted(filled_store.records(date), key=key) == sorted(fixture_records(date), key=key)
+
+
+def test_load_history_matches_normalising_each_snapshot(filled_store):
+    expected = pd.concat(
+        [normalise.normalise_records(fixture_records(date)).assign(date=date) for date in DATES],
+        ignore_index=True
+    )
+    expected = expected[["date"] + [col for col in expected.columns if col != "date"]]
+
+    history = filled_store.load_history()
+
+    # Dates must come out in order, though records within a date needn't
+    assert list(history["date"]) == sorted(history["date"])
+
+    sort_by = ["date", "analytics_identifier"]
+    pd.testing.assert_frame_equal(
+        history.sort_values(sort_by, ignore_index=True),
+        expected.sort_values(sort_by, ignore_index=True),
+    )
+
+
+def test_compact_history_has_the_same_rows(filled_store):
+    history = filled_store.load_history()
+    compact, _ = filled_store.load_history(compact=True)
+
+    assert list(compact["date"].astype(str)) == list(history["date"])
+    assert list(compact["analytics_identifier"].astype(str)) == list(history["analytics_identifier"])
@@ -0,0 +1,99 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+import sql_operations
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    yield engine
+    engine.dispose()
+
+
+def read(engine, name: str, key: str) -> pd.DataFrame:
+    return pd.read_sql_query(f"SELECT * FROM {name} ORDER BY {key}", engine)
+
+
+def test_upsert_table_inserts_updates_and_closes(engine):
+    df_first = pd.DataFrame({
+        "slug": ["unchanged", "renamed", "closed", "already-closed"],
+        "id": [1, 2, 3, 4],
+        "title": ["Unchanged", "Old name", "Closed", "Already closed"],
+        "end_date": [None, None, None, "2023-12-31"],
+    })
+    counts = sql_operations.upsert_table(df_first, engine, "orgs", key="slug")
+    assert counts == {"inserted": 4, "updated": 0, "closed": 0}
+
+    # IDs are preserved, and end_date only set on rows that disappear
+    df_second = pd.DataFrame({
+        "slug": ["unchanged", "renamed", "new"],
+        "id": [10, 20, 50],
+        "title": ["Unchanged", "New name", "New"],
+        "end_date": [None, None, None],
+    })
+    counts = sql_operations.upsert_table(
+        df_second, engine, "orgs", key="slug", preserve=("id", "end_date"), close_col="end_date",
+        close_value="2024-01-02"
+    )
+    assert counts == {"inserted": 1, "updated": 1, "closed": 1}
+
+    pd.testing.assert_frame_equal(read(engine, "orgs", "slug"), pd.DataFrame({
+        "slug": ["already-closed", "closed", "new", "renamed", "unchanged"],
+        "id": [4, 3, 50, 2, 1],
+        "title": ["Already closed", "Closed", "New", "New name", "Unchanged"],
+        "end_date": ["2023-12-31", "2024-01-02", None, None, None],
+    }))
+
+    # Staging tables are dropped, and applying the same rows again changes nothing
+    assert sorted(pd.read_sql_query("SELECT name FROM sqlite_master WHERE type = 'table'", engine)["name"]) == ["orgs"]
+    counts = sql_operations.upsert_table(
+        df_second, engine, "orgs", key="slug", preserve=("id", "end_date"), close_col="end_date",
+        close_value="2024-01-03"
+    )
+    assert counts == {"inserted": 0, "updated": 0, "closed": 0}
+
+
+def test_upsert_table_treats_null_to_value_as_a_change(engine):
+    df = pd.DataFrame({"slug": ["a", "b"], "abbreviation": [None, "B"]})
+    sql_operations.upsert_table(df, engine, "orgs", key="slug")
+
+    counts = sql_operations.upsert_table(
+        pd.DataFrame({"slug": ["a", "b"], "abbreviation": ["A", None]}), engine, "orgs", key="slug"
+    )
+
+    assert counts == {"inserted": 0, "updated": 2, "closed": 0}
+    assert list(read(engine, "orgs", "slug")["abbreviation"].isna()) == [False, True]
+
+
+def test_replace_rows_replaces_only_the_given_keys(engine):
+    df = pd.DataFrame({
+        "ancestor": ["a", "a", "b", "c"],
+        "descendant": ["a", "b", "b", "c"],
+    })
+    sql_operations.bulk_to_sql(df, engine, "closure")
+
+    counts = sql_operations.replace_rows(
+        pd.DataFrame({"ancestor": ["a", "b", "d"], "descendant": ["a", "d", "d"]}),
+        engine, "closure", key="ancestor", keys=["a", "b", "d"]
+    )
+
+    assert counts == {"deleted": 3, "inserted": 3}
+    pd.testing.assert_frame_equal(read(engine, "closure", "ancestor, descendant"), pd.DataFrame({
+        "ancestor": ["a", "b", "c", "d"],
+        "descendant": ["a", "d", "c", "d"],
+    }))
+
+
+def test_writes_join_the_callers_transaction(engine):
+    sql_operations.bulk_to_sql(pd.DataFrame({"slug": ["a"], "title": ["A"]}), engine, "orgs")
+
+    with pytest.raises(RuntimeError):
+        with engine.begin() as conn:
+            sql_operations.upsert_table(
+                pd.DataFrame({"slug": ["a", "b"], "title": ["Renamed", "B"]}), conn, "orgs", key="slug"
+            )
+            raise RuntimeError
+
+    assert list(read(engine, "orgs", "slug")["title"]) == ["A"]
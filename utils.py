@@ -1,10 +1,54 @@
 # %%
+import uuid
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
 import pandas as pd
 
+import metrics
+
+# %%
+# Functions to be used for deriving deterministic UUIDs
+
+# Namespace for all UUIDs derived from GOV.UK organisations data
+ORGS_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://www.gov.uk/api/organisations")
+
+
+def org_uuid(govuk_identifier: str) -> uuid.UUID:
+
+    """
+    Derive an organisation's UUID from its GOV.UK analytics identifier, so that
+    the same organisation always gets the same UUID
+    E.g., 'D18' -> UUID('...') on every run
+
+    Parameters
+        - govuk_identifier: The organisation's analytics_identifier
+
+    """
+
+    return uuid.uuid5(ORGS_NAMESPACE, govuk_identifier)
+
+
+def sponsorship_uuid(parent_org_id: uuid.UUID, child_org_id: uuid.UUID) -> uuid.UUID:
+
+    """
+    Derive the UUID of a parent/child relationship from the UUIDs of the two
+    organisations
+
+    Parameters
+        - parent_org_id: The UUID of the parent organisation
+        - child_org_id: The UUID of the child organisation
+
+    """
+
+    return uuid.uuid5(parent_org_id, str(child_org_id))
+
 # %%
-# Functions to be used for editing parent/child org columns and matching to UUIDs from df_sql
+# Functions to be used for editing parent/child org columns and matching to UUIDs
 
 
+@metrics.tracked(rows_in="df")
 def flatten_list_of_dicts(df: pd.DataFrame, col: str, key: str) -> pd.DataFrame:
 
     """
@@ -24,6 +68,7 @@ def flatten_list_of_dicts(df: pd.DataFrame, col: str, key: str) -> pd.DataFrame:
     )
 
 
+@metrics.tracked(rows_in="df")
 def remove_prefixes(df: pd.DataFrame, col: str, prefix: str) -> pd.DataFrame:
 
     """
@@ -42,6 +87,7 @@ def remove_prefixes(df: pd.DataFrame, col: str, prefix: str) -> pd.DataFrame:
     )
 
 
+@metrics.tracked(rows_in="df2")
 def match_and_replace(
         df1: pd.DataFrame,
         df2: pd.DataFrame,
@@ -67,3 +113,93 @@ def match_and_replace(
     df2[edit_col] = df2[edit_col].apply(
         lambda lst: [name_to_id.get(name) for name in lst]
     )
+
+
+# %%
+# Vectorised equivalents of the functions above, working on exploded columns
+# NB: These hold one list item per row rather than one list per row, so each step is
+# a single pass over a flat column rather than a Python loop over every row's list.
+# Chaining them gives the same rows as the functions above followed by
+# DataFrame.explode(), less the rows for empty lists
+
+
+@metrics.tracked(rows_in="df")
+def explode_list_of_dicts(df: pd.DataFrame, col: str, key: str) -> pd.DataFrame:
+
+    """
+    Explode a column of a DataFrame which is a list of dictionaries with the same key
+    into one row per dictionary, holding that dictionary's value for key
+    E.g., a row with [{key:A}, {key:B}] becomes two rows, with A and B
+    Rows with empty lists are dropped. The index is repeated, as with DataFrame.explode()
+
+    Parameters
+        - df: the DataFrame in question
+        - col: columns of the dataframe containing lists of dicts
+        - key: The key shared across all dicts in the column
+
+    """
+
+    lengths = np.fromiter(map(len, df[col]), dtype=np.int64, count=len(df))
+
+    df_exploded = df.iloc[np.repeat(np.arange(len(df)), lengths)].copy()
+    df_exploded[col] = list(map(itemgetter(key), chain.from_iterable(df[col])))
+
+    return df_exploded
+
+
+@metrics.tracked(rows_in="df")
+def remove_prefix_exploded(df: pd.DataFrame, col: str, prefix: str) -> pd.DataFrame:
+
+    """
+    Get rid of a substring from a column of strings, dropping rows that don't contain it
+    E.g., https://www.gov.uk/api/organisations/ministy_of_justice -> ministry_of_justice
+
+    Parameters:
+        - df: Dataframe in question, e.g. as returned by explode_list_of_dicts()
+        - col: Column of df comprising strings
+        - prefix: String prefix/substring to be removed
+
+    """
+
+    df = df[df[col].str.contains(prefix, regex=False)].copy()
+    df[col] = df[col].str.replace(prefix, '', regex=False)
+
+    return df
+
+
+@metrics.tracked(rows_in="df2")
+def match_and_replace_exploded(
+        df1: pd.DataFrame,
+        df2: pd.DataFrame,
+        edit_col: str,
+        key_col: str,
+        val_col: str
+        ) -> pd.DataFrame:
+    """
+    For the entries in df2[edit_col], find the matching entry in df1[key_col],
+    find the entry in val_col in that row, then replace the original entry in df2[edit_col]
+    with the matched entry from df1[val_col]
+    Entries with no match are replaced with None. Where a key appears more than once in
+    df1, the last match wins
+
+    Parameters:
+        - df1: The Dataframe containing info to copy
+        - df2: The DataFrame to be edited using info from df1, e.g. as returned by explode_list_of_dicts()
+        - edit_col: The column in df2 to be replaced
+        - key_col: The column in df1 matching edit_col
+        - val_col: The column in df1 containing the info to copy
+
+    """
+
+    keys = pd.Index(df1[key_col])
+    last = ~keys.duplicated(keep='last')
+
+    positions = keys[last].get_indexer(df2[edit_col])
+
+    # Position -1 (no match) picks up the trailing None
+    values = np.append(df1[val_col].to_numpy(dtype=object)[last], None)
+
+    df2 = df2.copy()
+    df2[edit_col] = values[positions]
+
+    return df2